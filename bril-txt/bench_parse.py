@@ -0,0 +1,80 @@
+"""Benchmark the `bril2json` parser.
+
+Compares the old way of parsing (build an Earley parser for every program)
+with the shared LALR parser of `briltxt.parse_bril` and the hand-written
+`rd` backend, and the time to get the LALR parser with and without Lark's
+table cache. Parse times are given per KB of Bril text, over
+`benchmarks/**/*.bril` unless files are given:
+
+    python bench_parse.py [FILE.bril ...]
+"""
+
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+import lark
+
+import briltxt
+
+REPEAT = 3
+
+
+def best_time(run, repeat=REPEAT):
+    """Run `run()` `repeat` times and return the best time and the result."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def parse_earley(txt):
+    """Parse like `parse_bril` did before the shared LALR parser."""
+    parser = lark.Lark(briltxt.GRAMMAR, maybe_placeholders=True)
+    data = briltxt.JSONTransformer().transform(parser.parse(txt))
+    return json.dumps(data, indent=2, sort_keys=True)
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        paths = sorted(glob.glob(os.path.join(root, 'benchmarks', '**',
+                                              '*.bril'), recursive=True))
+    texts = [open(path).read() for path in paths]
+    kb = sum(len(txt.encode()) for txt in texts) / 1024
+    print('{} files, {:.1f} KB'.format(len(texts), kb))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'bril.lark')
+        build, _ = best_time(lambda: lark.Lark(
+            briltxt.GRAMMAR, parser='lalr', maybe_placeholders=True))
+        # the first run writes the cache, the best one reads it
+        load, _ = best_time(lambda: lark.Lark(
+            briltxt.GRAMMAR, parser='lalr', maybe_placeholders=True,
+            cache=cache))
+    print('lalr tables: {:.1f} ms built, {:.1f} ms from cache'.format(
+        build * 1000, load * 1000))
+
+    earley, old = best_time(lambda: [parse_earley(txt) for txt in texts])
+    briltxt.get_parser()
+    lalr, new = best_time(lambda: [briltxt.parse_bril(txt) for txt in texts])
+    rd, rd_new = best_time(lambda: [briltxt.parse_bril(txt, backend='rd')
+                                    for txt in texts])
+    for path, old_json, new_json, rd_json in zip(paths, old, new, rd_new):
+        assert old_json == new_json == rd_json, path
+    print('earley: {:8.2f} ms/KB'.format(earley * 1000 / kb))
+    print('lalr:   {:8.2f} ms/KB ({:.1f}x)'.format(lalr * 1000 / kb,
+                                                   earley / lalr))
+    print('rd:     {:8.2f} ms/KB ({:.1f}x)'.format(rd * 1000 / kb,
+                                                   earley / rd))
+
+
+if __name__ == '__main__':
+    main()
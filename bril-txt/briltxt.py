@@ -7,7 +7,11 @@ pretty-prints it in the text format, and `bril2json`, which parses the
 format and emits the ordinary JSON representation.
 """
 
-import lark
+import array
+import itertools
+import os
+import re
+import struct
 import sys
 import json
 
@@ -22,15 +26,15 @@ start: (struct | func)*
 struct: STRUCT IDENT "=" "{" mbr* "}"
 mbr: IDENT ":" type ";"
 
-func: FUNC ["(" arg_list? ")"] [tyann] "{" instr* "}"
+func: FUNC ["(" arg_list ")"] [tyann] "{" instr* "}"
 arg_list: | arg ("," arg)*
 arg: IDENT ":" type
 ?instr: const | vop | eop | label
 
-const.4: IDENT [tyann] "=" "const" lit ";"
-vop.3: IDENT [tyann] "=" op ";"
-eop.2: op ";"
-label.1: LABEL ":"
+const: IDENT [tyann] "=" "const" lit ";"
+vop: IDENT [tyann] "=" op ";"
+eop: op ";"
+label: LABEL ":"
 
 op: IDENT (FUNC | LABEL | IDENT)*
 
@@ -80,7 +84,15 @@ def _pos(token):
     return {'row': token.line, 'col': token.column}
 
 
-class JSONTransformer(lark.Transformer):
+class JSONRules:
+    """Turn the rules of `GRAMMAR` into Bril JSON.
+
+    It is a plain class so that importing this module does not import Lark;
+    `get_parser` runs it inline on the LALR parser, which only looks up the
+    methods by rule name. `JSONTransformer` is the same rules as a
+    `lark.Transformer`, for turning a whole parse tree into JSON.
+    """
+
     def __init__(self, include_pos=False):
         super().__init__()
         self.include_pos = include_pos
@@ -230,19 +242,331 @@ class JSONTransformer(lark.Transformer):
         return value
 
 
-def parse_bril(txt, include_pos=False):
+def __getattr__(name):
+    """Build `JSONTransformer` the first time it is looked up."""
+    if name != 'JSONTransformer':
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name))
+    import lark
+
+    class JSONTransformer(JSONRules, lark.Transformer):
+        """`JSONRules` as a `lark.Transformer`: call `transform(tree)` on
+        a Lark parse tree of `GRAMMAR` to get the Bril JSON data.
+        """
+
+    JSONTransformer.__qualname__ = 'JSONTransformer'
+    JSONTransformer.__module__ = __name__
+    globals()['JSONTransformer'] = JSONTransformer
+    return JSONTransformer
+
+
+# Hand-written parser. It accepts the same language as GRAMMAR and builds
+# the same JSON as JSONRules, but skips Lark's per-token objects: one
+# compiled regex splits the text into tokens and a recursive-descent parser
+# consumes them as they come.
+
+_IDENT = r'[_%A-Za-z][_%.A-Za-z0-9]*'
+_EXP = r'[eE][+-]?[0-9]+'
+TOKEN_RE = re.compile('|'.join([
+    r'(?P<ws>(?:[ \t\f\r\n]|#.*)+)',
+    r'(?P<float>[+-]?(?:[0-9]+\.[0-9]*(?:{0})?|\.[0-9]+(?:{0})?|[0-9]+{0}))'
+    .format(_EXP),
+    r'(?P<int>[+-]?[0-9]+)',
+    r"(?P<char>'.'|'\\[0abtnvfr]')",
+    r'(?P<func>@{})'.format(_IDENT),
+    r'(?P<label>\.{})'.format(_IDENT),
+    r'(?P<ident>{})'.format(_IDENT),
+    r'(?P<punct>[=;:{}()<>,])',
+    r'(?P<error>[\s\S])',
+]))
+
+
+class ParseError(Exception):
+    pass
+
+
+def tokenize(txt):
+    """Generate the tokens of a Bril program.
+
+    Tokens are `(kind, text, line, column)` tuples, where the kind of a
+    punctuation token is its text. Whitespace and comments are skipped, and
+    a final `end` token follows the last one. Lines and columns count from 1
+    like Lark's. Keywords are `ident` tokens: whether `const` or `true` is a
+    keyword depends on where it appears, which is up to the parser.
+    """
+    line = 1
+    line_start = 0
+    for match in TOKEN_RE.finditer(txt):
+        kind = match.lastgroup
+        text = match.group()
+        if kind == 'ws':
+            newlines = text.count('\n')
+            if newlines:
+                line += newlines
+                line_start = match.start() + text.rindex('\n') + 1
+            continue
+        if kind == 'punct':
+            kind = text
+        yield kind, text, line, match.start() - line_start + 1
+    yield 'end', '', line, len(txt) - line_start + 1
+
+
+class BrilParser:
+    """A recursive-descent parser for the Bril text format.
+
+    There is one method per rule of GRAMMAR. `parse` returns the same JSON
+    data as a Lark parse with `JSONRules`, and raises `ParseError`
+    on text the grammar does not accept.
+    """
+
+    def __init__(self, txt, include_pos=False):
+        self.include_pos = include_pos
+        self.tokens = tokenize(txt)
+        self.tok = next(self.tokens)
+
+    def next(self):
+        """Consume the current token and return it."""
+        tok = self.tok
+        self.tok = next(self.tokens)
+        return tok
+
+    def expect(self, kind):
+        if self.tok[0] != kind:
+            self.error()
+        return self.next()
+
+    def error(self):
+        kind, text, line, column = self.tok
+        raise ParseError('{}:{}: unexpected {}'.format(
+            line, column, repr(text) if text else 'end of input'))
+
+    def pos(self, tok):
+        return {'row': tok[2], 'col': tok[3]}
+
+    def parse(self):
+        structs = []
+        funcs = []
+        while self.tok[0] != 'end':
+            if self.tok[0] == 'func':
+                funcs.append(self.func())
+            elif self.tok[:2] == ('ident', 'struct'):
+                structs.append(self.struct())
+            else:
+                self.error()
+        if structs:
+            return {
+                'structs': structs,
+                'functions': funcs,
+            }
+        else:
+            return {
+                'functions': funcs,
+            }
+
+    def struct(self):
+        self.next()
+        name = self.expect('ident')[1]
+        self.expect('=')
+        self.expect('{')
+        mbrs = []
+        while self.tok[0] != '}':
+            mbr_name = self.expect('ident')[1]
+            self.expect(':')
+            mbrs.append({
+                'name': mbr_name,
+                'type': self.type(),
+            })
+            self.expect(';')
+        self.next()
+        return {
+            'name': name,
+            'mbrs': mbrs,
+        }
+
+    def func(self):
+        name = self.next()
+        args = []
+        if self.tok[0] == '(':
+            self.next()
+            if self.tok[0] != ')':
+                args.append(self.arg())
+                while self.tok[0] == ',':
+                    self.next()
+                    args.append(self.arg())
+            self.expect(')')
+        typ = None
+        if self.tok[0] == ':':
+            self.next()
+            typ = self.type()
+        self.expect('{')
+        instrs = []
+        while self.tok[0] != '}':
+            instrs.append(self.instr())
+        self.next()
+        func = {
+            'name': name[1][1:],  # Strip `@`.
+            'instrs': instrs,
+        }
+        if args:
+            func['args'] = args
+        if typ:
+            func['type'] = typ
+        if self.include_pos:
+            func['pos'] = self.pos(name)
+        return func
+
+    def arg(self):
+        name = self.expect('ident')[1]
+        self.expect(':')
+        return {
+            'name': name,
+            'type': self.type(),
+        }
+
+    def instr(self):
+        if self.tok[0] == 'label':
+            name = self.next()
+            self.expect(':')
+            out = {
+                'label': name[1][1:]  # Strip `.`.
+            }
+            if self.include_pos:
+                out['pos'] = self.pos(name)
+            return out
+
+        dest = self.expect('ident')
+        if self.tok[0] != ':' and self.tok[0] != '=':
+            # An effect operation; `dest` is its opcode.
+            out = self.op(dest)
+            self.expect(';')
+            return out
+        typ = None
+        if self.tok[0] == ':':
+            self.next()
+            typ = self.type()
+        self.expect('=')
+        if self.tok[:2] == ('ident', 'const'):
+            self.next()
+            out = {
+                'op': 'const',
+                'dest': dest[1],
+                'value': self.lit(),
+            }
+            if typ:
+                out['type'] = typ
+        else:
+            out = {'dest': dest[1]}
+            if typ:
+                out['type'] = typ
+            out.update(self.op(self.expect('ident')))
+        self.expect(';')
+        if self.include_pos:
+            out['pos'] = self.pos(dest)
+        return out
+
+    def op(self, op_tok):
+        funcs = []
+        labels = []
+        args = []
+        while True:
+            kind = self.tok[0]
+            if kind == 'ident':
+                args.append(self.next()[1])
+            elif kind == 'func':
+                funcs.append(self.next()[1][1:])
+            elif kind == 'label':
+                labels.append(self.next()[1][1:])
+            else:
+                break
+
+        out = {'op': op_tok[1]}
+        if args:
+            out['args'] = args
+        if funcs:
+            out['funcs'] = funcs
+        if labels:
+            out['labels'] = labels
+        if self.include_pos:
+            out['pos'] = self.pos(op_tok)
+        return out
+
+    def lit(self):
+        kind, text = self.tok[:2]
+        if kind == 'int':
+            value = int(text)
+        elif kind == 'float':
+            value = float(text)
+        elif kind == 'char':
+            value = text[1:-1]  # Strip `'`.
+            if value in control_chars:
+                value = chr(control_chars[value])
+        elif kind == 'ident' and text in ('true', 'false'):
+            value = text == 'true'
+        elif kind == 'ident' and text == 'nullptr':
+            value = 0
+        else:
+            self.error()
+        self.next()
+        return value
+
+    def type(self):
+        name = self.expect('ident')[1]
+        if self.tok[0] == '<':
+            self.next()
+            param = self.type()
+            self.expect('>')
+            return {name: param}
+        return name
+
+
+_parsers = {}
+
+
+def get_parser(include_pos=False):
+    """Get the shared LALR parser for the text format.
+
+    The parser is built on first use. It runs `JSONRules` on each
+    rule as soon as the rule is reduced, so `parse` returns the JSON data
+    without ever building the whole parse tree. Lark pickles the parse
+    tables to a file in the temporary directory (keyed on the grammar and
+    the Lark version), so later processes load them instead of rebuilding
+    them. Set `BRIL_LARK_CACHE=0` in the environment to build them in
+    memory every time instead.
+    """
+    if include_pos not in _parsers:
+        import lark
+        cache = os.environ.get('BRIL_LARK_CACHE', '1') != '0'
+        _parsers[include_pos] = lark.Lark(
+            GRAMMAR, parser='lalr', maybe_placeholders=True, cache=cache,
+            transformer=JSONRules(include_pos),
+        )
+    return _parsers[include_pos]
+
+
+def parse_bril(txt, include_pos=False, compact=False, backend='lark'):
     """Parse a Bril program and return a JSON string.
 
-    Optionally include source position information.
+    Optionally include source position information. The JSON is indented
+    with sorted keys, or as small as possible with `compact`. `backend` is
+    `'lark'` for the Lark parser or `'rd'` for `BrilParser`; both give the
+    same JSON.
     """
-    parser = lark.Lark(GRAMMAR, maybe_placeholders=True)
-    tree = parser.parse(txt)
-    data = JSONTransformer(include_pos).transform(tree)
+    if backend == 'lark':
+        data = get_parser(include_pos).parse(txt)
+    elif backend == 'rd':
+        data = BrilParser(txt, include_pos).parse()
+    else:
+        raise ValueError('unknown parser backend {}'.format(backend))
+    if compact:
+        return json.dumps(data, separators=(',', ':'))
     return json.dumps(data, indent=2, sort_keys=True)
 
 
 # Text format pretty-printer.
 
+control_chars_reverse = {value: key for key, value in control_chars.items()}
+
+
 def type_to_str(type):
     if isinstance(type, dict):
         assert len(type) == 1
@@ -254,7 +578,6 @@ def type_to_str(type):
 
 def value_to_str(type, value):
     if not isinstance(type, dict) and type.lower() == "char":
-        control_chars_reverse = {y: x for x, y in control_chars.items()}
         if ord(value) in control_chars_reverse:
             value = control_chars_reverse[ord(value)]
         return "'{}'".format(value)
@@ -264,43 +587,26 @@ def value_to_str(type, value):
 
 def instr_to_string(instr):
     if instr['op'] == 'const':
-        tyann = ': {}'.format(type_to_str(instr['type'])) \
-            if 'type' in instr else ''
+        tyann = ': ' + type_to_str(instr['type']) if 'type' in instr else ''
         return '{}{} = const {}'.format(
             instr['dest'],
             tyann,
             value_to_str(instr['type'], instr['value']),
         )
-    else:
-        rhs = instr['op']
-        if instr.get('funcs'):
-            rhs += ' {}'.format(' '.join(
-                '@{}'.format(f) for f in instr['funcs']
-            ))
-        if instr.get('args'):
-            rhs += ' {}'.format(' '.join(instr['args']))
-        if instr.get('labels'):
-            rhs += ' {}'.format(' '.join(
-                '.{}'.format(f) for f in instr['labels']
-            ))
-        if 'dest' in instr:
-            tyann = ': {}'.format(type_to_str(instr['type'])) \
-                if 'type' in instr else ''
-            return '{}{} = {}'.format(
-                instr['dest'],
-                tyann,
-                rhs,
-            )
-        else:
-            return rhs
-
-
-def print_instr(instr):
-    print('  {};'.format(instr_to_string(instr)))
-
 
-def print_label(label):
-    print('.{}:'.format(label['label']))
+    parts = [instr['op']]
+    if instr.get('funcs'):
+        parts.extend('@' + f for f in instr['funcs'])
+    if instr.get('args'):
+        parts.extend(instr['args'])
+    if instr.get('labels'):
+        parts.extend('.' + label for label in instr['labels'])
+    rhs = ' '.join(parts)
+    if 'dest' in instr:
+        tyann = ': ' + type_to_str(instr['type']) if 'type' in instr else ''
+        return '{}{} = {}'.format(instr['dest'], tyann, rhs)
+    else:
+        return rhs
 
 
 def args_to_string(args):
@@ -313,31 +619,572 @@ def args_to_string(args):
         return ''
 
 
-def print_func(func):
+def func_to_string(func):
+    """Render a function as text, one line per instruction or label.
+
+    The lines are collected and joined once, and the result ends with a
+    newline.
+    """
     typ = func.get('type', 'void')
-    print('@{}{}{} {{'.format(
+    lines = ['@{}{}{} {{'.format(
         func['name'],
         args_to_string(func.get('args', [])),
         ': {}'.format(type_to_str(typ)) if typ != 'void' else '',
-    ))
+    )]
     for instr_or_label in func['instrs']:
         if 'label' in instr_or_label:
-            print_label(instr_or_label)
+            lines.append('.{}:'.format(instr_or_label['label']))
         else:
-            print_instr(instr_or_label)
-    print('}')
+            lines.append('  {};'.format(instr_to_string(instr_or_label)))
+    lines.append('}\n')
+    return '\n'.join(lines)
+
+
+def prog_to_string(prog):
+    return ''.join(func_to_string(func) for func in prog['functions'])
+
+
+def print_instr(instr):
+    print('  {};'.format(instr_to_string(instr)))
+
+
+def print_label(label):
+    print('.{}:'.format(label['label']))
+
+
+def print_func(func):
+    sys.stdout.write(func_to_string(func))
 
 
 def print_prog(prog):
+    sys.stdout.write(prog_to_string(prog))
+
+
+# Streaming JSON reader.
+
+class _StreamReader:
+    """Decode JSON values one at a time from a text stream.
+
+    Text is read in chunks and only the part not parsed yet is kept.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        """Read another chunk; return False at the end of the stream."""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it.
+
+        Returns '' at the end of the stream.
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError("Expecting '{}'".format(char),
+                                       self.buf, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """Decode the next value, reading more text until it is complete.
+
+        A value that ends right at the end of the buffer (a number) might
+        go on in the next chunk, so it only counts at the end of the stream.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # At least double the buffer so that retries stay linear.
+            size = len(self.buf) - self.pos
+            while len(self.buf) - self.pos < 2 * size and self.fill():
+                pass
+
+    def array(self):
+        """Generate the elements of an array one at a time."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ']':
+                self.pos += 1
+                return
+            self.expect(',')
+
+
+def read_items(stream):
+    """Generate the top-level (key, value) pairs of a JSON Bril program.
+
+    The value of `functions` is a generator that decodes one function at a
+    time and has to be used up before the next pair is read, so only the
+    function being decoded is held in memory, not the whole program.
+    """
+    reader = _StreamReader(stream)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == 'functions':
+            yield key, reader.array()
+        else:
+            yield key, reader.value()
+        if reader.peek() == '}':
+            return
+        reader.expect(',')
+
+
+def read_functions(stream):
+    """Generate the functions of a JSON Bril program one at a time.
+
+    Other top-level members, like `structs`, are skipped.
+    """
+    for key, value in read_items(stream):
+        if key == 'functions':
+            yield from value
+
+
+# Binary format.
+#
+# A binary file is BIN_MAGIC followed by records: a one-byte kind and a
+# four-byte payload length. A REC_PROGRAM record holds the top-level keys
+# other than `functions` (like `structs`) as JSON; each REC_FUNCTION record
+# holds one function, so programs can be written and read a function at a
+# time. A function payload has its own string table (names of variables,
+# labels, functions, opcodes and types, NUL-separated), a typed constant
+# pool (a kind byte per constant, then the int and float constants as
+# arrays), and one stream of unsigned integers that describes the types,
+# the signature and the instructions with indices into the two tables.
+# Integer sections use the narrowest of 1, 2, 4 or 8 bytes that fits their
+# largest value, so `array` can decode a whole section at once. Keys the
+# format has no field for are kept as JSON text in the string table.
+
+BIN_MAGIC = b'BRLB\x01'
+REC_PROGRAM = 1
+REC_FUNCTION = 2
+
+# Instruction flags, the low byte of an instruction's first integer (the
+# rest is the string index of its opcode or label).
+_DEST, _TYPE, _ARGS, _FUNCS, _LABELS, _VALUE, _EXTRA, _LABEL = \
+    (1 << bit for bit in range(8))
+# Function flags.
+_FN_ARGS, _FN_TYPE, _FN_EXTRA = 1, 2, 4
+# Constant pool kinds.
+_POOL_INT, _POOL_FLOAT, _POOL_CHAR, _POOL_FALSE, _POOL_TRUE = range(5)
+
+_INSTR_KEYS = {'op', 'label', 'dest', 'type', 'args', 'funcs', 'labels',
+               'value'}
+_FUNC_KEYS = {'name', 'args', 'type', 'instrs'}
+_WIDTH_TYPECODES = {array.array(code).itemsize: code
+                    for code in reversed('BHILQ')}
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def _pack_ints(values, typecode=None):
+    """Pack integers as a width byte, a count and a little-endian array."""
+    if typecode is None:
+        top = max(values, default=0)
+        width = next(width for width in (1, 2, 4, 8)
+                     if top < (1 << (8 * width)))
+        typecode = _WIDTH_TYPECODES[width]
+    packed = array.array(typecode, values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return (struct.pack('<BI', packed.itemsize, len(packed)) +
+            packed.tobytes())
+
+
+def _unpack_ints(data, pos, typecode=None):
+    """Unpack a `_pack_ints` section at pos; return the list and new pos."""
+    width, count = struct.unpack_from('<BI', data, pos)
+    pos += 5
+    unpacked = array.array(typecode or _WIDTH_TYPECODES[width])
+    end = pos + width * count
+    unpacked.frombytes(data[pos:end])
+    if sys.byteorder == 'big':
+        unpacked.byteswap()
+    return unpacked.tolist(), end
+
+
+class _FuncEncoder:
+    """Build the tables and integer stream of one function."""
+
+    def __init__(self):
+        self.strings = {}
+        self.types = {}
+        self.type_ints = []
+        self.pool = {}
+        self.pool_kinds = bytearray()
+        self.pool_ints = []
+        self.pool_floats = []
+        self.ints = []
+
+    def string(self, value):
+        idx = self.strings.get(value)
+        if idx is None:
+            if '\0' in value:
+                raise ValueError('NUL in name {!r}'.format(value))
+            idx = self.strings[value] = len(self.strings)
+        return idx
+
+    def type(self, typ):
+        """Index of a type in the type table, entered children first."""
+        if isinstance(typ, dict):
+            if len(typ) != 1:
+                raise ValueError('bad type {!r}'.format(typ))
+            (name, param), = typ.items()
+            key = (self.string(name), self.type(param) + 1)
+        else:
+            key = (self.string(typ), 0)
+        idx = self.types.get(key)
+        if idx is None:
+            idx = self.types[key] = len(self.types)
+            self.type_ints.extend(key)
+        return idx
+
+    def const(self, value):
+        """Index of a value in the pool, or None if it has no pool kind."""
+        if value is True or value is False:
+            kind = _POOL_TRUE if value else _POOL_FALSE
+            key = (kind,)
+        elif type(value) is int and _INT64_MIN <= value <= _INT64_MAX:
+            kind, key = _POOL_INT, (_POOL_INT, value)
+        elif type(value) is float:
+            # Keyed on the bits, so -0.0 and NaN keep their identity.
+            kind, key = _POOL_FLOAT, (_POOL_FLOAT, struct.pack('<d', value))
+        elif type(value) is str and len(value) == 1:
+            kind, key = _POOL_CHAR, (_POOL_CHAR, value)
+        else:
+            return None
+        idx = self.pool.get(key)
+        if idx is None:
+            idx = self.pool[key] = len(self.pool)
+            self.pool_kinds.append(kind)
+            if kind == _POOL_INT:
+                self.pool_ints.append(value)
+            elif kind == _POOL_CHAR:
+                self.pool_ints.append(ord(value))
+            elif kind == _POOL_FLOAT:
+                self.pool_floats.append(value)
+        return idx
+
+    def extra(self, obj, known):
+        """String index of the JSON of obj's unknown keys, or None."""
+        extra = {key: value for key, value in obj.items() if key not in known}
+        if not extra:
+            return None
+        return self.string(json.dumps(extra, sort_keys=True))
+
+    def instr(self, instr):
+        ints = self.ints
+        if 'label' in instr:
+            extra = self.extra(instr, _INSTR_KEYS)
+            ints.append(self.string(instr['label']) << 8 | _LABEL |
+                        (_EXTRA if extra is not None else 0))
+            if extra is not None:
+                ints.append(extra)
+            return
+        value = None
+        if 'value' in instr:
+            value = self.const(instr['value'])
+        known = _INSTR_KEYS if value is not None or 'value' not in instr \
+            else _INSTR_KEYS - {'value'}
+        extra = self.extra(instr, known)
+        flags = (('dest' in instr and _DEST) |
+                 ('type' in instr and _TYPE) |
+                 ('args' in instr and _ARGS) |
+                 ('funcs' in instr and _FUNCS) |
+                 ('labels' in instr and _LABELS) |
+                 (value is not None and _VALUE) |
+                 (extra is not None and _EXTRA))
+        ints.append(self.string(instr['op']) << 8 | flags)
+        if flags & _DEST:
+            ints.append(self.string(instr['dest']))
+        if flags & _TYPE:
+            ints.append(self.type(instr['type']))
+        for flag, key in ((_ARGS, 'args'), (_FUNCS, 'funcs'),
+                          (_LABELS, 'labels')):
+            if flags & flag:
+                ints.append(len(instr[key]))
+                ints.extend(self.string(name) for name in instr[key])
+        if flags & _VALUE:
+            ints.append(value)
+        if flags & _EXTRA:
+            ints.append(extra)
+
+    def func(self, func):
+        """Return the payload of a REC_FUNCTION record for func."""
+        extra = self.extra(func, _FUNC_KEYS)
+        flags = (('args' in func and _FN_ARGS) |
+                 ('type' in func and _FN_TYPE) |
+                 (extra is not None and _FN_EXTRA))
+        ints = self.ints
+        ints.extend((self.string(func['name']), flags))
+        if flags & _FN_ARGS:
+            ints.append(len(func['args']))
+            for arg in func['args']:
+                ints.extend((self.string(arg['name']),
+                             self.type(arg['type'])))
+        if flags & _FN_TYPE:
+            ints.append(self.type(func['type']))
+        if flags & _FN_EXTRA:
+            ints.append(extra)
+        ints.append(len(func['instrs']))
+        for instr in func['instrs']:
+            self.instr(instr)
+
+        strings = '\0'.join(self.strings).encode()
+        return b''.join([
+            struct.pack('<I', len(strings)), strings,
+            struct.pack('<I', len(self.pool_kinds)), bytes(self.pool_kinds),
+            _pack_ints(self.pool_ints, 'q'),
+            _pack_ints(self.pool_floats, 'd'),
+            _pack_ints([len(self.types)] + self.type_ints + ints),
+        ])
+
+
+def _decode_func(data):
+    """Decode the payload of a REC_FUNCTION record."""
+    size, = struct.unpack_from('<I', data, 0)
+    strings = data[4:4 + size].decode().split('\0')
+    pos = 4 + size
+    size, = struct.unpack_from('<I', data, pos)
+    pool_kinds = data[pos + 4:pos + 4 + size]
+    pos += 4 + size
+    pool_ints, pos = _unpack_ints(data, pos, 'q')
+    pool_floats, pos = _unpack_ints(data, pos, 'd')
+    ints, pos = _unpack_ints(data, pos)
+
+    pool = []
+    next_int = iter(pool_ints).__next__
+    next_float = iter(pool_floats).__next__
+    for kind in pool_kinds:
+        if kind == _POOL_INT:
+            pool.append(next_int())
+        elif kind == _POOL_FLOAT:
+            pool.append(next_float())
+        elif kind == _POOL_CHAR:
+            pool.append(chr(next_int()))
+        else:
+            pool.append(kind == _POOL_TRUE)
+
+    stream = iter(ints)
+    nxt = stream.__next__
+    islice = itertools.islice
+    name_of = strings.__getitem__
+    types = []
+    for _ in range(nxt()):
+        name, param = strings[nxt()], nxt()
+        types.append({name: types[param - 1]} if param else name)
+
+    func = {'name': strings[nxt()]}
+    flags = nxt()
+    if flags & _FN_ARGS:
+        func['args'] = [{'name': strings[nxt()], 'type': types[nxt()]}
+                        for _ in range(nxt())]
+    if flags & _FN_TYPE:
+        func['type'] = types[nxt()]
+    if flags & _FN_EXTRA:
+        func.update(json.loads(strings[nxt()]))
+    instrs = func['instrs'] = []
+    for _ in range(nxt()):
+        code = nxt()
+        flags = code & 0xff
+        if flags & _LABEL:
+            instr = {'label': strings[code >> 8]}
+        else:
+            instr = {'op': strings[code >> 8]}
+            if flags & _DEST:
+                instr['dest'] = strings[nxt()]
+            if flags & _TYPE:
+                instr['type'] = types[nxt()]
+            if flags & _ARGS:
+                instr['args'] = list(map(name_of, islice(stream, nxt())))
+            if flags & _FUNCS:
+                instr['funcs'] = list(map(name_of, islice(stream, nxt())))
+            if flags & _LABELS:
+                instr['labels'] = list(map(name_of, islice(stream, nxt())))
+            if flags & _VALUE:
+                instr['value'] = pool[nxt()]
+        if flags & _EXTRA:
+            instr.update(json.loads(strings[nxt()]))
+        instrs.append(instr)
+    return func
+
+
+def _write_record(stream, kind, payload):
+    stream.write(struct.pack('<BI', kind, len(payload)))
+    stream.write(payload)
+
+
+def write_bin(stream, prog):
+    """Write a JSON Bril program to a binary stream in the binary format.
+
+    `prog['functions']` may be any iterable; each function is written as
+    soon as it comes out of it.
+    """
+    stream.write(BIN_MAGIC)
+    extra = {key: value for key, value in prog.items() if key != 'functions'}
+    if extra:
+        _write_record(stream, REC_PROGRAM,
+                      json.dumps(extra, sort_keys=True).encode())
     for func in prog['functions']:
-        print_func(func)
+        _write_record(stream, REC_FUNCTION, _FuncEncoder().func(func))
+
+
+def write_bin_items(stream, items):
+    """Write the (key, value) pairs of a program in the binary format.
+
+    The pairs are like those of `read_items` or `read_bin_items`. Each
+    function is written as soon as it comes out of the `functions`
+    iterable; every other key gets a REC_PROGRAM record of its own, where
+    it comes.
+    """
+    stream.write(BIN_MAGIC)
+    for key, value in items:
+        if key == 'functions':
+            for func in value:
+                _write_record(stream, REC_FUNCTION, _FuncEncoder().func(func))
+        else:
+            _write_record(stream, REC_PROGRAM,
+                          json.dumps({key: value}).encode())
+
+
+def is_bin(stream):
+    """Check whether a buffered binary stream holds a binary Bril program.
+
+    Nothing is consumed, so the stream can still be read as either format.
+    """
+    return stream.peek(len(BIN_MAGIC))[:len(BIN_MAGIC)] == BIN_MAGIC
+
+
+def _read_records(stream):
+    """Generate the (kind, payload) records of a binary Bril program."""
+    if stream.read(len(BIN_MAGIC)) != BIN_MAGIC:
+        raise ValueError('not a binary Bril program')
+    while True:
+        header = stream.read(5)
+        if not header:
+            return
+        if len(header) < 5:
+            raise ValueError('truncated binary Bril program')
+        kind, size = struct.unpack('<BI', header)
+        payload = stream.read(size)
+        if len(payload) < size:
+            raise ValueError('truncated binary Bril program')
+        if kind not in (REC_PROGRAM, REC_FUNCTION):
+            raise ValueError('unknown record kind {}'.format(kind))
+        yield kind, payload
+
+
+def read_bin(stream):
+    """Generate the records of a binary Bril program, decoded.
+
+    Yields the dict of top-level keys for a REC_PROGRAM record and a
+    function for each REC_FUNCTION record, reading one record at a time.
+    """
+    for kind, payload in _read_records(stream):
+        if kind == REC_PROGRAM:
+            yield json.loads(payload)
+        else:
+            yield _decode_func(payload)
+
+
+def read_bin_items(stream):
+    """Generate the top-level (key, value) pairs of a binary Bril program.
+
+    Like in `read_items`, the value of `functions` is a generator that
+    decodes one function at a time and has to be used up before the next
+    pair is read. The functions can come before or between the other keys.
+    """
+    records = _read_records(stream)
+    # The record after the run of functions.
+    after = [next(records, None)]
+
+    def funcs():
+        record = after[0]
+        while record is not None and record[0] == REC_FUNCTION:
+            yield _decode_func(record[1])
+            record = next(records, None)
+        after[0] = record
+
+    seen_funcs = False
+    while after[0] is not None:
+        kind, payload = after[0]
+        if kind == REC_PROGRAM:
+            yield from json.loads(payload).items()
+            after[0] = next(records, None)
+        elif not seen_funcs:
+            seen_funcs = True
+            yield 'functions', funcs()
+        else:
+            raise ValueError('functions split by other records')
+    if not seen_funcs:
+        yield 'functions', iter(())
+
+
+def load_bin(stream):
+    """Read a whole binary Bril program into its JSON form."""
+    prog = {}
+    funcs = []
+    for record in read_bin(stream):
+        if 'instrs' in record:
+            funcs.append(record)
+        else:
+            prog.update(record)
+    prog['functions'] = funcs
+    return prog
 
 
 # Command-line entry points.
 
 def bril2json():
-    print(parse_bril(sys.stdin.read(), '-p' in sys.argv[1:]))
+    print(parse_bril(sys.stdin.read(), '-p' in sys.argv[1:],
+                     '--compact' in sys.argv[1:],
+                     'rd' if '--rd' in sys.argv[1:] else 'lark'))
 
 
 def bril2txt():
-    print_prog(json.load(sys.stdin))
+    if '--stream' in sys.argv[1:]:
+        for func in read_functions(sys.stdin):
+            sys.stdout.write(func_to_string(func))
+    else:
+        print_prog(json.load(sys.stdin))
+
+
+def bril2bin():
+    write_bin(sys.stdout.buffer, json.load(sys.stdin))
+
+
+def bin2bril():
+    print(json.dumps(load_bin(sys.stdin.buffer), indent=2, sort_keys=True))
@@ -0,0 +1,119 @@
+"""Fuzz the hand-written parser against the Lark one.
+
+Takes the programs in `test/parse` and `benchmarks` (or the files given),
+mutates them at random, and checks that `BrilParser` and the Lark parser
+agree on every mutant: the same JSON (with source positions) or an error
+from both.
+
+    python fuzz_parse.py [-n MUTANTS_PER_FILE] [-s SEED] [FILE.bril ...]
+"""
+
+import argparse
+import glob
+import os
+import random
+
+import briltxt
+
+# Tokens that sit on the edges of the grammar: keywords in and out of
+# their context, number forms, chars, and comments.
+INTERESTING = [
+    'const', 'true', 'false', 'nullptr', 'struct', 'ptr<int>', 'int',
+    '0', '-1', '+7', '1.', '.5', '-2.5e3', '1e6', '1E+6', '.e1',
+    "'a'", "'\\n'", "'\\q'", "''", "'''", "' '",
+    '@f', '.l', '.1', '_x.y', '%t', 'a-b',
+    '=', ';', ':', '{', '}', '(', ')', '<', '>', ',',
+    '#c\n', '\n', ' ',
+]
+
+
+def token_spans(txt):
+    """Spans of the tokens of txt, whitespace and comments included."""
+    return [match.span() for match in briltxt.TOKEN_RE.finditer(txt)]
+
+
+def mutate(txt, rng):
+    """Apply one random token or character edit to txt."""
+    spans = token_spans(txt)
+    if not spans:
+        return rng.choice(INTERESTING)
+    start, end = rng.choice(spans)
+    edit = rng.randrange(6)
+    if edit == 0:
+        # delete a token
+        return txt[:start] + txt[end:]
+    elif edit == 1:
+        # duplicate a token
+        return txt[:end] + txt[start:end] + txt[end:]
+    elif edit == 2:
+        # replace a token
+        return txt[:start] + rng.choice(INTERESTING) + txt[end:]
+    elif edit == 3:
+        # insert a token
+        return txt[:start] + rng.choice(INTERESTING) + txt[start:]
+    elif edit == 4:
+        # swap two tokens
+        start2, end2 = rng.choice(spans)
+        if start2 < start:
+            start, end, start2, end2 = start2, end2, start, end
+        if end > start2:
+            return txt
+        return (txt[:start] + txt[start2:end2] + txt[end:start2] +
+                txt[start:end] + txt[end2:])
+    else:
+        # change one character
+        idx = rng.randrange(len(txt))
+        return txt[:idx] + rng.choice('@.-+e\'#:;<>0aZ_%\n ') + txt[idx + 1:]
+
+
+def outcome(txt, backend):
+    """The JSON text of a parse, or None if it fails."""
+    try:
+        return briltxt.parse_bril(txt, include_pos=True, backend=backend)
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=50,
+                        help='mutants per file')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    paths = args.files
+    if not paths:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        paths = sorted(glob.glob(os.path.join(root, 'test', 'parse',
+                                              '*.bril')))
+        paths += sorted(glob.glob(os.path.join(root, 'benchmarks', '**',
+                                               '*.bril'), recursive=True))
+    rng = random.Random(args.seed)
+
+    cases = 0
+    parsed = 0
+    failures = 0
+    for path in paths:
+        txt = open(path).read()
+        mutants = [txt]
+        for _ in range(args.n):
+            mutant = txt
+            for _ in range(rng.randint(1, 3)):
+                mutant = mutate(mutant, rng)
+            mutants.append(mutant)
+        for mutant in mutants:
+            cases += 1
+            expected = outcome(mutant, 'lark')
+            parsed += expected is not None
+            if outcome(mutant, 'rd') != expected:
+                failures += 1
+                print('mismatch on a mutant of {}:'.format(path))
+                print(mutant)
+    print('{} programs ({} valid), {} mismatches'.format(
+        cases, parsed, failures))
+    exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import json
 from collections import namedtuple
 
 from form_blocks import form_blocks
+from util import Worklist
 import cfg
 
 # A single dataflow analysis consists of these part:
@@ -40,10 +41,10 @@ def df_worklist(blocks, analysis):
     in_ = {first_block: analysis.init}
     out = {node: analysis.init for node in blocks}
 
-    # Iterate.
-    worklist = list(blocks.keys())
+    # Iterate, visiting blocks in program order first.
+    worklist = Worklist(blocks.keys())
     while worklist:
-        node = worklist.pop(0)
+        node = worklist.pop()
 
         inval = analysis.merge(out[n] for n in in_edges[node])
         in_[node] = inval
@@ -52,7 +53,7 @@ def df_worklist(blocks, analysis):
 
         if outval != out[node]:
             out[node] = outval
-            worklist += out_edges[node]
+            worklist.extend(out_edges[node])
 
     if analysis.forward:
         return in_, out
@@ -47,25 +47,63 @@ def intersect(sets):
     return out
 
 
-def get_dom(succ, entry):
+def get_idom(succ, entry):
+    """Compute the immediate dominator of every block reachable from
+    `entry` with the Cooper-Harvey-Kennedy algorithm ("A Simple, Fast
+    Dominance Algorithm"), which iterates over the reverse postorder and
+    intersects paths in the partial dominator tree instead of sets.
+
+    The entry block's idom is None. Unreachable blocks are left out.
+    """
     pred = map_inv(succ)
     nodes = list(reversed(postorder(succ, entry)))  # Reverse postorder.
+    order = {node: i for i, node in enumerate(nodes)}
 
-    dom = {v: set(nodes) for v in succ}
-
-    while True:
+    idom = {entry: entry}
+    changed = True
+    while changed:
         changed = False
+        for node in nodes[1:]:
+            new_idom = None
+            for p in pred[node]:
+                if p not in idom:
+                    continue  # Not processed yet (or unreachable).
+                if new_idom is None:
+                    new_idom = p
+                    continue
+                # Walk both fingers up the tree to their common ancestor.
+                a, b = p, new_idom
+                while a != b:
+                    while order[a] > order[b]:
+                        a = idom[a]
+                    while order[b] > order[a]:
+                        b = idom[b]
+                new_idom = a
+            if idom.get(node) != new_idom:
+                idom[node] = new_idom
+                changed = True
 
-        for node in nodes:
-            new_dom = intersect(dom[p] for p in pred[node])
-            new_dom.add(node)
+    idom[entry] = None
+    return idom
 
-            if dom[node] != new_dom:
-                dom[node] = new_dom
-                changed = True
 
-        if not changed:
-            break
+def get_dom(succ, entry):
+    idom = get_idom(succ, entry)
+    nodes = set(idom)
+
+    # The dominators of a block are its ancestors in the dominator tree.
+    # Unreachable blocks are "dominated" by every reachable block, as in
+    # the plain iterative algorithm.
+    dom = {}
+    for v in succ:
+        if v not in idom:
+            dom[v] = set(nodes)
+            continue
+        dom[v] = set()
+        node = v
+        while node is not None:
+            dom[v].add(node)
+            node = idom[node]
 
     return dom
 
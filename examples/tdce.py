@@ -45,13 +45,56 @@ def trivial_dce_pass(func):
     return changed
 
 
+def def_use(blocks):
+    """Index the instructions in `blocks`: return a map from each
+    variable to the instructions that define it and a map from each
+    variable to the number of times it is used as an argument.
+
+    This is a cut-down `tasks.lib.def_use.DefUse` (which `g_dce` in
+    `tasks/task1/dce.py` uses): the examples are standalone scripts that
+    only import their neighbours, and deleting here only needs counts.
+    """
+    defs = {}
+    uses = {}
+    for block in blocks:
+        for instr in block:
+            if 'dest' in instr:
+                defs.setdefault(instr['dest'], []).append(instr)
+            for var in instr.get('args', []):
+                uses[var] = uses.get(var, 0) + 1
+    return defs, uses
+
+
 def trivial_dce(func):
     """Iteratively remove dead instructions, stopping when nothing
-    remains to remove.
+    remains to remove. Return a bool indicating whether we deleted
+    anything.
+
+    Instead of rerunning `trivial_dce_pass` over the whole function,
+    keep the def-use index up to date: deleting an instruction drops
+    the use counts of its arguments, and a variable whose count reaches
+    zero has its definitions deleted in turn.
     """
-    # An exercise for the reader: prove that this loop terminates.
-    while trivial_dce_pass(func):
-        pass
+    blocks = list(form_blocks(func['instrs']))
+    defs, uses = def_use(blocks)
+
+    # Variables that are never used; each is visited once.
+    worklist = [var for var in defs if uses.get(var, 0) == 0]
+    dead = set()
+    while worklist:
+        var = worklist.pop()
+        for instr in defs.pop(var, []):
+            dead.add(id(instr))
+            for arg in instr.get('args', []):
+                uses[arg] -= 1
+                if uses[arg] == 0 and arg in defs:
+                    worklist.append(arg)
+
+    for block in blocks:
+        block[:] = [i for i in block if id(i) not in dead]
+    func['instrs'] = flatten(blocks)
+
+    return bool(dead)
 
 
 def drop_killed_local(block):
@@ -108,8 +151,9 @@ def drop_killed_pass(func):
 def trivial_dce_plus(func):
     """Like `trivial_dce`, but also deletes locally killed instructions.
     """
-    while trivial_dce_pass(func) or drop_killed_pass(func):
-        pass
+    trivial_dce(func)
+    while drop_killed_pass(func):
+        trivial_dce(func)
 
 
 MODES = {
@@ -5,6 +5,7 @@ from collections import defaultdict
 from cfg import block_map, successors, add_terminators, add_entry, reassemble
 from form_blocks import form_blocks
 from dom import get_dom, dom_fronts, dom_tree
+from util import Worklist
 
 
 def def_blocks(blocks):
@@ -27,15 +28,15 @@ def get_phis(blocks, df, defs):
     """
     phis = {b: set() for b in blocks}
     for v, v_defs in defs.items():
-        v_defs_list = list(v_defs)
-        for d in v_defs_list:
+        worklist = Worklist(v_defs)
+        while worklist:
+            d = worklist.pop()
             for block in df[d]:
                 # Add a phi-node...
                 if v not in phis[block]:
                     # ..unless we already did.
                     phis[block].add(v)
-                    if block not in v_defs_list:
-                        v_defs_list.append(block)
+                    worklist.push(block)
     return phis
 
 
@@ -1,4 +1,6 @@
+import heapq
 import itertools
+from collections import deque
 
 
 def flatten(ll):
@@ -16,3 +18,52 @@ def fresh(seed, names):
         if name not in names:
             return name
         i += 1
+
+
+class Worklist:
+    """A worklist of hashable items (usually block names) that holds each
+    item at most once.
+
+    Items pop in FIFO order, or lowest `priority[item]` first when a
+    priority map is given (e.g., reverse postorder numbers for a forward
+    analysis). Push, pop, and membership tests are all cheap, unlike
+    `list.pop(0)` and `x in list`.
+    """
+    def __init__(self, items=(), priority=None):
+        self.priority = priority
+        self.queue = deque() if priority is None else []
+        self.queued = set()
+        self.count = itertools.count()  # Break priority ties in push order.
+        self.extend(items)
+
+    def push(self, item):
+        """Add `item` unless it is already queued. Return whether it was
+        added.
+        """
+        if item in self.queued:
+            return False
+        self.queued.add(item)
+        if self.priority is None:
+            self.queue.append(item)
+        else:
+            heapq.heappush(self.queue,
+                           (self.priority[item], next(self.count), item))
+        return True
+
+    def extend(self, items):
+        for item in items:
+            self.push(item)
+
+    def pop(self):
+        if self.priority is None:
+            item = self.queue.popleft()
+        else:
+            item = heapq.heappop(self.queue)[-1]
+        self.queued.discard(item)
+        return item
+
+    def __contains__(self, item):
+        return item in self.queued
+
+    def __len__(self):
+        return len(self.queued)
@@ -0,0 +1,179 @@
+import heapq
+import itertools
+from collections import deque
+
+# bit-vector dataflow engine
+# facts are python ints used as bit sets, a Universe numbers the things the
+# bits stand for (variables, stores, allocation sites ...) once per function
+# solve() iterates any monotone problem over blocks_cfg (pred/succ lists from
+# block_gen) in reverse postorder until nothing changes
+
+class Universe:
+    def __init__(self, items=()):
+        self.items = []
+        self.index = {}
+        for item in items:
+            self.add(item)
+
+    # number an item (once), returns its bit position
+    def add(self, item):
+        idx = self.index.get(item)
+        if idx is None:
+            idx = len(self.items)
+            self.index[item] = idx
+            self.items.append(item)
+        return idx
+
+    def bit(self, item):
+        return 1 << self.add(item)
+
+    def bits(self, items):
+        out = 0
+        for item in items:
+            out |= 1 << self.add(item)
+        return out
+
+    def to_set(self, bits):
+        return {self.items[idx] for idx in iter_bits(bits)}
+
+    def full(self):
+        return (1 << len(self.items)) - 1
+
+    def __len__(self):
+        return len(self.items)
+
+# worklist of block ids (or any hashable item), an item is queued at most
+# once, items pop in fifo order or lowest priority[item] first when a
+# priority (e.g. the rank from rpo) is given
+class Worklist:
+    def __init__(self, items=(), priority=None):
+        self.priority = priority
+        self.queue = deque() if priority is None else []
+        self.queued = set()
+        # breaks priority ties in push order
+        self.count = itertools.count()
+        self.extend(items)
+
+    # returns False if the item is already queued
+    def push(self, item):
+        if item in self.queued:
+            return False
+        self.queued.add(item)
+        if self.priority is None:
+            self.queue.append(item)
+        else:
+            heapq.heappush(self.queue, (self.priority[item], next(self.count), item))
+        return True
+
+    def extend(self, items):
+        for item in items:
+            self.push(item)
+
+    def pop(self):
+        if self.priority is None:
+            item = self.queue.popleft()
+        else:
+            item = heapq.heappop(self.queue)[-1]
+        self.queued.discard(item)
+        return item
+
+    def __contains__(self, item):
+        return item in self.queued
+
+    def __len__(self):
+        return len(self.queued)
+
+    # queued items in pop order
+    def __repr__(self):
+        if self.priority is None:
+            return f"Worklist({list(self.queue)})"
+        return f"Worklist({[entry[-1] for entry in sorted(self.queue)]})"
+
+# positions of the set bits, lowest first
+def iter_bits(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+def union_bits(facts):
+    out = 0
+    for fact in facts:
+        out |= fact
+    return out
+
+def intersect_bits(facts):
+    out = facts[0]
+    for fact in facts[1:]:
+        out &= fact
+    return out
+
+# transfer function out = gen | (in - kill)
+def gen_kill(gen, kill):
+    return lambda block_id, fact: gen[block_id] | (fact & ~kill[block_id])
+
+# blocks reachable from entry in reverse postorder
+def rpo(blocks_cfg, entry=0):
+    if len(blocks_cfg) == 0:
+        return []
+    order = []
+    visited = {entry}
+    stack = [(entry, iter(blocks_cfg[entry]['succ']))]
+    while len(stack) > 0:
+        block_id, succs = stack[-1]
+        for succ_id in succs:
+            if succ_id not in visited:
+                visited.add(succ_id)
+                stack.append((succ_id, iter(blocks_cfg[succ_id]['succ'])))
+                break
+        else:
+            stack.pop()
+            order.append(block_id)
+    order.reverse()
+    return order
+
+# visiting order of all blocks and the rank of each block in it, for a
+# Worklist priority: reverse postorder with unreachable blocks last,
+# backward problems run in postorder
+def rpo_rank(blocks_cfg, entry=0, forward=True):
+    order = rpo(blocks_cfg, entry)
+    seen = set(order)
+    order += [block_id for block_id in range(len(blocks_cfg)) if block_id not in seen]
+    if not forward:
+        order.reverse()
+    priority = [0] * len(blocks_cfg)
+    for rank, block_id in enumerate(order):
+        priority[block_id] = rank
+    return order, priority
+
+# solve a dataflow problem to its fixed point
+# transfer(block_id, fact) maps the fact at the start of the block (end for
+# backward problems) through it, meet(list of facts) merges neighbours
+# init is the starting fact of every block, boundary flows into the entry
+# (forward) or into the blocks without successors (backward)
+# returns (facts at block starts, facts at block ends) like examples/df.py
+def solve(blocks_cfg, transfer, forward=True, meet=union_bits, init=0, boundary=0, entry=0):
+    if forward:
+        in_edges, out_edges = 'pred', 'succ'
+    else:
+        in_edges, out_edges = 'succ', 'pred'
+    order, priority = rpo_rank(blocks_cfg, entry, forward)
+
+    in_ = [init] * len(blocks_cfg)
+    out = [init] * len(blocks_cfg)
+    worklist = Worklist(order, priority)
+    while len(worklist) > 0:
+        block_id = worklist.pop()
+        facts = [out[other] for other in blocks_cfg[block_id][in_edges]]
+        if (forward and block_id == entry) or (not forward and len(blocks_cfg[block_id]['succ']) == 0):
+            facts.append(boundary)
+        in_[block_id] = meet(facts) if len(facts) > 0 else init
+        fact = transfer(block_id, in_[block_id])
+        if fact != out[block_id]:
+            out[block_id] = fact
+            worklist.extend(blocks_cfg[block_id][out_edges])
+
+    if forward:
+        return in_, out
+    else:
+        return out, in_
@@ -0,0 +1,41 @@
+# def-use index of a function over the blocks of block_gen
+# defs maps a var to the instrs writing it (one in ssa), uses maps a var
+# to the instrs reading it, once per occurrence in their args
+# built once per function, passes keep it up to date with add/remove
+# instead of rescanning the blocks, a var with no def (or no user) left
+# has no entry
+class DefUse:
+    def __init__(self, blocks):
+        self.defs = {}
+        self.uses = {}
+        for block in blocks:
+            for instr in block:
+                if 'op' in instr:
+                    self.add(instr)
+
+    # instr was inserted
+    def add(self, instr):
+        if 'dest' in instr:
+            self.defs.setdefault(instr['dest'], []).append(instr)
+        for arg in instr.get('args', []):
+            self.uses.setdefault(arg, []).append(instr)
+
+    # instr was deleted
+    def remove(self, instr):
+        if 'dest' in instr:
+            remove_instr(self.defs, instr['dest'], instr)
+        for arg in instr.get('args', []):
+            remove_instr(self.uses, arg, instr)
+
+    def users(self, var):
+        return self.uses.get(var, [])
+
+# drop instr itself from index[var] (equal dicts are different instrs)
+def remove_instr(index, var, instr):
+    instrs = index[var]
+    for idx, other in enumerate(instrs):
+        if other is instr:
+            del instrs[idx]
+            break
+    if len(instrs) == 0:
+        del index[var]
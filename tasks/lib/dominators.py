@@ -0,0 +1,118 @@
+from tasks.lib.bv_dataflow import rpo
+
+# dominator tree over blocks_cfg (pred/succ lists from block_gen)
+# idoms are computed with the Cooper-Harvey-Kennedy iterative algorithm over
+# the reverse postorder numbering, dominates() is O(1) via preorder/postorder
+# intervals of the tree, unreachable blocks have no idom and are dominated
+# only by themselves
+class DomTree:
+    def __init__(self, blocks_cfg, entry=0):
+        self.blocks_cfg = blocks_cfg
+        self.entry = entry
+        self.order = rpo(blocks_cfg, entry)
+        self.rank = [None] * len(blocks_cfg)
+        for rank, block_id in enumerate(self.order):
+            self.rank[block_id] = rank
+        self.comp_idom()
+        # dominator tree, children in block order
+        self.children = [[] for _ in blocks_cfg]
+        for block_id in range(len(blocks_cfg)):
+            if self.idom[block_id] is not None:
+                self.children[self.idom[block_id]].append(block_id)
+        self.comp_intervals()
+
+    # idom[entry] is None, as for unreachable blocks
+    def comp_idom(self):
+        rank = self.rank
+        idom = [None] * len(self.blocks_cfg)
+        if len(self.order) == 0:
+            self.idom = idom
+            return
+        idom[self.entry] = self.entry
+        changed = True
+        while changed:
+            changed = False
+            for block_id in self.order[1:]:
+                new_idom = None
+                for pred_id in self.blocks_cfg[block_id]['pred']:
+                    if idom[pred_id] is None:
+                        continue
+                    if new_idom is None:
+                        new_idom = pred_id
+                        continue
+                    # walk both fingers up to the common dominator
+                    finger1, finger2 = pred_id, new_idom
+                    while finger1 != finger2:
+                        while rank[finger1] > rank[finger2]:
+                            finger1 = idom[finger1]
+                        while rank[finger2] > rank[finger1]:
+                            finger2 = idom[finger2]
+                    new_idom = finger1
+                if idom[block_id] != new_idom:
+                    idom[block_id] = new_idom
+                    changed = True
+        idom[self.entry] = None
+        self.idom = idom
+
+    # preorder entry/exit numbers of each block in the dominator tree
+    def comp_intervals(self):
+        self.pre = [None] * len(self.blocks_cfg)
+        self.post = [None] * len(self.blocks_cfg)
+        if len(self.order) == 0:
+            return
+        clock = 0
+        stack = [(self.entry, iter(self.children[self.entry]))]
+        self.pre[self.entry] = clock
+        while len(stack) > 0:
+            block_id, children = stack[-1]
+            for child_id in children:
+                clock += 1
+                self.pre[child_id] = clock
+                stack.append((child_id, iter(self.children[child_id])))
+                break
+            else:
+                stack.pop()
+                clock += 1
+                self.post[block_id] = clock
+
+    def reachable(self, block_id):
+        return self.rank[block_id] is not None
+
+    # does a dominate b (a block dominates itself)
+    def dominates(self, a, b):
+        if a == b:
+            return True
+        if self.pre[a] is None or self.pre[b] is None:
+            return False
+        return self.pre[a] <= self.pre[b] and self.post[b] <= self.post[a]
+
+    def strictly_dominates(self, a, b):
+        return a != b and self.dominates(a, b)
+
+    # all dominators of a block, itself included
+    def dominators(self, block_id):
+        doms = {block_id}
+        while self.idom[block_id] is not None:
+            block_id = self.idom[block_id]
+            doms.add(block_id)
+        return doms
+
+    # dominance frontier as {block: [join blocks]}, only blocks with a
+    # non-empty frontier are keys, join blocks are in block order
+    # walk up from each pred of a join until its idom, loop headers end up
+    # in their own frontier
+    def frontier(self):
+        dom_frontier = {}
+        for block_id in range(len(self.blocks_cfg)):
+            if not self.reachable(block_id):
+                continue
+            for pred_id in self.blocks_cfg[block_id]['pred']:
+                if not self.reachable(pred_id):
+                    continue
+                runner = pred_id
+                while runner is not None and runner != self.idom[block_id]:
+                    join_blocks = dom_frontier.setdefault(runner, [])
+                    if len(join_blocks) == 0 or join_blocks[-1] != block_id:
+                        join_blocks.append(block_id)
+                    runner = self.idom[runner]
+        return dom_frontier
@@ -1,32 +1,28 @@
 import json
 import sys
-from block_gen import block_gen
+from tasks.task1.block_gen import block_gen
+from tasks.lib.dominators import DomTree
+from tasks.lib.def_use import DefUse
 
-# do a single pass for global dead code elimination
-def g_dce_single(fn):
-    # Arg set and dest set
-    arg_set = set()
-    dest_set = set()
-    # Skim the function for args and dests
-    for instr in fn["instrs"]:
-        if "args" in instr:
-            arg_set.update(instr["args"])
-        if "dest" in instr:
-            dest_set.add(instr["dest"])
-    # Variable not used
-    unused_set = dest_set - arg_set
-    # Remove unused variables
-    fn["instrs"] = [instr for instr in fn["instrs"] if instr.get("dest") not in unused_set]
-    # return the size of unused_set
-    return len(unused_set)
-
-# passes for global dead code elimination
+# global dead code elimination
+# a var with no users has its defs removed, which drops the uses of their
+# args, and an arg left with no users is removed in turn, so every instr
+# is looked at once instead of sweeping the function until nothing changes
+# returns the number of instrs removed
 def g_dce(fn):
-    # call g_dce_single until no more unused variables
-    count = 0
-    while g_dce_single(fn):
-        count += 1
-    return count
+    def_use = DefUse([fn["instrs"]])
+    worklist = [var for var in def_use.defs if len(def_use.users(var)) == 0]
+    dead = set()
+    while len(worklist) > 0:
+        var = worklist.pop()
+        for instr in list(def_use.defs.get(var, [])):
+            dead.add(id(instr))
+            def_use.remove(instr)
+            for arg in instr.get("args", []):
+                if arg in def_use.defs and len(def_use.users(arg)) == 0:
+                    worklist.append(arg)
+    fn["instrs"] = [instr for instr in fn["instrs"] if id(instr) not in dead]
+    return len(dead)
 
 # do a single pass for local dead code elimination
 def l_dce_single(block):
@@ -71,11 +67,134 @@ def l_dce(fn):
     fn["instrs"] = [inst for block in blocks for inst in block]
     return count
 
+# cfg edges of block_gen blocks: (succ lists, label -> block), a block
+# that returns or falls off the end of the function goes to exit (the
+# extra node len(blocks))
+def cfg_edges(blocks):
+    exit_id = len(blocks)
+    labels = {}
+    for block_id, block in enumerate(blocks):
+        if 'label' in block[0]:
+            labels[block[0]['label']] = block_id
+    succ = []
+    for block_id, block in enumerate(blocks):
+        last = block[-1]
+        if last.get('op') in ('br', 'jmp'):
+            succ.append([labels[label] for label in last['labels']])
+        elif last.get('op') == 'ret' or block_id + 1 == len(blocks):
+            succ.append([exit_id])
+        else:
+            succ.append([block_id + 1])
+    return succ, labels
+
+# ops kept for their effect even when no one reads their dest
+EFFECT_OPS = {'call'}
+
+# aggressive dead code elimination: mark from the effect instrs (print,
+# store, call, ret ...) backwards along the defs of their args and the
+# branches their blocks are control dependent on, then sweep whatever was
+# not marked, each instr is marked at most once
+# control dependence is the dominance frontier of the reverse cfg, a dead
+# br becomes a jmp to its immediate post-dominator (or a ret when that is
+# the exit), since nothing live sits in between
+# returns the number of instrs removed
+def adce(fn):
+    blocks = block_gen(fn)
+    if len(blocks) == 0:
+        return 0
+    succ, labels = cfg_edges(blocks)
+    exit_id = len(blocks)
+    # reverse cfg, rooted at exit
+    rev_cfg = [{'pred': [], 'succ': []} for _ in range(exit_id + 1)]
+    for block_id, succ_ids in enumerate(succ):
+        for succ_id in succ_ids:
+            rev_cfg[succ_id]['succ'].append(block_id)
+            rev_cfg[block_id]['pred'].append(succ_id)
+    post_dom = DomTree(rev_cfg, entry=exit_id)
+    # block -> the blocks whose branch decides whether it runs
+    control_deps = post_dom.frontier()
+    # a block that never reaches the exit has no post-dominator to jump
+    # to, keep every branch then
+    keep_branches = not all(post_dom.reachable(block_id) for block_id in range(exit_id))
+
+    # var -> the instrs writing it (not ssa, so every def of a name)
+    defs = {}
+    block_of = {}
+    for block_id, block in enumerate(blocks):
+        for instr in block:
+            block_of[id(instr)] = block_id
+            if 'dest' in instr:
+                defs.setdefault(instr['dest'], []).append(instr)
+
+    marked = set()
+    live_blocks = set()
+    worklist = []
+    def mark(instr):
+        if id(instr) not in marked:
+            marked.add(id(instr))
+            worklist.append(instr)
+    # a live block keeps the branches that decide whether it runs
+    def mark_block(block_id):
+        if block_id in live_blocks:
+            return
+        live_blocks.add(block_id)
+        for dep_id in control_deps.get(block_id, []):
+            if dep_id != exit_id and blocks[dep_id][-1].get('op') == 'br':
+                mark(blocks[dep_id][-1])
+    for block in blocks:
+        for instr in block:
+            op = instr.get('op')
+            if op is None or op == 'jmp':
+                continue
+            if op in EFFECT_OPS or ('dest' not in instr and (op != 'br' or keep_branches)):
+                mark(instr)
+    while len(worklist) > 0:
+        instr = worklist.pop()
+        for arg in instr.get('args', []):
+            for def_instr in defs.get(arg, []):
+                mark(def_instr)
+        # a phi needs the edges from its preds: the preds have to run and
+        # a pred's br picks the edge, whether the pred ends in br or jmp
+        if instr.get('op') == 'phi':
+            for label in instr['labels']:
+                pred_id = labels.get(label)
+                if pred_id is None:
+                    continue
+                mark_block(pred_id)
+                if blocks[pred_id][-1].get('op') == 'br':
+                    mark(blocks[pred_id][-1])
+        mark_block(block_of[id(instr)])
+
+    # sweep: labels and jmps stay, dead brs jump past their region
+    count = 0
+    for block_id, block in enumerate(blocks):
+        new_block = []
+        for instr in block:
+            op = instr.get('op')
+            if op is None or op == 'jmp' or id(instr) in marked:
+                new_block.append(instr)
+            elif op == 'br':
+                target = post_dom.idom[block_id]
+                if target == exit_id:
+                    new_block.append({'op': 'ret'})
+                else:
+                    new_block.append({'labels': [blocks[target][0]['label']], 'op': 'jmp'})
+                count += 1
+            else:
+                count += 1
+        blocks[block_id] = new_block
+    fn["instrs"] = [inst for block in blocks for inst in block]
+    return count
+
 
 if __name__ == "__main__":
+    # python -m tasks.task1.dce [--adce]
     prog = json.load(sys.stdin)
     # Analyze the program per-func
     for fn in prog["functions"]:
+        if '--adce' in sys.argv[1:]:
+            adce(fn)
+            continue
         while g_dce(fn) or l_dce(fn):
             pass
 
@@ -1,6 +1,6 @@
 import json
 import sys
-from block_gen import block_gen
+from tasks.task1.block_gen import block_gen
 
 COMMUTATIVE_OPS = ['add', 'mul', 'sub', 'eq']
 
@@ -1,6 +1,7 @@
 import json
 import sys
-from block_gen import block_gen
+from tasks.task2.block_gen import block_gen
+from tasks.lib.bv_dataflow import Universe, Worklist, solve, gen_kill
 
 DEBUG = False
 
@@ -148,7 +149,7 @@ def t_cpf(fn):
             block['in'].append({})
         block['out'].append({})
     # initialize worklist
-    worklist = [0]
+    worklist = Worklist([0])
     while len(worklist) > 0:
         block_id = worklist.pop()
         # print(f"-----Block {block_id}-----")
@@ -158,46 +159,20 @@ def t_cpf(fn):
         if dest2val != blocks_cfg[block_id]['out'][0]:
             # print(f"not equal {dest2val} {blocks_cfg[block_id]['out'][0]}")
             for succ_id in blocks_cfg[block_id]['succ']:
-                if succ_id not in worklist:
-                    worklist.append(succ_id)
+                worklist.push(succ_id)
                 blocks_cfg[succ_id]['in'][blocks_cfg[succ_id]['pred'].index(block_id)] = dest2val
             blocks_cfg[block_id]['out'][0] = dest2val
         else:
             # if succ has not been touched, add to worklist
             for succ_id in blocks_cfg[block_id]['succ']:
-                if succ_id not in worklist and blocks_cfg[succ_id]['touch'] == 0:
-                    worklist.append(succ_id)
+                if blocks_cfg[succ_id]['touch'] == 0:
+                    worklist.push(succ_id)
         # print(block_id)
         # print(dest2val)
         # print(worklist)
         # print('-------------------------')
     fn["instrs"] = [inst for block in blocks for inst in block]
 
-# trivial live variable analysis for one block
-def t_lva_single(block, used_set):
-    if DEBUG:
-        print(f"initial used_set: {used_set}")
-    # iterate inst in one local block (reverse order)
-    for inst_idx in reversed(range(len(block))):
-        inst = block[inst_idx]
-        if DEBUG:
-            print(f"[+] inst dut: {inst}")
-        # check dest variable
-        # new definition -> clear used_set
-        dest = inst.get('dest')
-        if dest is not None:
-            used_set.discard(dest)
-            if DEBUG:
-                print(f"[++] discard {dest}")
-        # check args variables
-        # args -> used -> add to used_set
-        if 'args' in inst:
-            for arg in inst['args']:
-                used_set.add(arg)
-                if DEBUG:
-                    print(f"[++] add {arg}")
-    return used_set
-
 # trivial local dead code elimination for one block
 def l_dce_single(block, used_set):
     # delete inst list
@@ -224,48 +199,41 @@ def l_dce_single(block, used_set):
     block = [inst for idx, inst in enumerate(block) if idx not in del_list]
     return block, len(del_list)
 
-# trivial live variable analysis
-def t_lva(block):
+# use (gen) and def (kill) bit-vectors of one block for liveness
+def t_lva_gen_kill(block, variables):
+    use_bits = 0
+    def_bits = 0
+    # iterate inst in one local block (reverse order)
+    for inst in reversed(block):
+        dest = inst.get('dest')
+        if dest is not None:
+            dest_bit = variables.bit(dest)
+            def_bits |= dest_bit
+            use_bits &= ~dest_bit
+        if 'args' in inst:
+            use_bits |= variables.bits(inst['args'])
+    return use_bits, def_bits
+
+# trivial live variable analysis (on bit-vectors)
+def t_lva(fn):
     # interate blocks
     blocks, blocks_cfg = block_gen(fn)
-    # initialize in and out table
-    for block in blocks_cfg:
-        for _ in range(len(block['succ'])):
-            block['out'].append(set())
-        block['in'].append(set())
-    # initialize worklist
-    worklist = []
-    # print(blocks_cfg)
-    for block_idx in range(len(blocks_cfg)):
-        block = blocks_cfg[block_idx]
-        if len(block['succ']) == 0:
-            worklist.append(block_idx)
-    # print(worklist)
-    while len(worklist) > 0:
-        block_id = worklist.pop()
+    # number variables once
+    variables = Universe()
+    gen = []
+    kill = []
+    for block in blocks:
+        use_bits, def_bits = t_lva_gen_kill(block, variables)
+        gen.append(use_bits)
+        kill.append(def_bits)
+    live_in, live_out = solve(blocks_cfg, gen_kill(gen, kill), forward=False)
+    # keep the result in in and out table
+    for block_id in range(len(blocks_cfg)):
+        blocks_cfg[block_id]['in'] = [variables.to_set(live_in[block_id])]
+        blocks_cfg[block_id]['out'] = [variables.to_set(live_out[block_id])]
         if DEBUG:
             print(f"-----Block {block_id}-----")
             print(f"out: {blocks_cfg[block_id]['out']}")
-        used_set = t_lva_single(blocks[block_id], union_sets(blocks_cfg[block_id]['out']))
-        if DEBUG:
-            print(f"used_set: {used_set}")
-        blocks_cfg[block_id]['touch'] += 1
-        # if in changed, update pred
-        if used_set != blocks_cfg[block_id]['in'][0]:
-            # print(f"not equal {used_set} {blocks_cfg[block_id]['in'][0]}")
-            for pred_id in blocks_cfg[block_id]['pred']:
-                if pred_id not in worklist:
-                    worklist.append(pred_id)
-                blocks_cfg[pred_id]['out'][blocks_cfg[pred_id]['succ'].index(block_id)] = used_set
-            blocks_cfg[block_id]['in'][0] = used_set
-        else:
-            # if pred has not been touched, add to worklist
-            for pred_id in blocks_cfg[block_id]['pred']:
-                if pred_id not in worklist and blocks_cfg[pred_id]['touch'] == 0:
-                    worklist.append(pred_id)
-        if DEBUG:
-            print(f"worklist: {worklist}")
-            print('-------------------------')
 
     # local dead code elimination
     if DEBUG:
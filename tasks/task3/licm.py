@@ -1,65 +1,26 @@
 import json
 import sys
-import copy
-from block_gen import block_gen
+from tasks.task3.block_gen import block_gen
+from tasks.lib.def_use import DefUse
+from tasks.lib.dominators import DomTree
 
-def intersect_sets(sets, pos=False):
-    if len(sets) == 0:
-        return set()
-    # pick a non-empty set
-    intersect_items = set()
-    for s in sets:
-        if len(s) > 0:
-            intersect_items = copy.deepcopy(s)
-            break
-    for s in sets:
-        if pos and len(s) == 0:
-            continue
-        intersect_items.intersection_update(s)
-    return intersect_items
-
-# compute dominance
+# compute dominance, returns the dominator tree
 def comp_dom(blocks_cfg):
-    # initialize dom frontier
-    worklist = [0]
-    for block_id in range(len(blocks_cfg)):
-        block = blocks_cfg[block_id]
-        block['out'].append(set())
-        len_pred = len(block['pred'])
-        for _ in range(len_pred):
-            block['in'].append(set())
-    
-    while len(worklist) > 0:
-        block_id = worklist.pop(0)
-        if DEBUG:
+    dom_tree = DomTree(blocks_cfg)
+    if DEBUG:
+        for block_id in range(len(blocks_cfg)):
             print(f"-----Block {block_id} ({blocks_cfg[block_id].get('label')})-----")
-            print(f"init_in: {blocks_cfg[block_id]['in']}")
-            print(f"init_out: {blocks_cfg[block_id]['out']}")
-        # compute out
-        out_set = intersect_sets(blocks_cfg[block_id]['in'], pos=False)
-        # all blocks are dominated by itself
-        out_set.add(block_id)
-        if DEBUG:
-            print(f"result_out: {out_set}")
-        # if out changed, update succ
-        if out_set != blocks_cfg[block_id]['out'][0]:
-            blocks_cfg[block_id]['out'][0] = out_set
-            for succ_id in blocks_cfg[block_id]['succ']:
-                blocks_cfg[succ_id]['in'][blocks_cfg[succ_id]['pred'].index(block_id)] = out_set
-                if succ_id not in worklist:
-                    worklist.append(succ_id)
-        if DEBUG:
-            print(f"worklist: {worklist}")
-            print('-------------------------')
+            print(f"idom: {dom_tree.idom[block_id]}")
+    return dom_tree
 
 # find all natural loops
 def find_loops(fn):
     blocks, blocks_cfg = block_gen(fn, dummy=False)
 
-    # compute dominance (result is kept in blocks_cfg)
+    # compute dominance
     if DEBUG:
         print("############Compute Dominance############")
-    comp_dom(blocks_cfg)
+    dom_tree = comp_dom(blocks_cfg)
 
     # search for back edges
     if DEBUG:
@@ -70,12 +31,12 @@ def find_loops(fn):
         if DEBUG:
             print(f"-----Block {block_id} ({block.get('label')})-----")
             print(f"succ: {block['succ']}")
-            print(f"out: {block['out']}")
+            print(f"idom: {dom_tree.idom[block_id]}")
             print("-------------------------")
         # search for succesor that dominates the block
         count = 0
         for succ_id in block['succ']:
-            if succ_id in block['out'][0]:
+            if dom_tree.dominates(succ_id, block_id):
                 back_edges.append((succ_id, block_id))
                 count += 1
         assert count <= 1, "Multiple back edges detected"
@@ -93,7 +54,11 @@ def find_loops(fn):
         loop = {}
         # find the pre-header
         # preheader is the only predecessor of the header
-        assert len(blocks_cfg[back_edge[0]]['pred']) == 2, "Multiple pre-header detected"
+        # skip loops entered from several blocks (no single pre-header)
+        if len(blocks_cfg[back_edge[0]]['pred']) != 2:
+            if DEBUG:
+                print(f"Multiple pre-header detected, skip {back_edge}")
+            continue
         preheader_idx = (blocks_cfg[back_edge[0]]['pred'].index(back_edge[1]) + 1) % 2
         loop['preheader'] = blocks_cfg[back_edge[0]]['pred'][preheader_idx]
         back = back_edge[1]
@@ -117,7 +82,7 @@ def find_loops(fn):
             block = blocks_cfg[header_can]
             for succ_id in block['succ']:
                 if succ_id not in loop['nodes']:
-                    if header_can in blocks_cfg[succ_id]['out'][0]:
+                    if dom_tree.dominates(header_can, succ_id):
                         if DEBUG:
                             print(f"Header: {header_can}({block.get('label')})")
                             print(f"Exit: {succ_id}({blocks_cfg[succ_id].get('label')})")
@@ -131,47 +96,49 @@ def find_loops(fn):
         loops.append(loop)
         if DEBUG:
             print(f"Loop: {loop}")
-    return loops, blocks, blocks_cfg
+    return loops, blocks, blocks_cfg, dom_tree
 
 # find loop invariant code
-def find_loop_invariant(loop, blocks):
-    # first pass: collect all args and dest
-    args_set = set()
+# an instr with args is invariant once every arg defined in the loop is,
+# pending counts the arg occurrences still waiting, and when a var turns
+# invariant only its users (from def_use) are revisited
+def find_loop_invariant(loop, blocks, def_use):
+    # first pass: collect the dests and the instrs of the loop
     dest_set = set()
+    loop_insts = []
     for block_id in loop['nodes']:
-        block = blocks[block_id]
-        for inst in block:
+        for inst in blocks[block_id]:
             if 'op' in inst:
+                loop_insts.append(inst)
                 if 'dest' in inst:
                     dest_set.add(inst['dest'])
-                if 'args' in inst:
-                    args_set.update(inst['args'])
     if DEBUG:
-        print(f"args_set: {args_set}")
         print(f"dest_set: {dest_set}")
-    # second pass: find loop invariant
+    # id(inst) -> args defined in the loop and not known invariant
+    pending = {}
+    worklist = []
+    for inst in loop_insts:
+        if 'args' not in inst:
+            continue
+        pending[id(inst)] = sum(1 for arg in inst['args'] if arg in dest_set)
+        if pending[id(inst)] == 0 and 'dest' in inst:
+            worklist.append(inst)
+    # second pass: propagate along the uses
     loop_invariant_set = set()
-    update_flag = True
-    while update_flag:
-        update_flag = False
-        for block_id in loop['nodes']:
-            block = blocks[block_id]
-            for inst in block:
-                if 'op' in inst:
-                    # if arg not in dest_set (defined outside the loop)
-                    # if arg is in the loop invariant set
-                    invariant_flag = True
-                    if 'args' in inst:
-                        for arg in inst['args']:
-                            if arg in dest_set and arg not in loop_invariant_set:
-                                invariant_flag = False
-                                break
-                        if invariant_flag and 'dest' in inst \
-                            and inst['dest'] not in loop_invariant_set:
-                            loop_invariant_set.add(inst['dest'])
-                            update_flag = True
-                            if DEBUG:
-                                print(f"Add loop invariant: {inst['dest']}")
+    while len(worklist) > 0:
+        dest = worklist.pop()['dest']
+        if dest in loop_invariant_set:
+            continue
+        loop_invariant_set.add(dest)
+        if DEBUG:
+            print(f"Add loop invariant: {dest}")
+        for user in def_use.users(dest):
+            # users outside the loop have no count
+            if id(user) not in pending:
+                continue
+            pending[id(user)] -= 1
+            if pending[id(user)] == 0 and 'dest' in user:
+                worklist.append(user)
     if DEBUG:
         print(f"Loop invariant: {loop_invariant_set}")
 
@@ -179,16 +146,25 @@ def find_loop_invariant(loop, blocks):
 
 # loop invariant code motion
 def licm(fn):
-    loops, blocks, blocks_cfg = find_loops(fn)
+    loops, blocks, blocks_cfg, dom_tree = find_loops(fn)
+    def_use = DefUse(blocks)
     for loop in loops:
         if DEBUG:
             print(f"-----Loop {loop}-----")
-        loop_invariant_set = find_loop_invariant(loop, blocks)
+        loop_invariant_set = find_loop_invariant(loop, blocks, def_use)
+        # ssa_to.py strips the version suffix, so a def whose base name is
+        # defined again in the loop has to stay where it is
+        raw_count = {}
+        for block_id in loop['nodes']:
+            for inst in blocks[block_id]:
+                if 'dest' in inst:
+                    raw_dest = inst['dest'].split('.')[0]
+                    raw_count[raw_dest] = raw_count.get(raw_dest, 0) + 1
         # hoist loop invariant code
         hoisted_inst = []
         for block_id in loop['nodes']:
             # check if this block dominates the exit
-            if block_id not in blocks_cfg[loop['exit']]['out'][0]:
+            if not dom_tree.dominates(block_id, loop['exit']):
                 if DEBUG:
                     print(f"Block {block_id}({blocks_cfg[block_id]['label']}) does not dominate the exit")
                 continue
@@ -196,6 +172,8 @@ def licm(fn):
             del_list = []
             for inst_idx, inst in enumerate(block):
                 if 'op' in inst and inst.get('dest') in loop_invariant_set:
+                    if raw_count[inst['dest'].split('.')[0]] > 1:
+                        continue
                     hoisted_inst.append(inst)
                     del_list.append(inst_idx)
                     if DEBUG:
@@ -1,7 +1,6 @@
 import json
 import sys
-import copy
-from block_gen import block_gen
+from tasks.task3.block_gen import block_gen
 
 
 def t_ssa_to(fn):
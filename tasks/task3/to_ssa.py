@@ -1,7 +1,8 @@
 import json
 import sys
-import copy
-from block_gen import block_gen
+from tasks.task3.block_gen import block_gen
+from tasks.lib.bv_dataflow import Worklist, rpo_rank
+from tasks.lib.dominators import DomTree
 
 COMMUTATIVE_OPS = ['add', 'mul', 'sub', 'eq']
 BAD_CONST_OPS = ['call', 'ret', 'print']
@@ -38,7 +39,7 @@ def merge_dicts(dicts, pos=False, loose=False):
             common_items = set(d.items())
             common_keys = set(d.keys())
             break
-    all_keys = copy.deepcopy(common_keys)
+    all_keys = set(common_keys)
     # print(common_items)
     for d in dicts:
         if pos and len(d) == 0:
@@ -56,21 +57,6 @@ def merge_dicts(dicts, pos=False, loose=False):
                 break
     return dict(common_items)
 
-def intersect_sets(sets, pos=False):
-    if len(sets) == 0:
-        return set()
-    # pick a non-empty set
-    intersect_items = set()
-    for s in sets:
-        if len(s) > 0:
-            intersect_items = copy.deepcopy(s)
-            break
-    for s in sets:
-        if pos and len(s) == 0:
-            continue
-        intersect_items.intersection_update(s)
-    return intersect_items
-
 def union_sets(sets):
     if len(sets) == 0:
         return set()
@@ -81,48 +67,11 @@ def union_sets(sets):
 
 # trivial dominator frontier for blocks
 def t_dom_frontier(blocks_cfg):
-    # initialize dom frontier
-    worklist = [0]
-    for block_id in range(len(blocks_cfg)):
-        block = blocks_cfg[block_id]
-        block['out'].append(set())
-        len_pred = len(block['pred'])
-        for _ in range(len_pred):
-            block['in'].append(set())
-    
-    while len(worklist) > 0:
-        block_id = worklist.pop(0)
-        if DEBUG:
-            print(f"-----Block {block_id} ({blocks_cfg[block_id].get('label')})-----")
-            print(f"init_in: {blocks_cfg[block_id]['in']}")
-            print(f"init_out: {blocks_cfg[block_id]['out']}")
-        # compute out
-        out_set = intersect_sets(blocks_cfg[block_id]['in'], pos=False)
-        # all blocks are dominated by itself
-        out_set.add(block_id)
-        if DEBUG:
-            print(f"result_out: {out_set}")
-        # if out changed, update succ
-        if out_set != blocks_cfg[block_id]['out'][0]:
-            blocks_cfg[block_id]['out'][0] = out_set
-            for succ_id in blocks_cfg[block_id]['succ']:
-                blocks_cfg[succ_id]['in'][blocks_cfg[succ_id]['pred'].index(block_id)] = out_set
-                if succ_id not in worklist:
-                    worklist.append(succ_id)
-        if DEBUG:
-            print(f"worklist: {worklist}")
-            print('-------------------------')
-
-    # generate dom frontier
-    dom_frontier = {}
-    for block_id in range(len(blocks_cfg)):
-        block = blocks_cfg[block_id]
-        for in_set in block['in']:
-            for in_elem in in_set:
-                if in_elem not in block['out'][0]:
-                    if in_elem not in dom_frontier:
-                        dom_frontier[in_elem] = []
-                    dom_frontier[in_elem].append(block_id)
+    dom_tree = DomTree(blocks_cfg)
+    if DEBUG:
+        for block_id in range(len(blocks_cfg)):
+            print(f"idom {block_id} ({blocks_cfg[block_id].get('label')}): {dom_tree.idom[block_id]}")
+    dom_frontier = dom_tree.frontier()
     if DEBUG:
         print(f"dom_frontier: {dom_frontier}")
     return dom_frontier
@@ -151,22 +100,55 @@ def has_phi(block, var):
                 return instr_id
     return None
 
+# remove trivial phis: a phi whose args are one value (besides its own
+# dest) is a copy of that value, so its uses can read the value instead
+# removing a phi can make the phis using it trivial, repeat until none is
+def t_remove_phis(blocks):
+    replace = {}
+    def find(var):
+        while var in replace:
+            var = replace[var]
+        return var
+    changed = True
+    while changed:
+        changed = False
+        for block in blocks:
+            for instr in block:
+                if instr.get('op') != 'phi' or instr['dest'] in replace:
+                    continue
+                args = {find(arg) for arg in instr['args']} - {instr['dest']}
+                if len(args) == 1:
+                    replace[instr['dest']] = args.pop()
+                    changed = True
+                    if DEBUG:
+                        print(f"Remove {instr['dest']} and keep {replace[instr['dest']]}")
+    # drop them and rename their uses
+    for block_id, block in enumerate(blocks):
+        blocks[block_id] = [instr for instr in block
+                            if instr.get('op') != 'phi' or instr['dest'] not in replace]
+        for instr in blocks[block_id]:
+            if 'args' in instr:
+                instr['args'] = [find(arg) for arg in instr['args']]
+
 # trivial conversion to ssa for one function
 def t_to_ssa(fn):
     # iterate blocks
     blocks, blocks_cfg = block_gen(fn, dummy=True)
 
     # compute dominator frontier
-    dom_frontier = t_dom_frontier(copy.deepcopy(blocks_cfg))
+    dom_frontier = t_dom_frontier(blocks_cfg)
 
     # generate variable -> defined block map
     var2block = t_var2block(blocks)
 
-    # insert phi functionsz
+    # insert phi functions
     var2count = {}
     for var in var2block:
         var2count[var] = 0
-        for def_block, type in var2block[var]:
+        # a phi is a new def, so iterate the frontier with a worklist
+        worklist = Worklist(var2block[var])
+        while len(worklist) > 0:
+            def_block, type = worklist.pop()
             # assign a new name to each def
             for instr in blocks[def_block]:
                 if instr.get('dest') == var:
@@ -186,30 +168,19 @@ def t_to_ssa(fn):
                                                 'labels': [],
                                                 'op': 'phi',
                                                 'type': type})
+                    worklist.push((join_block, type))
     
                 if DEBUG:
                     print(blocks[join_block])
     
     # iterate blocks to rename uses and complete phi functions
-    phi_remove_mode = False
-    worklist = [0]
+    worklist = Worklist([0])
     blocks_cfg[0]['in'].append({})
-    while len(worklist) > 0 or not phi_remove_mode:
-        # start phi remove after worklist is empty
-        if len(worklist) == 0:
-            if DEBUG:
-                print("########Start phi remove########")
-            phi_remove_mode = True
-            # add all nodes
-            for block_idx in range(len(blocks_cfg)):
-                worklist.append(block_idx)
-
-        block_id = worklist.pop(0)
+    while len(worklist) > 0:
+        block_id = worklist.pop()
         block = blocks[block_id]
         blocks_cfg[block_id]['touch'] += 1
         start_dic = merge_dicts(blocks_cfg[block_id]['in'], pos=True, loose=True)
-        if phi_remove_mode:
-            del_list = []
         if DEBUG:
             print(f"-----Block {block_id} ({blocks_cfg[block_id].get('label')})-----")
             print(f"in: {blocks_cfg[block_id]['in']}")
@@ -220,59 +191,24 @@ def t_to_ssa(fn):
                 if instr['op'] == 'phi':
                     # get dest var
                     dest_raw = ''.join(instr['dest'].split('.')[:-1])
-                    if phi_remove_mode:
-                        # check if args change
-                        for label_idx, label in enumerate(instr['labels']):
-                            pred_idx = 0
-                            for pred_block_id in blocks_cfg[block_id]['pred']:
-                                if label == blocks_cfg[pred_block_id]['label']:
-                                    break
-                                pred_idx += 1
-                            new_arg = blocks_cfg[block_id]['in'][pred_idx].get(dest_raw)
-                            if new_arg is None:
-                                instr['args'].pop(label_idx)
-                                instr['labels'].pop(label_idx)
-                            elif new_arg != instr['args'][label_idx]:
-                                instr['args'][label_idx] = new_arg
-                                    
-                        # check pred to see if we could remove phi
-                        if len(instr['args']) == 2:
-                            # check if one of args is the same as dest
-                            if instr['dest'] in instr['args']:
-                                pick_dest = (instr['args'].index(instr['dest']) + 1) % 2
-                                if DEBUG:
-                                    print(f"Remove {instr['dest']} and keep {instr['args'][pick_dest]}")
-                                # replace dest with the other arg
-                                instr['dest'] = instr['args'][pick_dest]
-                                del_list.append(instr_idx)
-                        elif len(instr['args']) == 1:
-                            if DEBUG:
-                                print(f"Remove {instr['dest']} and keep {instr['args'][0]}")
-                            # replace dest with the only arg
-                            instr['dest'] = instr['args'][0]
-                            del_list.append(instr_idx)
-                    else:
-                        # check pred
-                        for pred_idx, pred_block_id in enumerate(blocks_cfg[block_id]['pred']):
-                            # check if already inserted
-                            pred_label = blocks_cfg[pred_block_id].get('label')
-                            if pred_label is None:
-                                print(f"Error: block {pred_block_id} has no label")
-                                exit(1)
-                            if pred_label in instr['labels']:
-                                continue
-                            # get ssa var name
-                            ssa_var = blocks_cfg[block_id]['in'][pred_idx].get(dest_raw)
-                            # pred is not ready
-                            if ssa_var is None:
-                                continue
-                            instr['args'].append(ssa_var)
-                            instr['labels'].append(pred_label)
+                    # check pred
+                    for pred_idx, pred_block_id in enumerate(blocks_cfg[block_id]['pred']):
+                        # check if already inserted
+                        pred_label = blocks_cfg[pred_block_id].get('label')
+                        if pred_label is None:
+                            print(f"Error: block {pred_block_id} has no label")
+                            exit(1)
+                        if pred_label in instr['labels']:
+                            continue
+                        # get ssa var name
+                        ssa_var = blocks_cfg[block_id]['in'][pred_idx].get(dest_raw)
+                        # pred is not ready
+                        if ssa_var is None:
+                            continue
+                        instr['args'].append(ssa_var)
+                        instr['labels'].append(pred_label)
                 else:
                     for arg_idx, arg in enumerate(instr['args']):
-                        if phi_remove_mode:
-                            arg_raw = ''.join(arg.split('.')[:-1])
-                            arg = arg_raw
                         if arg in start_dic:
                             instr['args'][arg_idx] = start_dic[arg]
                             if DEBUG:
@@ -296,12 +232,10 @@ def t_to_ssa(fn):
                     blocks_cfg[succ_id]['in'].append({})
             if blocks_cfg[succ_id]['in'][blocks_cfg[succ_id]['pred'].index(block_id)] != start_dic:
                 blocks_cfg[succ_id]['in'][blocks_cfg[succ_id]['pred'].index(block_id)] = start_dic
-                if succ_id not in worklist:
-                    worklist.append(succ_id)
-        
-        # remove phi instr
-        if phi_remove_mode:
-            blocks[block_id] = [instr for idx, instr in enumerate(block) if idx not in del_list]
+                worklist.push(succ_id)
+
+    # drop the phis that only copy one value
+    t_remove_phis(blocks)
 
     # strip out dummy blocks
     if 'dummy_entry' in blocks_cfg[0]['label']:
@@ -378,12 +312,13 @@ def t_lva(fn):
         for _ in range(len(block['succ'])):
             block['out'].append(set())
         block['in'].append(set())
-    # initialize worklist
-    worklist = []
+    # initialize worklist, visit blocks in postorder
+    _, priority = rpo_rank(blocks_cfg, forward=False)
+    worklist = Worklist(priority=priority)
     for block_idx in range(len(blocks_cfg)):
         block = blocks_cfg[block_idx]
         if len(block['succ']) == 0:
-            worklist.append(block_idx)
+            worklist.push(block_idx)
 
     # big while loop containing both lva and dce
     dce_mode = False
@@ -393,8 +328,7 @@ def t_lva(fn):
             # liveness analysis done, start dce
             dce_mode = True
             # add all nodes
-            for block_idx in range(len(blocks_cfg)):
-                worklist.append(block_idx)
+            worklist.extend(range(len(blocks_cfg)))
 
         block_id = worklist.pop()
 
@@ -413,15 +347,14 @@ def t_lva(fn):
         # if in changed, update pred
         if used_set != blocks_cfg[block_id]['in'][0]:
             for pred_id in blocks_cfg[block_id]['pred']:
-                if pred_id not in worklist:
-                    worklist.append(pred_id)
+                worklist.push(pred_id)
                 blocks_cfg[pred_id]['out'][blocks_cfg[pred_id]['succ'].index(block_id)] = used_set
             blocks_cfg[block_id]['in'][0] = used_set
         else:
             # if pred has not been touched, add to worklist
             for pred_id in blocks_cfg[block_id]['pred']:
-                if pred_id not in worklist and blocks_cfg[pred_id]['touch'] == 0:
-                    worklist.append(pred_id)
+                if blocks_cfg[pred_id]['touch'] == 0:
+                    worklist.push(pred_id)
         if DEBUG:
             print(f"worklist: {worklist}")
             print('-------------------------')
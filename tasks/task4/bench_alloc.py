@@ -0,0 +1,71 @@
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from tasks.task4 import memopt
+from tasks.task4 import to_ssa
+
+# allocation regression benchmark for the dataflow passes
+# python -m tasks.task4.bench_alloc [prog.bril ...]   (default: benchmarks/mem/*.bril)
+# per program: peak traced memory of the to_ssa + memopt passes (both
+# renaming modes), and how many distinct points-to dicts mem_alias ends
+# with for how many blocks (facts are shared until a block changes them)
+
+to_ssa.DEBUG = False
+memopt.DEBUG = False
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'benchmarks', 'mem')
+
+def load(path):
+    with open(path) as bril:
+        return json.loads(subprocess.run(['bril2json'], stdin=bril, capture_output=True,
+                                         text=True, check=True).stdout)
+
+def run_passes(prog, rename):
+    for fn in prog['functions']:
+        cfg = to_ssa.t_to_ssa(fn, rename=rename)
+        to_ssa.t_lvn(fn, cfg)
+        to_ssa.t_lva(fn, cfg)
+        memopt.mem_alias(fn, cfg)
+        cfg.flatten()
+
+# (distinct fact dicts, blocks) of the points-to solution
+def fact_sharing(prog):
+    facts = 0
+    blocks = 0
+    for fn in prog['functions']:
+        cfg = to_ssa.t_to_ssa(fn)
+        ptr_out, _ = memopt.mem_points_to(fn, cfg.blocks, cfg.blocks_cfg)
+        facts += len({id(fact) for fact in ptr_out})
+        blocks += len(ptr_out)
+    return facts, blocks
+
+# (peak traced bytes, seconds) of one run
+def measure(text, rename):
+    prog = json.loads(text)
+    tracemalloc.start()
+    start = time.perf_counter()
+    run_passes(prog, rename)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(BENCH_DIR, '*.bril')))
+    print(f"{'program':<22} {'peak KiB':>9} {'worklist':>9} {'facts':>11} {'time':>8}")
+    totals = [0, 0, 0, 0, 0.0]
+    for path in paths:
+        text = json.dumps(load(path))
+        peak, elapsed = measure(text, 'domtree')
+        worklist_peak, _ = measure(text, 'worklist')
+        facts, blocks = fact_sharing(json.loads(text))
+        name = os.path.basename(path)[:-len('.bril')]
+        print(f"{name:<22} {peak / 1024:9.1f} {worklist_peak / 1024:9.1f} {facts:>5}/{blocks:<5} {elapsed:7.3f}s")
+        for idx, value in enumerate((peak, worklist_peak, facts, blocks, elapsed)):
+            totals[idx] += value
+    print(f"{'total':<22} {totals[0] / 1024:9.1f} {totals[1] / 1024:9.1f} "
+          f"{totals[2]:>5}/{totals[3]:<5} {totals[4]:7.3f}s")
@@ -0,0 +1,95 @@
+import copy
+import json
+import sys
+import time
+from tasks.task4.block_gen import CFG
+from tasks.lib.bv_dataflow import Universe, solve, gen_kill
+from tasks.task4 import memopt
+from tasks.task4 import to_ssa
+from tasks.task4.soa_ir import FnArrays
+
+# compare the struct-of-arrays analyses of soa_ir with the Instr-based ones
+# the passes use, on every function of an ssa program
+#   bril2json < prog.bril | python -m tasks.task4.to_ssa | python -m tasks.task4.bench_soa [repeat]
+
+to_ssa.DEBUG = False
+memopt.DEBUG = False
+
+# liveness as t_lva computes it
+def instr_live_out(cfg):
+    variables = Universe()
+    gen = []
+    kill = []
+    for block in cfg.blocks:
+        use_bits, def_bits = to_ssa.t_lva_gen_kill(block, variables)
+        gen.append(use_bits)
+        kill.append(def_bits)
+    _, live_out = solve(cfg.blocks_cfg, gen_kill(gen, kill), forward=False)
+    return live_out, variables
+
+# best time of repeat runs of run(item) over all items, and the results
+def timed(run, items, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [run(item) for item in items]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+def check(cfgs, arrays, live, soa_live, points_to, soa_points_to, lvn_blocks, soa_redundant):
+    for cfg, fn_arrays, (live_out, variables), soa_out in zip(cfgs, arrays, live, soa_live):
+        assert [variables.to_set(bits) for bits in live_out] == \
+            [fn_arrays.vars.to_set(bits) for bits in soa_out], cfg.fn['name']
+    for cfg, fn_arrays, (ptr_out, _), soa_out in zip(cfgs, arrays, points_to, soa_points_to):
+        names = fn_arrays.vars.items
+        assert ptr_out == [{names[var]: bits for var, bits in facts.items()} for facts in soa_out], cfg.fn['name']
+    # everything soa_ir finds redundant t_lvn turned into a copy or constant
+    for blocks, fn_arrays, found in zip(lvn_blocks, arrays, soa_redundant):
+        instrs = [instr for block in blocks for instr in block if instr.op is not None]
+        for idx in found:
+            assert instrs[idx].op in ('id', 'const'), (fn_arrays.cfg.fn['name'], idx)
+
+if __name__ == "__main__":
+    usage = "usage: bril2json < prog.bril | python -m tasks.task4.to_ssa | python -m tasks.task4.bench_soa [repeat]"
+    if len(sys.argv) > 1 and not sys.argv[1].isdigit():
+        exit(usage)
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    data = sys.stdin.read()
+    if not data.strip():
+        exit(usage)
+    prog = json.loads(data)
+    cfgs = [CFG(fn) for fn in prog['functions']]
+    n_instrs = sum(1 for cfg in cfgs for block in cfg.blocks for instr in block if instr.op is not None)
+    print(f"{len(cfgs)} functions, {n_instrs} instrs, best of {repeat}")
+
+    build_time, arrays = timed(FnArrays, cfgs, repeat)
+    print(f"{'build arrays':<12} {'':>9} {build_time:8.3f}s")
+
+    live_time, live = timed(instr_live_out, cfgs, repeat)
+    soa_live_time, soa_live = timed(FnArrays.live_out, arrays, repeat)
+    print(f"{'liveness':<12} {live_time:8.3f}s {soa_live_time:8.3f}s")
+
+    points_to_time, points_to = timed(lambda cfg: memopt.mem_points_to(cfg.fn, cfg.blocks, cfg.blocks_cfg),
+                                      cfgs, repeat)
+    soa_points_to_time, soa_points_to = timed(FnArrays.points_to, arrays, repeat)
+    print(f"{'points-to':<12} {points_to_time:8.3f}s {soa_points_to_time:8.3f}s")
+
+    # t_lvn rewrites its block, so it gets fresh copies every run
+    lvn_time = None
+    for _ in range(repeat):
+        lvn_blocks = [copy.deepcopy(cfg.blocks) for cfg in cfgs]
+        start = time.perf_counter()
+        for blocks in lvn_blocks:
+            for block in blocks:
+                to_ssa.t_lvn_single(block)
+        elapsed = time.perf_counter() - start
+        lvn_time = elapsed if lvn_time is None else min(lvn_time, elapsed)
+    soa_lvn_time, soa_redundant = timed(
+        lambda fn_arrays: {idx: prev for block_id in range(len(fn_arrays.block_start) - 1)
+                           for idx, prev in fn_arrays.redundant(block_id).items()},
+        arrays, repeat)
+    print(f"{'lvn':<12} {lvn_time:8.3f}s {soa_lvn_time:8.3f}s")
+
+    check(cfgs, arrays, live, soa_live, points_to, soa_points_to, lvn_blocks, soa_redundant)
+    print("results match")
@@ -0,0 +1,103 @@
+import sys
+import time
+from tasks.task4.block_gen import CFG
+from tasks.lib.bv_dataflow import Universe, Worklist, gen_kill, intersect_bits, union_bits, rpo_rank
+
+# compare worklist strategies on a synthetic function
+# python -m tasks.task4.bench_worklist [n_blocks]
+
+# the list worklist the passes used before: pop(0) and list membership
+class ListWorklist:
+    def __init__(self, items=(), priority=None):
+        self.items = list(items)
+
+    def push(self, item):
+        if item not in self.items:
+            self.items.append(item)
+
+    def extend(self, items):
+        for item in items:
+            self.push(item)
+
+    def pop(self):
+        return self.items.pop(0)
+
+    def __len__(self):
+        return len(self.items)
+
+# n blocks in nested loops: every 10 blocks loop back to the group head and
+# every 100 blocks to the outer head, each block reads and writes a few vars
+def gen_fn(n_blocks):
+    instrs = [{'op': 'const', 'dest': 'one', 'type': 'int', 'value': 1},
+              {'op': 'const', 'dest': 'x', 'type': 'int', 'value': 0}]
+    for i in range(n_blocks):
+        instrs.append({'label': f"b{i}"})
+        instrs.append({'op': 'add', 'dest': f"v{i % 50}", 'type': 'int', 'args': ['x', 'one']})
+        instrs.append({'op': 'add', 'dest': 'x', 'type': 'int', 'args': ['x', f"v{(i + 7) % 50}"]})
+        instrs.append({'op': 'lt', 'dest': 'c', 'type': 'bool', 'args': ['x', 'one']})
+        if i == n_blocks - 1:
+            instrs.append({'op': 'print', 'args': ['x']})
+        elif i % 100 == 99:
+            instrs.append({'op': 'br', 'args': ['c'], 'labels': [f"b{i - 99}", f"b{i + 1}"]})
+        elif i % 10 == 9:
+            instrs.append({'op': 'br', 'args': ['c'], 'labels': [f"b{i - 9}", f"b{i + 1}"]})
+        else:
+            instrs.append({'op': 'jmp', 'labels': [f"b{i + 1}"]})
+    return {'name': 'main', 'instrs': instrs}
+
+# same loop as bv_dataflow.solve, with the worklist type as a parameter
+def fixpoint(blocks_cfg, transfer, make_worklist, forward, meet, init, use_priority):
+    in_edges, out_edges = ('pred', 'succ') if forward else ('succ', 'pred')
+    order, priority = rpo_rank(blocks_cfg, forward=forward)
+    in_ = [init] * len(blocks_cfg)
+    out = [init] * len(blocks_cfg)
+    worklist = make_worklist(order, priority if use_priority else None)
+    visits = 0
+    while len(worklist) > 0:
+        block_id = worklist.pop()
+        visits += 1
+        facts = [out[other] for other in blocks_cfg[block_id][in_edges]]
+        in_[block_id] = meet(facts) if len(facts) > 0 else 0
+        fact = transfer(block_id, in_[block_id])
+        if fact != out[block_id]:
+            out[block_id] = fact
+            worklist.extend(blocks_cfg[block_id][out_edges])
+    return out, visits
+
+def problems(blocks, blocks_cfg):
+    # liveness
+    variables = Universe()
+    gen = []
+    kill = []
+    for block in blocks:
+        used = 0
+        defined = 0
+        for instr in block:
+            for arg in instr.args or ():
+                if not defined & variables.bit(arg):
+                    used |= variables.bit(arg)
+            if instr.dest is not None:
+                defined |= variables.bit(instr.dest)
+        gen.append(used)
+        kill.append(defined)
+    yield 'liveness', gen_kill(gen, kill), False, union_bits, 0
+    # dominators
+    full = (1 << len(blocks_cfg)) - 1
+    yield 'dominators', lambda block_id, fact: fact | (1 << block_id), True, intersect_bits, full
+
+if __name__ == "__main__":
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    cfg = CFG(gen_fn(n_blocks))
+    print(f"{n_blocks} blocks")
+    strategies = [('list pop(0)', ListWorklist, False),
+                  ('Worklist fifo', Worklist, False),
+                  ('Worklist rpo', Worklist, True)]
+    for name, transfer, forward, meet, init in problems(cfg.blocks, cfg.blocks_cfg):
+        results = []
+        for label, make_worklist, use_priority in strategies:
+            start = time.perf_counter()
+            out, visits = fixpoint(cfg.blocks_cfg, transfer, make_worklist, forward, meet, init, use_priority)
+            elapsed = time.perf_counter() - start
+            results.append(out)
+            print(f"{name:<12} {label:<14} {elapsed:8.3f}s {visits:8d} visits")
+        assert all(out == results[0] for out in results)
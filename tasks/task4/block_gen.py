@@ -1,10 +1,12 @@
 import json
 import sys
+from tasks.task4.bril_ir import Instr, Label, from_json, to_json
 
 TERMINATORS = 'br', 'jmp', 'ret'
 
-# generate basic blocks
-def block_gen(fn, dummy=False):
+# generate basic blocks from a list of Instr/Label (changed in place)
+# fn_args are the function's json args, copied into a dummy entry block
+def block_gen(instrs, fn_args=None, dummy=False):
     blocks = []
     block_idx = 0
     label2pred = {}
@@ -13,33 +15,28 @@ def block_gen(fn, dummy=False):
     cur_block = []
     cur_block_cfg = {'pred': [], 'succ': [], 'touch': 0, 'in': [], 'out': []}
     # insert a label if the first instr is not a label
-    if 'op' in fn['instrs'][0]:
-        fn['instrs'].insert(0, {'label': 'entry'})
+    if instrs[0].op is not None:
+        instrs.insert(0, Label('entry'))
 
     # add args to the first block
-    if dummy and 'args' in fn:
-        fn['instrs'].insert(0, {'label': 'dummy_entry'})
-        if 'args' in fn:
-            for arg in fn['args']:
-                fn['instrs'].insert(1,
-                                    {'args': [arg['name']],
-                                    'dest': arg['name'],
-                                    'op': 'id',
-                                    'type': arg['type']})
+    if dummy and fn_args is not None:
+        instrs.insert(0, Label('dummy_entry'))
+        for arg in fn_args:
+            instrs.insert(1, Instr('id', arg['name'], arg['type'], (arg['name'],)))
     # iterate inst
-    for instr in fn["instrs"]:
-        if 'op' in instr:
+    for instr in instrs:
+        if instr.op is not None:
             # check if op is the first in the block
             # then drop it
             # every block starts with a label
             if len(cur_block) == 0:
                 continue
             # terminator, add to current block and start a new
-            if instr['op'] in TERMINATORS:
+            if instr.op in TERMINATORS:
                 # check terminator
-                if instr['op'] in ['br', 'jmp']:
+                if instr.op in ['br', 'jmp']:
                     # iter labels
-                    for label in instr['labels']:
+                    for label in instr.labels:
                         # add to label2pred
                         if label not in label2pred:
                             label2pred[label] = []
@@ -77,7 +74,7 @@ def block_gen(fn, dummy=False):
             else:
                 cur_block.append(instr)
 
-            cur_label = instr['label']
+            cur_label = instr.label
             cur_block_cfg['label'] = cur_label
             # add to label2succ
             if cur_label not in label2succ:
@@ -93,20 +90,65 @@ def block_gen(fn, dummy=False):
     if len(cur_block) > 0:
         blocks.append(cur_block)
         blocks_cfg.append(cur_block_cfg)
-    
+
+    index_edges(blocks_cfg)
     return blocks, blocks_cfg
 
+# index the cfg edges
+# each block gets 'succ_slot' (parallel to 'succ') with its slot in the succ's
+# pred/in lists and 'pred_slot' (parallel to 'pred') with the position of the
+# block in the pred's succ/out lists, so passes never search pred/succ lists
+def index_edges(blocks_cfg):
+    # (src, dst) -> unmatched slots in dst's pred, duplicates come from 'br c .l .l'
+    pred_slots = {}
+    for dst, block in enumerate(blocks_cfg):
+        block['pred_slot'] = [None] * len(block['pred'])
+        for slot, src in enumerate(block['pred']):
+            pred_slots.setdefault((src, dst), []).append(slot)
+    for src, block in enumerate(blocks_cfg):
+        block['succ_slot'] = []
+        for succ_idx, dst in enumerate(block['succ']):
+            slot = pred_slots[(src, dst)].pop(0)
+            block['succ_slot'].append(slot)
+            blocks_cfg[dst]['pred_slot'][slot] = succ_idx
+
+# function-level cfg shared by a pipeline of passes
+# blocks hold bril_ir Instr/Label objects made from fn['instrs'] (or the
+# given instrs), passes edit them in place and fn['instrs'] is only
+# rebuilt as json dicts by flatten()
+# a pass that changes control flow must hand back a new CFG
+class CFG:
+    def __init__(self, fn, dummy=False, instrs=None):
+        self.fn = fn
+        if instrs is None:
+            instrs = [from_json(instr) for instr in fn['instrs']]
+        self.blocks, self.blocks_cfg = block_gen(instrs, fn.get('args'), dummy=dummy)
+
+    # clear the in/out/touch state left by the previous pass
+    def reset(self):
+        for block in self.blocks_cfg:
+            block['in'] = []
+            block['out'] = []
+            block['touch'] = 0
+        return self.blocks, self.blocks_cfg
+
+    def instrs(self):
+        return [inst for block in self.blocks for inst in block]
+
+    def flatten(self):
+        self.fn['instrs'] = [to_json(inst) for block in self.blocks for inst in block]
+
 if __name__ == "__main__":
     import briltxt
     prog = json.load(sys.stdin)
     for fidx, fn in enumerate(prog["functions"]):
         print(f"-----Function {fn['name']}-----")
-        blocks, blocks_cfg = block_gen(fn)
+        blocks, blocks_cfg = block_gen([from_json(instr) for instr in fn['instrs']])
         for bidx, block in enumerate(blocks):
             print(f"-----Block {bidx}-----")
             print(blocks_cfg[bidx])
             for instr in block:
-                if 'op' in instr:
-                    print(briltxt.instr_to_string(instr))
+                if instr.op is not None:
+                    print(briltxt.instr_to_string(to_json(instr)))
                 else:
-                    print(f".{instr['label']}:")
+                    print(f".{instr.label}:")
@@ -0,0 +1,101 @@
+import json
+import sys
+
+# compact instructions for the task4 passes
+# an Instr keeps every json key in a slot instead of a dict entry: ops are
+# interned strings (so == against a literal is an identity check), args,
+# funcs and labels are tuples, a missing key is None
+# a Label answers op/dest/args/... with None, so passes can read them on
+# any item of a block and test labels with `instr.op is None`
+# from_json/to_json convert losslessly, keys the classes do not know
+# (e.g. 'pos' from bril2json -p) are kept in extra
+
+# json keys held in slots, in the (alphabetical) order bril2json writes them
+INSTR_KEYS = ('args', 'dest', 'funcs', 'labels', 'op', 'type', 'value')
+
+
+class Label:
+    __slots__ = ('label', 'extra')
+    op = None
+    dest = None
+    type = None
+    args = None
+    funcs = None
+    labels = None
+    value = None
+
+    def __init__(self, label, extra=None):
+        self.label = label
+        self.extra = extra
+
+    def __repr__(self):
+        return repr(to_json(self))
+
+
+class Instr:
+    __slots__ = INSTR_KEYS + ('extra',)
+
+    def __init__(self, op, dest=None, type=None, args=None, funcs=None, labels=None, value=None, extra=None):
+        self.op = sys.intern(op)
+        self.dest = dest
+        self.type = type
+        self.args = args
+        self.funcs = funcs
+        self.labels = labels
+        self.value = value
+        self.extra = extra
+
+    def __repr__(self):
+        return repr(to_json(self))
+
+
+INSTR_KEY_SET = frozenset(INSTR_KEYS)
+
+# fills the slots directly, this runs once per instruction of every cfg
+def from_json(instr):
+    op = instr.get('op')
+    if op is None:
+        extra = {key: value for key, value in instr.items() if key != 'label'}
+        return Label(instr['label'], extra or None)
+    new = Instr.__new__(Instr)
+    new.op = sys.intern(op)
+    new.dest = instr.get('dest')
+    new.type = instr.get('type')
+    args = instr.get('args')
+    new.args = None if args is None else tuple(args)
+    funcs = instr.get('funcs')
+    new.funcs = None if funcs is None else tuple(funcs)
+    labels = instr.get('labels')
+    new.labels = None if labels is None else tuple(labels)
+    new.value = instr.get('value')
+    new.extra = None
+    if not INSTR_KEY_SET.issuperset(instr):
+        new.extra = {key: value for key, value in instr.items() if key not in INSTR_KEY_SET}
+    return new
+
+def to_json(instr):
+    if instr.op is None:
+        out = {'label': instr.label}
+    else:
+        out = {}
+        if instr.args is not None:
+            out['args'] = list(instr.args)
+        if instr.dest is not None:
+            out['dest'] = instr.dest
+        if instr.funcs is not None:
+            out['funcs'] = list(instr.funcs)
+        if instr.labels is not None:
+            out['labels'] = list(instr.labels)
+        out['op'] = instr.op
+        if instr.type is not None:
+            out['type'] = instr.type
+        if instr.value is not None:
+            out['value'] = instr.value
+    if instr.extra:
+        out.update(instr.extra)
+        out = dict(sorted(out.items()))
+    return out
+
+# hashable form of a bril type for value tables, ptr types are dicts
+def type_key(type):
+    return json.dumps(type, sort_keys=True) if isinstance(type, dict) else type
@@ -0,0 +1,90 @@
+import json
+
+# briltxt (bril-txt, docs/tools/text.md) is optional and only imported
+# when it is used: with it json programs are read a function at a time and
+# the binary format works, without it json programs are loaded whole
+def load_briltxt(required=False):
+    try:
+        import briltxt
+    except ImportError:
+        if required:
+            exit("Error: the binary format needs briltxt, install bril-txt (see docs/tools/text.md)")
+        return None
+    return briltxt
+
+# streaming reader and writer for bril json programs
+# read_items gives the members of the top-level object one at a time and
+# the "functions" array one function at a time, so a tool that optimizes
+# and writes each function before reading the next holds one function in
+# memory, not the whole module
+#   for key, value in read_items(sys.stdin):
+#       if key == 'functions': value is a generator of functions
+# write_program() takes the same (key, value) pairs and writes the same
+# text as json.dump(prog, stream, indent=2)
+
+# (key, value) pairs of a json program, briltxt's streaming reader or the
+# members of json.load when it is missing
+def read_items(stream):
+    briltxt = load_briltxt()
+    if briltxt is not None:
+        return briltxt.read_items(stream)
+    return ((key, iter(value) if key == 'functions' else value)
+            for key, value in json.load(stream).items())
+
+def read_functions(stream):
+    for key, value in read_items(stream):
+        if key == 'functions':
+            yield from value
+
+# a json program starts with '{', anything else is left to briltxt
+def is_bin(stream):
+    head = stream.peek(1)[:1]
+    if head in (b'', b'{') or head.isspace():
+        return False
+    return load_briltxt(required=True).is_bin(stream)
+
+# the binary format is briltxt's
+def read_bin_items(stream):
+    return load_briltxt(required=True).read_bin_items(stream)
+
+def write_bin_items(stream, items):
+    load_briltxt(required=True).write_bin_items(stream, items)
+
+def load_bin(stream):
+    return load_briltxt(required=True).load_bin(stream)
+
+def write_bin(stream, prog):
+    load_briltxt(required=True).write_bin(stream, prog)
+
+# write (key, value) pairs like read_items', the functions are dumped
+# as they come out of the "functions" iterable
+def write_program(stream, items):
+    stream.write('{')
+    first = True
+    for key, value in items:
+        stream.write('\n  ' if first else ',\n  ')
+        first = False
+        stream.write(json.dumps(key) + ': ')
+        if key != 'functions':
+            stream.write(json.dumps(value, indent=2).replace('\n', '\n  '))
+            continue
+        stream.write('[')
+        empty = True
+        for fn in value:
+            stream.write('\n    ' if empty else ',\n    ')
+            empty = False
+            stream.write(json.dumps(fn, indent=2).replace('\n', '\n    '))
+        stream.write(']' if empty else '\n  ]')
+    stream.write('}' if first else '\n}')
+
+# run fn_pass (which changes a function in place) on every function read
+# from stream_in and write each one to stream_out before reading the next
+# read/write can be swapped for another format's (briltxt's binary one)
+def map_functions(stream_in, stream_out, fn_pass, read=read_items, write=write_program):
+    def process(fns):
+        for fn in fns:
+            fn_pass(fn)
+            yield fn
+    items = read(stream_in)
+    write(stream_out, ((key, process(value) if key == 'functions' else value)
+                       for key, value in items))
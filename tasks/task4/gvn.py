@@ -0,0 +1,157 @@
+import sys
+from collections import namedtuple
+from tasks.task4.block_gen import CFG
+from tasks.task4.bril_ir import Instr, type_key
+from tasks.task4.bril_stream import map_functions, read_functions
+from tasks.lib.dominators import DomTree
+from tasks.task4 import to_ssa
+
+# global value numbering on ssa over the dominator tree
+# a Value is an op over the value numbers of its args (as in
+# examples/lvn.py), value2num is a scoped table: a block sees the values of
+# its dominators and drops its own when the walk leaves its subtree
+# var2num/num2var are global since ssa names have one def, num2var is the
+# first var holding a number, whose def dominates every later holder
+# a redundant instr becomes an id of a var holding its number, uses are
+# left alone so the output stays right for ssa_to's strip mode: only a
+# holder whose version is the current one of its base name at that point
+# (the top of the base's stack in the walk, as in to_ssa's renaming) is
+# copied, when there is none the instr stays
+# loads are values too, keyed by a memory epoch that moves on at each
+# store, free or call; a block keeps the epoch of its idom only if the idom
+# is its single pred, otherwise some path in between may store
+
+Value = namedtuple('Value', ['op', 'args'])
+
+# ops whose result only depends on their args (and the epoch for load)
+GVN_OPS = {'const', 'id', 'add', 'sub', 'mul', 'div', 'eq', 'lt', 'gt', 'le', 'ge', 'not', 'and', 'or',
+           'ptradd', 'load', 'char2int', 'int2char', 'ceq', 'clt', 'cle', 'cgt', 'cge'}
+GVN_COMMUTATIVE_OPS = set(to_ssa.COMMUTATIVE_OPS) | {'and', 'or', 'ceq'}
+# ops that may write memory
+MEM_WRITE_OPS = {'store', 'free', 'call'}
+
+def t_gvn(fn, cfg=None):
+    own_cfg = cfg is None
+    if own_cfg:
+        cfg = CFG(fn)
+    blocks, blocks_cfg = cfg.reset()
+    dom_tree = DomTree(blocks_cfg)
+
+    var2num = {}
+    value2num = {}
+    # vars holding each number whose defs dominate the current block
+    holders = []
+    # base name -> its versions defined in the dominators, the last one is
+    # what the base name holds after strip
+    current = {}
+    for arg in fn.get('args', []):
+        current[arg['name'].split('.')[0]] = [arg['name']]
+    # memory epoch at the end of each visited block
+    epoch_out = {}
+    n_epochs = 0
+
+    def number(var):
+        num = var2num.get(var)
+        if num is None:
+            num = var2num[var] = len(holders)
+            holders.append([])
+        return num
+
+    # a holder of num that strip leaves readable here, None if there is none
+    def current_holder(num):
+        for var in reversed(holders[num]):
+            versions = current.get(var.split('.')[0])
+            if versions and versions[-1] == var:
+                return var
+        return None
+
+    # (block, False) numbers the block, (block, True) drops its values,
+    # holders and versions
+    walk = [(dom_tree.entry, False)] if len(blocks) > 0 else []
+    added = {}
+    while len(walk) > 0:
+        block_id, leave = walk.pop()
+        if leave:
+            values, dests = added.pop(block_id)
+            for value in values:
+                del value2num[value]
+            for dest, num in reversed(dests):
+                holders[num].pop()
+                current[dest.split('.')[0]].pop()
+            continue
+        if DEBUG:
+            print(f"-----Block {block_id} ({blocks_cfg[block_id].get('label')})-----")
+        idom = dom_tree.idom[block_id]
+        if idom is not None and blocks_cfg[block_id]['pred'] == [idom]:
+            epoch = epoch_out[idom]
+        else:
+            epoch = n_epochs
+            n_epochs += 1
+        values = []
+        dests = []
+        added[block_id] = (values, dests)
+        for instr_idx, instr in enumerate(blocks[block_id]):
+            if instr.op in MEM_WRITE_OPS:
+                epoch = n_epochs
+                n_epochs += 1
+            if instr.dest is None:
+                continue
+            dest = instr.dest
+            if instr.op not in GVN_OPS or instr.type == 'float':
+                number(dest)
+            elif instr.op == 'id':
+                var2num[dest] = number(instr.args[0])
+            else:
+                if instr.op == 'const':
+                    value = Value('const', (type_key(instr.type), instr.value))
+                else:
+                    nums = tuple(number(arg) for arg in instr.args)
+                    if instr.op in GVN_COMMUTATIVE_OPS:
+                        nums = tuple(sorted(nums))
+                    if instr.op == 'load':
+                        nums += (epoch,)
+                    value = Value(instr.op, nums)
+                num = value2num.get(value)
+                holder = None if num is None else current_holder(num)
+                if holder is not None:
+                    if DEBUG:
+                        print(f"Replace {dest} with {holder}")
+                    var2num[dest] = num
+                    blocks[block_id][instr_idx] = Instr('id', dest, instr.type, (holder,))
+                elif num is None:
+                    value2num[value] = number(dest)
+                    values.append(value)
+                else:
+                    # every holder is shadowed, keep the instr as one more
+                    var2num[dest] = num
+            holders[var2num[dest]].append(dest)
+            dests.append((dest, var2num[dest]))
+            current.setdefault(dest.split('.')[0], []).append(dest)
+        epoch_out[block_id] = epoch
+        walk.append((block_id, True))
+        for child_id in reversed(dom_tree.children[block_id]):
+            walk.append((child_id, False))
+
+    if own_cfg:
+        cfg.flatten()
+    return cfg
+
+
+if __name__ == "__main__":
+    DEBUG = False
+    to_ssa.DEBUG = DEBUG
+    # python -m tasks.task4.gvn (on the output of to_ssa.py)
+    def optimize(fn):
+        if DEBUG:
+            print(f"-----Function {fn['name']}-----")
+        cfg = t_gvn(fn)
+        # dce, as the to_ssa and sccp scripts end with
+        to_ssa.t_lva(fn, cfg)
+        cfg.flatten()
+
+    # Output the program
+    if not DEBUG:
+        map_functions(sys.stdin, sys.stdout, optimize)
+    else:
+        for fn in read_functions(sys.stdin):
+            optimize(fn)
@@ -1,250 +1,191 @@
-import json
 import sys
-import copy
-from block_gen import block_gen
+from tasks.task4.block_gen import CFG
+from tasks.task4.bril_stream import map_functions, read_functions
+from tasks.lib.bv_dataflow import Universe, solve, intersect_bits
 
-def merge_ptr_dict(dicts):
-    if len(dicts) == 0:
-        return dict()
-    # extract all keys from list of dicts
-    all_keys = set()
-    for d in dicts:
-        all_keys |= set(d.keys())
-    # union w.r.t. each key
+# points-to facts map a pointer var to a bit-vector over allocation sites
+# (numbered once per function), bit 0 stands for 'all'
+ALL = 1
+
+# union w.r.t. each key, a single fact (or the same fact from every
+# pred) is passed on without a copy
+def merge_ptr_bits(facts):
+    if all(fact is facts[0] for fact in facts[1:]):
+        return facts[0]
     union_dict = dict()
-    for key in all_keys:
-        union_dict[key] = set()
-        for d in dicts:
-            if key in d:
-                union_dict[key].update(d[key])
+    for d in facts:
+        for key, bits in d.items():
+            union_dict[key] = union_dict.get(key, 0) | bits
     return union_dict
 
-def intersect_sets(sets, pos=False):
-    if len(sets) == 0:
-        return set()
-    # pick a non-empty set
-    intersect_items = set()
-    for s in sets:
-        if len(s) > 0:
-            intersect_items = copy.deepcopy(s)
-            break
-    for s in sets:
-        if pos and len(s) == 0:
-            continue
-        intersect_items.intersection_update(s)
-    return intersect_items
-
-# Memoy op alias analysis
-def mem_alias(fn):
-    blocks, blocks_cfg = block_gen(fn, dummy=False)
+# points-to facts at the end of every block and the allocation sites
+def mem_points_to(fn, blocks, blocks_cfg):
     # use "block_id instr_id" as the id for allocation
-    # initialize
-    for block in blocks_cfg:
-        for _ in range(len(block['pred'])):
-            block['in'].append(dict())
-        block['out'].append(dict())
-    # iterate until stable
-    worklist = [0]
-    # add first block
+    sites = Universe(['all'])
+    for block_id, block in enumerate(blocks):
+        for instr_id, instr in enumerate(block):
+            if instr.op == 'alloc':
+                sites.add(f"{block_id} {instr_id}")
     # if the funct has pointer args, then assume it points to everywhere
-    func_args = fn.get('args')
-    if func_args:
-        blocks_cfg[0]['in'].append(dict())
-        for arg in func_args:
-            if isinstance(arg['type'], dict):
-                blocks_cfg[0]['in'][-1][arg['name']] = set()
-                blocks_cfg[0]['in'][-1][arg['name']].add('all')
-    
-    while len(worklist) > 0:
-        block_id = worklist.pop(0)
-        if DEBUG:
-            print(f"-----Block {block_id}({blocks_cfg[block_id].get('label')})-----")
-        ptr_dict = mem_alias_single(blocks, blocks_cfg, block_id)
-        if DEBUG:
-            print(f"OUT: {ptr_dict}")
-        # check if the out has changed
-        out_update_flag = ptr_dict != blocks_cfg[block_id]['out'][0]
-        if out_update_flag:
-            blocks_cfg[block_id]['out'][0] = copy.deepcopy(ptr_dict)
-            if DEBUG:
-                print(f"OUT updated")
-        for succ_id in blocks_cfg[block_id]['succ']:
-            in_idx = blocks_cfg[succ_id]['pred'].index(block_id)
-            if out_update_flag or blocks_cfg[succ_id]['touch'] == 0:
-                blocks_cfg[succ_id]['touch'] += 1
-                blocks_cfg[succ_id]['in'][in_idx] = copy.deepcopy(ptr_dict)
-                worklist.append(succ_id)
-        if DEBUG:
-            print(f"worklist: {worklist}")
+    entry_ptrs = dict()
+    for arg in fn.get('args', []):
+        if isinstance(arg['type'], dict):
+            entry_ptrs[arg['name']] = ALL
+    # iterate until stable
+    _, ptr_out = solve(blocks_cfg,
+                       lambda block_id, ptr_dict: mem_alias_single(blocks, block_id, ptr_dict, sites),
+                       forward=True, meet=merge_ptr_bits, init=dict(), boundary=entry_ptrs)
+    return ptr_out, sites
+
+# Memoy op alias analysis
+def mem_alias(fn, cfg=None):
+    own_cfg = cfg is None
+    if own_cfg:
+        cfg = CFG(fn)
+    blocks, blocks_cfg = cfg.reset()
+    ptr_out, sites = mem_points_to(fn, blocks, blocks_cfg)
 
     # construct the final map
     ptr_map = dict()
     for block_id in range(len(blocks_cfg)):
-        for key in blocks_cfg[block_id]['out'][0]:
+        for key, bits in ptr_out[block_id].items():
             if key in ptr_map:
                 # since above analysis merges in fixed point, the value should be the same
-                assert ptr_map[key] == blocks_cfg[block_id]['out'][0][key]
+                assert ptr_map[key] == bits
             else:
-                ptr_map[key] = copy.deepcopy(blocks_cfg[block_id]['out'][0][key])
-        # clear cfg
-        blocks_cfg[block_id]['in'] = []
-        blocks_cfg[block_id]['out'] = []
-        blocks_cfg[block_id]['touch'] = 0
+                ptr_map[key] = bits
     if DEBUG:
-        print(f"Final map: {ptr_map}")
+        print(f"Final map: { {key: sites.to_set(bits) for key, bits in ptr_map.items()} }")
 
     # passes for dead store elimination
-    # initialize
-    for block_idx in reversed(range(len(blocks_cfg))):
-        block = blocks_cfg[block_idx]
-        for _ in range(len(block['succ'])):
-            block['out'].append(set())
-        block['in'].append(set())
-        worklist.append(block_idx)
+    # store sets are bit-vectors over the stored pointers
+    store_ptrs = Universe()
+    for block in blocks:
+        for instr in block:
+            if instr.op == 'store':
+                store_ptrs.add(instr.args[0])
+    # stores that a load through a pointer may read
+    alias_bits = dict()
+    def load_alias(load_ptr):
+        if load_ptr not in alias_bits:
+            load_ptr_loc = ptr_map.get(load_ptr, ALL)
+            bits = 0
+            for store_ptr in store_ptrs.items:
+                store_ptr_loc = ptr_map.get(store_ptr, ALL)
+                # check if the store ptr points to the load ptr
+                if (store_ptr_loc | load_ptr_loc) & ALL or store_ptr_loc & load_ptr_loc:
+                    bits |= store_ptrs.bit(store_ptr)
+            alias_bits[load_ptr] = bits
+        return alias_bits[load_ptr]
+
     # iterate until stable
-    eliminate_flag = False
-    while len(worklist) > 0 or not eliminate_flag:
-        if len(worklist) == 0:
-            eliminate_flag = True
-            # refill worklist
-            for block_idx in reversed(range(len(blocks_cfg))):
-                worklist.append(block_idx)
-            if DEBUG:
-                print("*******Eliminate pass*******")
-        block_id = worklist.pop(0)
+    _, store_out = solve(blocks_cfg,
+                        lambda block_id, store_bits: dse_single(blocks[block_id], store_bits, store_ptrs, load_alias),
+                        forward=False, meet=intersect_bits, init=0, boundary=0)
+    # remove the dead stores
+    if DEBUG:
+        print("*******Eliminate pass*******")
+    for block_id in range(len(blocks)):
+        del_list = []
+        dse_single(blocks[block_id], store_out[block_id], store_ptrs, load_alias, del_list)
         if DEBUG:
             print(f"-----Block {block_id}({blocks_cfg[block_id].get('label')})-----")
-        # pull out the store set
-        store_set = intersect_sets(blocks_cfg[block_id]['out'])
-        if DEBUG:
-            print(f"OUT: {store_set}")
+            print(f"del_list: {del_list}")
+        blocks[block_id] = [instr for instr_idx, instr in enumerate(blocks[block_id]) if instr_idx not in del_list]
 
-        # iterate through the instructions
-        del_list = []
-        for instr_idx in reversed(range(len(blocks[block_id]))):
-            instr = blocks[block_id][instr_idx]
-            op = instr.get('op')
-            # check if instr is store
-            if op == 'store':
-                store_ptr = instr['args'][0]
-                # add store ptr to store list
-                # check if the store ptr is in the store set
-                if store_ptr in store_set:
+    if own_cfg:
+        cfg.flatten()
+    return cfg
+
+# dead store transfer for one block (reverse order), store_bits holds the
+# pointers that are stored to later without a load in between
+def dse_single(block, store_bits, store_ptrs, load_alias, del_list=None):
+    # iterate through the instructions
+    for instr_idx in reversed(range(len(block))):
+        instr = block[instr_idx]
+        op = instr.op
+        # check if instr is store
+        if op == 'store':
+            store_bit = store_ptrs.bit(instr.args[0])
+            # check if the store ptr is in the store set
+            if store_bits & store_bit:
+                if del_list is not None:
                     del_list.append(instr_idx)
                     if DEBUG:
                         print(f"Instr removed {instr}")
-                else:
-                    store_set.add(store_ptr)
-            elif op == 'load':
-                # check if instr is load
-                # load instr should remove ptr
-                # may collide with its location
-                load_ptr = instr['args'][0]
-                load_ptr_loc_set = ptr_map[load_ptr]
-                del_store_set = set()
-                for store_ptr in store_set:
-                    store_ptr_loc_set = ptr_map[store_ptr]
-                    # check if the store ptr points to the load ptr
-                    if 'all' in store_ptr_loc_set or 'all' in load_ptr_loc_set:
-                        del_store_set.add(store_ptr)
-                        if DEBUG:
-                            print(f"Remove {store_ptr} due to {load_ptr}")
-                    elif len(store_ptr_loc_set.intersection(load_ptr_loc_set)) > 0:
-                        del_store_set.add(store_ptr)
-                        if DEBUG:
-                            print(f"Remove {store_ptr} due to {load_ptr}")
-                store_set -= del_store_set
-        if DEBUG:
-            print(f"IN: {store_set}")
-        # remove the store instr if eliminate flag is true
-        if eliminate_flag:
-            if DEBUG:
-                print(f"del_list: {del_list}")
-            blocks[block_id] = [instr for instr_idx, instr in enumerate(blocks[block_id]) if instr_idx not in del_list]
-
-        # check if the in has changed
-        in_update_flag = store_set != blocks_cfg[block_id]['in'][0]
-        if in_update_flag:
-            blocks_cfg[block_id]['in'][0] = copy.deepcopy(store_set)
-            if DEBUG:
-                print(f"IN updated")
-        for pred_id in blocks_cfg[block_id]['pred']:
-            out_idx = blocks_cfg[pred_id]['succ'].index(block_id)
-            if in_update_flag:
-                blocks_cfg[pred_id]['out'][out_idx] = copy.deepcopy(store_set)
-                if pred_id not in worklist:
-                    worklist.append(pred_id)
-        if DEBUG:
-            print(f"worklist: {worklist}")
-    
-    fn["instrs"] = [inst for block in blocks for inst in block]
+            else:
+                store_bits |= store_bit
+        elif op == 'load':
+            # load instr should remove ptr
+            # may collide with its location
+            store_bits &= ~load_alias(instr.args[0])
+    return store_bits
 
-def mem_alias_single(blocks, blocks_cfg, block_id):
-    # union the in of all preds to get list of pointer
-    ptr_dict = merge_ptr_dict(blocks_cfg[block_id]['in'])
+def mem_alias_single(blocks, block_id, in_dict, sites):
+    # facts are shared between blocks and never changed in place, the
+    # input is copied only when the block changes a pointer
+    ptr_dict = in_dict
     if DEBUG:
+        print(f"-----Block {block_id}-----")
         print(f"IN: {ptr_dict}")
     # iterate through the instructions
     for instr_id, instr in enumerate(blocks[block_id]):
-        op = instr.get('op')
-        dest_var = instr.get('dest')
-        update_flag = True
+        op = instr.op
+        dest_var = instr.dest
+        # new locations of dest_var, None if it is not a pointer update
+        bits = None
         update_str = ''
         # check if instr is alloc
         if op == 'alloc':
             update_str = "alloc"
             # add the alloc id to the ptr_dict
-            # check if ptr_dict has the key
-            ptr_dict[dest_var] = set()
-            ptr_dict[dest_var].add(f"{block_id} {instr_id}")
+            bits = sites.bit(f"{block_id} {instr_id}")
         elif op == 'ptradd':
             update_str = "ptradd"
             # the first arg is pointer
             # the dest var should cover locations pointed by this pointer
-            ptr_dict[dest_var] = set()
-            ptr_dict[dest_var].update(ptr_dict[instr['args'][0]])
+            bits = ptr_dict.get(instr.args[0], 0)
         elif op == 'load':
             update_str = "load"
             # if the dest is a pointer, it should point to everywhere
-            if isinstance(instr['type'], dict):
-                ptr_dict[dest_var] = set()
-                ptr_dict[dest_var].add('all')
+            if isinstance(instr.type, dict):
+                bits = ALL
         elif op == 'id':
             update_str = "id"
             # if the dest is a pointer, it should cover locations pointed by the src
-            if isinstance(instr['type'], dict):
-                ptr_dict[dest_var] = set()
-                ptr_dict[dest_var].update(ptr_dict[instr['args'][0]])
-        elif op == 'phi' and isinstance(instr['type'], dict):
+            if isinstance(instr.type, dict):
+                bits = ptr_dict.get(instr.args[0], 0)
+        elif op == 'phi' and isinstance(instr.type, dict):
             update_str = "phi"
-            ptr_dict[dest_var] = set()
             # union all args
-            for arg in instr['args']:
-                if arg in ptr_dict:
-                    ptr_dict[dest_var].update(ptr_dict[arg])
-        elif op == 'call' and 'dest' in instr and isinstance(instr['type'], dict):
+            bits = 0
+            for arg in instr.args:
+                bits |= ptr_dict.get(arg, 0)
+        elif op == 'call' and dest_var is not None and isinstance(instr.type, dict):
             update_str = "call"
             # if the dest is a pointer, it should point to everywhere
-            ptr_dict[dest_var] = set()
-            ptr_dict[dest_var].add('all')
-        else:
-            update_flag = False
+            bits = ALL
 
-        if DEBUG and update_flag:
-            print(f"{instr_id}({update_str}): {ptr_dict}")
+        if bits is not None and ptr_dict.get(dest_var) != bits:
+            if ptr_dict is in_dict:
+                ptr_dict = dict(in_dict)
+            ptr_dict[dest_var] = bits
+            if DEBUG:
+                print(f"{instr_id}({update_str}): {ptr_dict}")
 
     return ptr_dict
 
 if __name__ == "__main__":
     DEBUG = False
-    prog = json.load(sys.stdin)
 
-    for fn in prog['functions']:
+    def optimize(fn):
         if DEBUG:
             print(f"-----Function {fn['name']}-----")
         mem_alias(fn)
 
-
     # Output the program
     if not DEBUG:
-        json.dump(prog, sys.stdout, indent=2)
\ No newline at end of file
+        map_functions(sys.stdin, sys.stdout, optimize)
+    else:
+        for fn in read_functions(sys.stdin):
+            optimize(fn)
@@ -0,0 +1,44 @@
+import json
+import socket
+import sys
+
+from tasks.task4.pass_proto import read_frame, write_frame, socket_path
+
+# thin client for pass_server.py, a drop-in for `python X.py` in brench pipelines
+#   python -m tasks.task4.pass_client to_ssa memopt ssa_to
+# pass names are the ones pass_manager.py knows, script names (to_ssa,
+# memopt, ssa_to, ...) or function-level passes (t_to_ssa, t_lvn, ...)
+# the program text is forwarded as-is, only the server parses it
+# if no server is listening the passes run in this process instead
+
+
+def run_remote(path, passes, data):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        stream = sock.makefile('rwb')
+        write_frame(stream, json.dumps({'passes': passes}).encode())
+        write_frame(stream, data)
+        stream.flush()
+        header = read_frame(stream)
+        out = read_frame(stream)
+    if header is None or out is None:
+        exit("Error: pass server closed the connection")
+    status = json.loads(header)
+    if not status['ok']:
+        exit(f"Error: {status['error']}")
+    return out
+
+def run_local(passes, data):
+    from tasks.task4.pass_manager import run_passes
+    prog = run_passes(json.loads(data), passes)
+    return json.dumps(prog, indent=2).encode()
+
+
+if __name__ == "__main__":
+    passes = sys.argv[1:]
+    data = sys.stdin.buffer.read()
+    try:
+        out = run_remote(socket_path(), passes, data)
+    except (FileNotFoundError, ConnectionRefusedError):
+        out = run_local(passes, data)
+    sys.stdout.buffer.write(out)
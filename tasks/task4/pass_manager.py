@@ -0,0 +1,155 @@
+import functools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from tasks.task1 import dce
+from tasks.task2 import dataflow
+from tasks.task3 import licm
+from tasks.task4 import bril_stream
+from tasks.task4 import to_ssa
+from tasks.task4 import memopt
+from tasks.task4 import ssa_to
+from tasks.task4 import sccp
+from tasks.task4 import gvn
+from tasks.task4 import soa_ir
+
+# in-process pass manager
+# runs a list of passes on one parsed program instead of piping json
+# between `python X.py` processes
+#   python -m tasks.task4.pass_manager --passes to_ssa,memopt,ssa_to [--jobs N] [--bin]
+# reads json or bril-txt's binary format (told apart by its magic), writes
+# json or with --bin binary
+
+# the pass modules only define DEBUG when run as scripts
+for module in (to_ssa, memopt, ssa_to, sccp, gvn, dce, dataflow, licm):
+    module.DEBUG = False
+
+# global + local dce until nothing changes (task1/dce.py main)
+def dce_fixpoint(fn):
+    while dce.g_dce(fn) or dce.l_dce(fn):
+        pass
+
+# function-level passes
+PASSES = {
+    't_to_ssa': to_ssa.t_to_ssa,
+    't_to_ssa_semi': functools.partial(to_ssa.t_to_ssa, prune='semi'),
+    't_to_ssa_pruned': functools.partial(to_ssa.t_to_ssa, prune='pruned'),
+    't_lvn': to_ssa.t_lvn,
+    't_lva': to_ssa.t_lva,
+    't_lva_soa': soa_ir.t_lva_soa,
+    't_sccp': sccp.t_sccp,
+    't_gvn': gvn.t_gvn,
+    'licm': licm.licm,
+    'mem_alias': memopt.mem_alias,
+    't_ssa_to': ssa_to.t_ssa_to,
+    't_ssa_to_copies': functools.partial(ssa_to.t_ssa_to, phi='copies'),
+    'g_dce': dce.g_dce,
+    'l_dce': dce.l_dce,
+    'dce': dce_fixpoint,
+    'adce': dce.adce,
+    't_cpf': dataflow.t_cpf,
+}
+
+# passes that take and return a block_gen.CFG, consecutive ones share it
+CFG_PASSES = {'t_to_ssa', 't_to_ssa_semi', 't_to_ssa_pruned', 't_lvn', 't_lva', 't_lva_soa', 't_sccp', 't_gvn', 'mem_alias', 't_ssa_to', 't_ssa_to_copies'}
+
+# script names -> the passes their __main__ runs, with t_lva on the
+# struct-of-arrays layout (same result)
+# dataflow uses the task4 liveness, the task2 t_lva reads a global fn
+PIPELINES = {
+    'to_ssa': ['t_to_ssa', 't_lvn', 't_lva_soa'],
+    'sccp': ['t_sccp', 't_lva_soa'],
+    'gvn': ['t_gvn', 't_lva_soa'],
+    'memopt': ['mem_alias'],
+    'ssa_to': ['t_ssa_to'],
+    'dataflow': ['t_cpf', 't_lva_soa'],
+}
+
+
+# expand script names into function-level passes
+def expand_passes(names):
+    passes = []
+    for name in names:
+        if name in PIPELINES:
+            passes += PIPELINES[name]
+        elif name in PASSES:
+            passes.append(name)
+        else:
+            raise KeyError(f"Unknown pass {name}")
+    return passes
+
+# run passes in order, each one over every function (like the scripts do)
+# the cfg of each function is kept until a pass that only knows
+# fn['instrs'] runs, so blocks are built once per run of CFG_PASSES
+def run_passes(prog, names):
+    cfgs = [None] * len(prog['functions'])
+    for name in expand_passes(names):
+        for fn_idx, fn in enumerate(prog['functions']):
+            if name in CFG_PASSES:
+                cfgs[fn_idx] = PASSES[name](fn, cfgs[fn_idx])
+            else:
+                if cfgs[fn_idx] is not None:
+                    cfgs[fn_idx].flatten()
+                    cfgs[fn_idx] = None
+                PASSES[name](fn)
+    for cfg in cfgs:
+        if cfg is not None:
+            cfg.flatten()
+    return prog
+
+# below this many functions per job the pool costs more than it saves
+MIN_FNS_PER_JOB = 4
+
+# worker side of run_passes_parallel
+def run_chunk(fns, names):
+    return run_passes({'functions': fns}, names)['functions']
+
+# every pass is intra-procedural, so each function can go through the whole
+# pass list on its own: fan chunks of functions out over a process pool and
+# put them back in their original order, small programs stay serial
+def run_passes_parallel(prog, names, jobs):
+    fns = prog['functions']
+    # unknown names fail here, not in a worker
+    expand_passes(names)
+    if jobs <= 1 or len(fns) < jobs * MIN_FNS_PER_JOB:
+        return run_passes(prog, names)
+    # a few chunks per job so one big function does not hold up the rest
+    chunk_size = max(1, len(fns) // (jobs * 4))
+    chunks = [fns[idx:idx + chunk_size] for idx in range(0, len(fns), chunk_size)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        prog['functions'] = [fn for chunk in executor.map(run_chunk, chunks, [names] * len(chunks))
+                             for fn in chunk]
+    return prog
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    usage = f"usage: python -m tasks.task4.pass_manager --passes {','.join(PIPELINES)} [--jobs N] [--bin]"
+    if '--passes' not in args or args.index('--passes') + 1 >= len(args):
+        exit(usage)
+    names = [name for name in args[args.index('--passes') + 1].split(',') if name]
+    jobs = 1
+    if '--jobs' in args:
+        if args.index('--jobs') + 1 >= len(args):
+            exit(usage)
+        # --jobs 0 uses every core
+        jobs = int(args[args.index('--jobs') + 1]) or os.cpu_count()
+    binary_in = bril_stream.is_bin(sys.stdin.buffer)
+    binary_out = '--bin' in args
+    stream_in = sys.stdin.buffer if binary_in else sys.stdin
+    stream_out = sys.stdout.buffer if binary_out else sys.stdout
+    if jobs == 1:
+        # stream the functions through one at a time
+        expand_passes(names)
+        bril_stream.map_functions(stream_in, stream_out, lambda fn: run_passes({'functions': [fn]}, names),
+                                  read=bril_stream.read_bin_items if binary_in else bril_stream.read_items,
+                                  write=bril_stream.write_bin_items if binary_out else bril_stream.write_program)
+    else:
+        prog = bril_stream.load_bin(stream_in) if binary_in else json.load(stream_in)
+        run_passes_parallel(prog, names, jobs)
+        if binary_out:
+            bril_stream.write_bin(stream_out, prog)
+        else:
+            json.dump(prog, stream_out, indent=2)
@@ -0,0 +1,31 @@
+import os
+import struct
+
+# wire format shared by pass_server.py and pass_client.py
+# every message is a 4-byte big-endian length followed by the payload
+#   request:  header frame (json: {"passes": [...]}) + program frame (raw json text)
+#   response: header frame (json: {"ok": true} or {"ok": false, "error": ...})
+#             + program frame (json text, same layout as the python X.py scripts)
+# kept free of pass imports so the client starts fast
+
+SOCKET_ENV = 'BRIL_PASS_SOCKET'
+DEFAULT_SOCKET = '/tmp/bril-pass-server.sock'
+
+
+def socket_path():
+    return os.environ.get(SOCKET_ENV, DEFAULT_SOCKET)
+
+def read_frame(stream):
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    size, = struct.unpack('>I', header)
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError("Truncated frame")
+    return data
+
+def write_frame(stream, data):
+    stream.write(struct.pack('>I', len(data)))
+    if data:
+        stream.write(data)
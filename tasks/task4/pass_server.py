@@ -0,0 +1,65 @@
+import json
+import os
+import socketserver
+import sys
+
+from tasks.task4.pass_manager import run_passes
+from tasks.task4.pass_proto import read_frame, write_frame, socket_path
+
+# long-lived pass server
+# keeps the passes of pass_manager.py imported and runs a named pass list
+# on a program that pass_client.py forwards over a unix socket (or over stdin/stdout)
+
+
+# handle one request, returns (header, program) frames
+def serve_one(header, data):
+    try:
+        passes = json.loads(header)['passes']
+        prog = run_passes(json.loads(data), passes)
+        out = json.dumps(prog, indent=2).encode()
+        return json.dumps({'ok': True}).encode(), out
+    except (Exception, SystemExit) as e:
+        return json.dumps({'ok': False, 'error': f"{type(e).__name__}: {e}"}).encode(), b''
+
+def serve_stream(rfile, wfile):
+    while True:
+        header = read_frame(rfile)
+        if header is None:
+            break
+        data = read_frame(rfile)
+        if data is None:
+            raise EOFError("Missing program frame")
+        out_header, out = serve_one(header, data)
+        write_frame(wfile, out_header)
+        write_frame(wfile, out)
+        wfile.flush()
+
+
+class PassHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        serve_stream(self.rfile, self.wfile)
+
+
+class PassServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path):
+    # clear a stale socket left by a killed server
+    if os.path.exists(path):
+        os.unlink(path)
+    with PassServer(path, PassHandler) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    # python -m tasks.task4.pass_server [--stdio | socket_path]
+    if '--stdio' in sys.argv[1:]:
+        serve_stream(sys.stdin.buffer, sys.stdout.buffer)
+    else:
+        serve(sys.argv[1] if len(sys.argv) > 1 else socket_path())
@@ -0,0 +1,230 @@
+import sys
+from tasks.task4.block_gen import CFG
+from tasks.task4.bril_ir import Instr
+from tasks.task4.bril_stream import map_functions, read_functions
+from tasks.task4 import to_ssa
+
+# sparse conditional constant propagation on ssa (Wegman-Zadeck)
+# a variable is TOP (not in values: no executable def yet), a constant or
+# BOTTOM, values only go down, so each instr is revisited at most twice
+# per use and the work is linear in the ssa def-use edges
+# blocks are visited once an edge into them is executable, a branch on a
+# constant only makes one of its edges executable
+# afterwards defs with a constant value become const instrs, branches on
+# constants become jumps, unreachable blocks and their phi args go away
+
+BOTTOM = object()
+
+# ops folded on int/bool constants
+FOLD_OPS = {'add', 'sub', 'mul', 'div', 'eq', 'lt', 'gt', 'le', 'ge', 'not', 'and', 'or'}
+
+# bril ints are 64-bit two's complement
+def wrap_int(value):
+    return (value + (1 << 63)) % (1 << 64) - (1 << 63)
+
+def fold(op, args):
+    match op:
+        case 'add':
+            return wrap_int(args[0] + args[1])
+        case 'sub':
+            return wrap_int(args[0] - args[1])
+        case 'mul':
+            return wrap_int(args[0] * args[1])
+        case 'div':
+            # leave the division by zero to run time
+            if args[1] == 0:
+                return BOTTOM
+            # truncate towards zero
+            quotient = abs(args[0]) // abs(args[1])
+            return wrap_int(quotient if (args[0] < 0) == (args[1] < 0) else -quotient)
+        case 'eq':
+            return args[0] == args[1]
+        case 'lt':
+            return args[0] < args[1]
+        case 'gt':
+            return args[0] > args[1]
+        case 'le':
+            return args[0] <= args[1]
+        case 'ge':
+            return args[0] >= args[1]
+        case 'not':
+            return not args[0]
+        case 'and':
+            return args[0] and args[1]
+        case 'or':
+            return args[0] or args[1]
+    return BOTTOM
+
+def same_value(a, b):
+    return a is b or (a is not BOTTOM and b is not BOTTOM and type(a) is type(b) and a == b)
+
+# lattice value of the dest of instr, None for TOP
+def t_sccp_eval(instr, values, block_id, executable, label2block):
+    if instr.op == 'const':
+        return instr.value
+    if instr.op == 'phi':
+        # meet over the args of executable edges
+        value = None
+        for arg, label in zip(instr.args, instr.labels):
+            if (label2block.get(label), block_id) not in executable:
+                continue
+            arg_value = values.get(arg)
+            if arg_value is None:
+                continue
+            if value is None:
+                value = arg_value
+            elif not same_value(value, arg_value):
+                return BOTTOM
+        return value
+    if isinstance(instr.type, dict):
+        return BOTTOM
+    if instr.op == 'id':
+        return values.get(instr.args[0])
+    if instr.op not in FOLD_OPS or instr.type not in ('int', 'bool'):
+        return BOTTOM
+    args = []
+    for arg in instr.args:
+        arg_value = values.get(arg)
+        if arg_value is BOTTOM:
+            return BOTTOM
+        args.append(arg_value)
+    if None in args:
+        return None
+    return fold(instr.op, args)
+
+# blocks the terminator of a block can go to, given what is known so far
+def t_sccp_targets(block_id, blocks, blocks_cfg, values, label2block):
+    last = blocks[block_id][-1] if len(blocks[block_id]) > 0 else None
+    if last is None or last.op not in ('br', 'jmp', 'ret'):
+        # falls through
+        return blocks_cfg[block_id]['succ']
+    if last.op == 'ret':
+        return []
+    if last.op == 'jmp':
+        return [label2block[last.labels[0]]]
+    cond = values.get(last.args[0])
+    if cond is None:
+        return []
+    if cond is BOTTOM:
+        return [label2block[label] for label in last.labels]
+    return [label2block[last.labels[0 if cond else 1]]]
+
+def t_sccp(fn, cfg=None):
+    own_cfg = cfg is None
+    if own_cfg:
+        cfg = CFG(fn)
+    blocks, blocks_cfg = cfg.reset()
+    label2block = {blocks_cfg[block_id].get('label'): block_id for block_id in range(len(blocks))}
+
+    # def-use chains: var -> [(block_id, instr)]
+    uses = {}
+    for block_id, block in enumerate(blocks):
+        for instr in block:
+            for arg in instr.args or ():
+                uses.setdefault(arg, []).append((block_id, instr))
+
+    # function args are unknown
+    values = {arg['name']: BOTTOM for arg in fn.get('args', [])}
+    # (pred, block) edges found executable, the entry has pred None
+    executable = set()
+    visited = set()
+    flow_work = [(None, 0)] if len(blocks) > 0 else []
+    ssa_work = []
+
+    def visit(block_id, instr):
+        if instr.op == 'br':
+            for succ_id in t_sccp_targets(block_id, blocks, blocks_cfg, values, label2block):
+                flow_work.append((block_id, succ_id))
+            return
+        if instr.dest is None:
+            return
+        old = values.get(instr.dest)
+        if old is BOTTOM:
+            return
+        new = t_sccp_eval(instr, values, block_id, executable, label2block)
+        if new is None or (old is not None and same_value(old, new)):
+            return
+        values[instr.dest] = new if old is None else BOTTOM
+        if DEBUG:
+            print(f"{instr.dest}: {'bottom' if values[instr.dest] is BOTTOM else values[instr.dest]}")
+        ssa_work.extend(uses.get(instr.dest, []))
+
+    while len(flow_work) > 0 or len(ssa_work) > 0:
+        if len(flow_work) > 0:
+            edge = flow_work.pop()
+            if edge in executable:
+                continue
+            executable.add(edge)
+            block_id = edge[1]
+            if block_id in visited:
+                # only the phis see the new edge
+                for instr in blocks[block_id]:
+                    if instr.op == 'phi':
+                        visit(block_id, instr)
+                continue
+            visited.add(block_id)
+            for instr in blocks[block_id]:
+                if instr.op is not None:
+                    visit(block_id, instr)
+            if len(blocks[block_id]) == 0 or blocks[block_id][-1].op != 'br':
+                for succ_id in t_sccp_targets(block_id, blocks, blocks_cfg, values, label2block):
+                    flow_work.append((block_id, succ_id))
+        else:
+            block_id, instr = ssa_work.pop()
+            # unvisited blocks are evaluated when they become executable
+            if block_id in visited:
+                visit(block_id, instr)
+
+    # rewrite
+    changed_flow = len(visited) < len(blocks)
+    for block_id, block in enumerate(blocks):
+        if block_id not in visited:
+            blocks[block_id] = []
+            continue
+        for instr_idx, instr in enumerate(block):
+            if instr.op == 'phi':
+                keep = [(arg, label) for arg, label in zip(instr.args, instr.labels)
+                        if (label2block.get(label), block_id) in executable]
+                instr.args = tuple(arg for arg, _ in keep)
+                instr.labels = tuple(label for _, label in keep)
+            if instr.op == 'br':
+                cond = values.get(instr.args[0])
+                if cond is not None and cond is not BOTTOM:
+                    block[instr_idx] = Instr('jmp', labels=(instr.labels[0 if cond else 1],))
+                    changed_flow = True
+                continue
+            if instr.dest is None or instr.op == 'const':
+                continue
+            value = values.get(instr.dest)
+            if value is not None and value is not BOTTOM:
+                block[instr_idx] = Instr('const', instr.dest, instr.type, value=value)
+
+    if DEBUG:
+        print(f"executable blocks: {sorted(visited)}")
+    if changed_flow:
+        # control flow changed, hand back a new cfg
+        cfg = CFG(fn, instrs=[instr for block in blocks for instr in block])
+    if own_cfg:
+        cfg.flatten()
+    return cfg
+
+
+if __name__ == "__main__":
+    DEBUG = False
+    to_ssa.DEBUG = DEBUG
+    # python -m tasks.task4.sccp (on the output of to_ssa.py)
+    def optimize(fn):
+        if DEBUG:
+            print(f"-----Function {fn['name']}-----")
+        cfg = t_sccp(fn)
+        # the folded defs feed nothing but consts, and removed blocks may
+        # leave dead defs
+        to_ssa.t_lva(fn, cfg)
+        cfg.flatten()
+
+    # Output the program
+    if not DEBUG:
+        map_functions(sys.stdin, sys.stdout, optimize)
+    else:
+        for fn in read_functions(sys.stdin):
+            optimize(fn)
@@ -0,0 +1,226 @@
+from array import array
+from tasks.lib.bv_dataflow import Universe, solve, gen_kill
+from tasks.task4.block_gen import CFG
+from tasks.task4.bril_ir import type_key
+from tasks.task4.memopt import ALL, merge_ptr_bits
+from tasks.task4.to_ssa import COMMUTATIVE_OPS, BAD_CONST_OPS
+
+# struct-of-arrays form of one function for analyses
+# instructions are numbered in block order without the labels, instruction
+# i has opcode op[i], destination dest[i] (-1 for none), is_ptr[i] for a
+# pointer-typed dest and its args in arg_ids[arg_start[i]:arg_start[i + 1]]
+# (CSR), block b holds instructions block_start[b]:block_start[b + 1]
+# variables and opcodes are interned to ints per function (bit v of a fact
+# is variable v), so functions run by different pass_server threads never
+# share a table; the opcodes the analyses test for have fixed ids
+# t_lva_soa is t_lva on this layout: the arrays are built once and the
+# liveness/dce rounds only flip alive flags, the blocks are edited once
+# points_to and redundant are the analyses of mem_alias and t_lvn on it,
+# those passes keep their Instr-based code since each runs once per
+# function and building the arrays costs about what it would save
+# (bench_soa.py times and checks both)
+
+FIXED_OPCODES = Universe(['alloc', 'ptradd', 'load', 'id', 'phi', 'call', 'const']
+                         + COMMUTATIVE_OPS + BAD_CONST_OPS)
+ALLOC, PTRADD, LOAD, ID, PHI, CALL, CONST = range(7)
+# ops that can change a pointer dest, the rest are skipped by points_to
+PTR_OPS = {ALLOC, PTRADD, LOAD, ID, PHI, CALL}
+LVN_COMMUTATIVE_OPS = {FIXED_OPCODES.index[op] for op in COMMUTATIVE_OPS}
+LVN_SKIP_OPS = {FIXED_OPCODES.index[op] for op in BAD_CONST_OPS}
+
+
+class FnArrays:
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.vars = Universe()
+        self.opcodes = Universe(FIXED_OPCODES.items)
+        self.op = array('i')
+        self.dest = array('i')
+        self.is_ptr = array('b')
+        self.arg_start = array('i', [0])
+        self.arg_ids = array('i')
+        self.block_start = array('i', [0])
+        # the Instr behind each number, for passes that act on the results
+        self.instrs = []
+        for block in cfg.blocks:
+            for instr in block:
+                if instr.op is None:
+                    continue
+                self.instrs.append(instr)
+                self.op.append(self.opcodes.add(instr.op))
+                self.dest.append(-1 if instr.dest is None else self.vars.add(instr.dest))
+                self.is_ptr.append(isinstance(instr.type, dict))
+                for arg in instr.args or ():
+                    self.arg_ids.append(self.vars.add(arg))
+                self.arg_start.append(len(self.arg_ids))
+            self.block_start.append(len(self.op))
+
+    def __len__(self):
+        return len(self.op)
+
+    def args(self, idx):
+        return self.arg_ids[self.arg_start[idx]:self.arg_start[idx + 1]]
+
+    # use (gen) and def (kill) bit-vectors of a block, like t_lva_gen_kill
+    # alive[i] == 0 drops instruction i
+    def use_def(self, block_id, alive=None):
+        dest, arg_start, arg_ids = self.dest, self.arg_start, self.arg_ids
+        use_bits = 0
+        def_bits = 0
+        for idx in reversed(range(self.block_start[block_id], self.block_start[block_id + 1])):
+            if alive is not None and not alive[idx]:
+                continue
+            var = dest[idx]
+            if var >= 0:
+                def_bits |= 1 << var
+                use_bits &= ~(1 << var)
+            for var in arg_ids[arg_start[idx]:arg_start[idx + 1]]:
+                use_bits |= 1 << var
+        return use_bits, def_bits
+
+    # live variables at the end of every block (t_lva)
+    def live_out(self, alive=None):
+        gen = []
+        kill = []
+        for block_id in range(len(self.block_start) - 1):
+            use_bits, def_bits = self.use_def(block_id, alive)
+            gen.append(use_bits)
+            kill.append(def_bits)
+        _, live_out = solve(self.cfg.blocks_cfg, gen_kill(gen, kill), forward=False)
+        return live_out
+
+    # dce of t_lva: an instruction whose dest is dead below it goes, then
+    # liveness is redone until nothing goes, returns the alive flags
+    def live_instrs(self):
+        dest, arg_start, arg_ids = self.dest, self.arg_start, self.arg_ids
+        alive = bytearray(b'\x01') * len(self)
+        changed = True
+        while changed:
+            live_out = self.live_out(alive)
+            changed = False
+            for block_id in range(len(self.block_start) - 1):
+                used = live_out[block_id]
+                for idx in reversed(range(self.block_start[block_id], self.block_start[block_id + 1])):
+                    if not alive[idx]:
+                        continue
+                    var = dest[idx]
+                    if var >= 0:
+                        if not used >> var & 1:
+                            alive[idx] = 0
+                            changed = True
+                            continue
+                        used &= ~(1 << var)
+                    for var in arg_ids[arg_start[idx]:arg_start[idx + 1]]:
+                        used |= 1 << var
+        return alive
+
+    # points-to facts at the end of every block as {var id: site bits}, site
+    # k (bit k + 1, bit 0 is ALL) is the k-th alloc, as in mem_alias
+    def points_to(self):
+        op, dest, is_ptr, arg_start, arg_ids = self.op, self.dest, self.is_ptr, self.arg_start, self.arg_ids
+        site_bit = {}
+        ptr_instrs = []
+        for block_id in range(len(self.block_start) - 1):
+            idxs = []
+            for idx in range(self.block_start[block_id], self.block_start[block_id + 1]):
+                if op[idx] == ALLOC:
+                    site_bit[idx] = 1 << (len(site_bit) + 1)
+                if op[idx] in PTR_OPS and dest[idx] >= 0 and (is_ptr[idx] or op[idx] in (ALLOC, PTRADD)):
+                    idxs.append(idx)
+            ptr_instrs.append(idxs)
+
+        # copy on write, as mem_alias_single
+        def transfer(block_id, in_dict):
+            ptr_dict = in_dict
+            for idx in ptr_instrs[block_id]:
+                code = op[idx]
+                if code == ALLOC:
+                    bits = site_bit[idx]
+                elif code == PTRADD or code == ID:
+                    bits = ptr_dict.get(arg_ids[arg_start[idx]], 0)
+                elif code == PHI:
+                    bits = 0
+                    for pos in range(arg_start[idx], arg_start[idx + 1]):
+                        bits |= ptr_dict.get(arg_ids[pos], 0)
+                else:
+                    # load or call of a pointer
+                    bits = ALL
+                if ptr_dict.get(dest[idx]) != bits:
+                    if ptr_dict is in_dict:
+                        ptr_dict = dict(in_dict)
+                    ptr_dict[dest[idx]] = bits
+            return ptr_dict
+
+        entry_ptrs = {}
+        for arg in self.cfg.fn.get('args', []):
+            if isinstance(arg['type'], dict):
+                entry_ptrs[self.vars.add(arg['name'])] = ALL
+        _, ptr_out = solve(self.cfg.blocks_cfg, transfer, forward=True,
+                           meet=merge_ptr_bits, init=dict(), boundary=entry_ptrs)
+        return ptr_out
+
+    # local value numbering of a block (ssa input, no folding): returns
+    # {instr index: earlier instr index with the same value} for the
+    # instructions t_lvn would turn into copies
+    def redundant(self, block_id):
+        op, dest, arg_start, arg_ids = self.op, self.dest, self.arg_start, self.arg_ids
+        var2num = {}
+        value2num = {}
+        # instr index that computed each number, -1 for unknown values
+        num2idx = []
+        found = {}
+        for idx in range(self.block_start[block_id], self.block_start[block_id + 1]):
+            if dest[idx] < 0:
+                continue
+            nums = []
+            for pos in range(arg_start[idx], arg_start[idx + 1]):
+                num = var2num.get(arg_ids[pos])
+                if num is None:
+                    num = var2num[arg_ids[pos]] = len(num2idx)
+                    num2idx.append(-1)
+                nums.append(num)
+            code = op[idx]
+            instr = self.instrs[idx]
+            if code in LVN_SKIP_OPS or instr.type == 'float':
+                var2num[dest[idx]] = len(num2idx)
+                num2idx.append(-1)
+                continue
+            if code == ID:
+                var2num[dest[idx]] = nums[0]
+                continue
+            if code == CONST:
+                value = (CONST, type_key(instr.type), instr.value)
+            elif code in LVN_COMMUTATIVE_OPS:
+                value = (code, *sorted(nums))
+            else:
+                value = (code, *nums)
+            num = value2num.get(value)
+            if num is None:
+                num = value2num[value] = len(num2idx)
+                num2idx.append(idx)
+            else:
+                found[idx] = num2idx[num]
+            var2num[dest[idx]] = num
+        return found
+
+# trivial live variable analysis and dce, as to_ssa.t_lva
+def t_lva_soa(fn, cfg=None):
+    own_cfg = cfg is None
+    if own_cfg:
+        cfg = CFG(fn)
+    cfg.reset()
+    alive = FnArrays(cfg).live_instrs()
+    idx = 0
+    for block_id, block in enumerate(cfg.blocks):
+        kept = []
+        for instr in block:
+            if instr.op is None:
+                kept.append(instr)
+                continue
+            if alive[idx]:
+                kept.append(instr)
+            idx += 1
+        cfg.blocks[block_id] = kept
+    if own_cfg:
+        cfg.flatten()
+    return cfg
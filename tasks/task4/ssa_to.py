@@ -1,10 +1,20 @@
-import json
 import sys
-import copy
-from block_gen import block_gen
+from tasks.task4.block_gen import CFG
+from tasks.task4.bril_ir import Instr, Label, from_json, to_json
+from tasks.task4.bril_stream import map_functions, read_functions
+from tasks.lib.bv_dataflow import Universe, solve
 
+# phi elimination: 'strip' drops phis and the '.N' suffixes (only correct
+# while versions of a variable never overlap), 'copies' turns phis into
+# parallel copies on the incoming edges and coalesces the names it can
+PHI_MODES = ['strip', 'copies']
 
-def t_ssa_to(fn):
+# with a cfg the blocks are rewritten in place and instrs are left alone
+def t_ssa_to(fn, cfg=None, phi='strip'):
+    if phi not in PHI_MODES:
+        exit(f"Unknown phi mode {phi}")
+    if phi == 'copies':
+        return t_ssa_to_copies(fn, cfg)
     # remove all phi functions
     # remove variable names after '.'
     # func args
@@ -12,34 +22,316 @@ def t_ssa_to(fn):
         for arg in fn['args']:
             arg['name'] = arg['name'].split('.')[0]
     # instrs
-    del_list = []
-    for instr_idx, instr in enumerate(fn['instrs']):
-        # check if instr is phi
-        if 'op' in instr and instr['op'] == 'phi':
-            del_list.append(instr_idx)
+    own_cfg = cfg is None
+    blocks = [[from_json(instr) for instr in fn['instrs']]] if own_cfg else cfg.blocks
+    for block in blocks:
+        del_list = []
+        for instr_idx, instr in enumerate(block):
+            # check if instr is phi
+            if instr.op == 'phi':
+                del_list.append(instr_idx)
+                continue
+            # dest
+            if instr.dest is not None:
+                instr.dest = instr.dest.split('.')[0]
+            # args
+            if instr.args is not None:
+                instr.args = tuple(arg.split('.')[0] for arg in instr.args)
+
+        block[:] = [instr for idx, instr in enumerate(block) if idx not in del_list]
+    if own_cfg:
+        fn['instrs'] = [to_json(instr) for instr in blocks[0]]
+    return cfg
+
+def phis_of(block):
+    return [instr for instr in block if instr.op == 'phi']
+
+# liveness where a phi arg is used at the end of its pred and a phi dest is
+# defined at the top of its block, returns the live-out set of each block
+def t_phi_live_out(blocks, blocks_cfg):
+    variables = Universe()
+    gen = []
+    kill = []
+    phi_uses = [0] * len(blocks)
+    label2block = {blocks_cfg[block_id].get('label'): block_id for block_id in range(len(blocks))}
+    for block_id, block in enumerate(blocks):
+        use_bits = 0
+        def_bits = 0
+        for instr in reversed(block):
+            if instr.op == 'phi':
+                continue
+            if instr.dest is not None:
+                def_bits |= variables.bit(instr.dest)
+                use_bits &= ~variables.bit(instr.dest)
+            use_bits |= variables.bits(instr.args or ())
+        dest_bits = 0
+        for instr in phis_of(block):
+            dest_bits |= variables.bit(instr.dest)
+            for arg, label in zip(instr.args, instr.labels):
+                if label in label2block:
+                    phi_uses[label2block[label]] |= variables.bit(arg)
+        gen.append(use_bits & ~dest_bits)
+        kill.append(def_bits | dest_bits)
+    transfer = lambda block_id, fact: gen[block_id] | ((fact | phi_uses[block_id]) & ~kill[block_id])
+    _, live_out = solve(blocks_cfg, transfer, forward=False)
+    return [variables.to_set(live_out[block_id] | phi_uses[block_id]) for block_id in range(len(blocks))]
+
+# interference between the names that appear in phis: two names interfere
+# if one is live where the other is defined, phi dests of a block are
+# defined together at its top, like the function params at the top of
+# the entry block
+def t_interference(blocks, live_out, candidates, params=()):
+    interfere = {name: set() for name in candidates}
+    def add_edges(dest, live):
+        if dest not in candidates:
+            return
+        for name in live:
+            if name != dest and name in candidates:
+                interfere[dest].add(name)
+                interfere[name].add(dest)
+    for block_id, block in enumerate(blocks):
+        live = live_out[block_id] & candidates
+        for instr in reversed(block):
+            if instr.op == 'phi':
+                continue
+            if instr.dest is not None:
+                add_edges(instr.dest, live)
+                live.discard(instr.dest)
+            live.update(arg for arg in instr.args or () if arg in candidates)
+        dests = [instr.dest for instr in phis_of(block)]
+        if block_id == 0:
+            dests += params
+        for dest in dests:
+            add_edges(dest, live)
+            add_edges(dest, dests)
+    return interfere
+
+# union phi dests with their args unless the classes interfere
+# returns name -> class representative
+def t_coalesce(blocks, interfere):
+    rep = {name: name for name in interfere}
+    members = {name: {name} for name in interfere}
+    neighbors = {name: set(interfere[name]) for name in interfere}
+    def find(name):
+        while rep[name] != name:
+            rep[name] = rep[rep[name]]
+            name = rep[name]
+        return name
+    for block in blocks:
+        for instr in phis_of(block):
+            for arg in instr.args:
+                root1, root2 = find(instr.dest), find(arg)
+                if root1 == root2 or not neighbors[root1].isdisjoint(members[root2]):
+                    continue
+                # keep the bigger class as the root
+                if len(members[root1]) < len(members[root2]):
+                    root1, root2 = root2, root1
+                rep[root2] = root1
+                members[root1] |= members.pop(root2)
+                neighbors[root1] |= neighbors.pop(root2)
+    return {name: find(name) for name in rep}
+
+# final name of every ssa name: a class takes the bare variable name when
+# no other class (or unversioned name) shares it, else its representative
+def t_class_names(fn, blocks, rep):
+    names = {arg['name'] for arg in fn.get('args', [])}
+    for block in blocks:
+        for instr in block:
+            names.update(instr.args or ())
+            if instr.dest is not None:
+                names.add(instr.dest)
+    classes = {name: rep.get(name, name) for name in names}
+    base2classes = {}
+    for name, root in classes.items():
+        base = name.rsplit('.', 1)[0] if name.rsplit('.', 1)[-1].isdigit() else name
+        base2classes.setdefault(base, set()).add(root)
+    all_roots = set(classes.values())
+    class_name = {}
+    for base, roots in base2classes.items():
+        for root in roots:
+            # never take the name another class keeps
+            if len(roots) == 1 and (base == root or base not in all_roots):
+                class_name[root] = base
+            else:
+                class_name[root] = root
+    return {name: class_name[root] for name, root in classes.items()}
+
+# order a parallel copy {dest: src} into plain copies, a cycle costs one
+# temporary, types maps names to their bril type
+def t_sequentialize(copies, types, fresh):
+    copies = {dest: src for dest, src in copies.items() if dest != src}
+    instrs = []
+    # srcs still to be read
+    reads = {}
+    for src in copies.values():
+        reads[src] = reads.get(src, 0) + 1
+    ready = [dest for dest in copies if reads.get(dest, 0) == 0]
+    while len(copies) > 0:
+        while len(ready) > 0:
+            dest = ready.pop()
+            src = copies.pop(dest)
+            instrs.append(Instr('id', dest, types[dest], (src,)))
+            reads[src] -= 1
+            if reads[src] == 0 and src in copies:
+                ready.append(src)
+        if len(copies) > 0:
+            # only cycles are left, save one dest and break its cycle
+            dest = next(iter(copies))
+            tmp = fresh(dest)
+            types[tmp] = types[dest]
+            instrs.append(Instr('id', tmp, types[dest], (dest,)))
+            for other, src in copies.items():
+                if src == dest:
+                    copies[other] = tmp
+            reads[tmp] = reads.pop(dest)
+            ready.append(dest)
+    return instrs
+
+# drop the phis whose value never reaches an instr that is not a phi
+# minimal ssa leaves cycles of them for variables undefined on entry,
+# which liveness keeps alive, as copies they would read names that may
+# never have been set
+def t_drop_dead_phis(blocks):
+    phi_of = {}
+    work = []
+    for block in blocks:
+        for instr in block:
+            if instr.op == 'phi':
+                phi_of[instr.dest] = instr
+            elif instr.args is not None:
+                work.extend(instr.args)
+    used = set()
+    while len(work) > 0:
+        name = work.pop()
+        if name in used:
             continue
-        # dest
-        if 'dest' in instr:
-            instr['dest'] = instr['dest'].split('.')[0]
-        # args
-        if 'args' in instr:
-            for arg_idx in range(len(instr['args'])):
-                instr['args'][arg_idx] = instr['args'][arg_idx].split('.')[0]
+        used.add(name)
+        if name in phi_of:
+            work.extend(phi_of[name].args)
+    for block in blocks:
+        block[:] = [instr for instr in block if instr.op != 'phi' or instr.dest in used]
+
+# leave ssa with parallel copies on the edges into each phi block
+# edges from a block with several succs into a block with several preds are
+# split, so the cfg is rebuilt when that happens
+def t_ssa_to_copies(fn, cfg=None):
+    own_cfg = cfg is None
+    if own_cfg:
+        cfg = CFG(fn)
+    blocks, blocks_cfg = cfg.reset()
+    t_drop_dead_phis(blocks)
+
+    candidates = set()
+    for block in blocks:
+        for instr in phis_of(block):
+            candidates.add(instr.dest)
+            candidates.update(instr.args)
+    live_out = t_phi_live_out(blocks, blocks_cfg)
+    params = [arg['name'] for arg in fn.get('args', [])]
+    rep = t_coalesce(blocks, t_interference(blocks, live_out, candidates, params))
+    rename = t_class_names(fn, blocks, rep)
+    if DEBUG:
+        print(f"rename: {rename}")
+
+    # types of the renamed names
+    types = {}
+    for block in blocks:
+        for instr in block:
+            if instr.dest is not None:
+                types[rename[instr.dest]] = instr.type
+    used = set(rename.values())
+    labels = {blocks_cfg[block_id]['label'] for block_id in range(len(blocks))}
+    def fresh(name, used=used):
+        idx = 0
+        while f"{name}.tmp{idx}" in used:
+            idx += 1
+        used.add(f"{name}.tmp{idx}")
+        return f"{name}.tmp{idx}"
 
-    fn['instrs'] = [instr for idx, instr in enumerate(fn['instrs']) if idx not in del_list]
+    # parallel copy of every edge (pred, join)
+    edge_copies = {}
+    for block_id, block in enumerate(blocks):
+        for instr in phis_of(block):
+            for arg, label in zip(instr.args, instr.labels):
+                edge_copies.setdefault((label, block_id), {})[rename[instr.dest]] = rename[arg]
+
+    # rename everything, then drop the phis
+    for arg in fn.get('args', []):
+        arg['name'] = rename[arg['name']]
+    for block in blocks:
+        for instr in block:
+            if instr.dest is not None:
+                instr.dest = rename[instr.dest]
+            if instr.args is not None:
+                instr.args = tuple(rename[arg] for arg in instr.args)
+        block[:] = [instr for instr in block if instr.op != 'phi']
+
+    # place the copies
+    label2block = {blocks_cfg[block_id]['label']: block_id for block_id in range(len(blocks))}
+    split = {}
+    for (pred_label, block_id), copies in edge_copies.items():
+        seq = t_sequentialize(copies, types, fresh)
+        if len(seq) == 0 or pred_label not in label2block:
+            continue
+        pred_id = label2block[pred_label]
+        pred = blocks[pred_id]
+        if len(blocks_cfg[block_id]['pred']) == 1:
+            # the only way in, copy at the top of the join block
+            blocks[block_id][1:1] = seq
+        elif len(blocks_cfg[pred_id]['succ']) == 1:
+            # the only way out, copy before the jump
+            if len(pred) > 0 and pred[-1].op in ('jmp', 'br'):
+                pred[-1:-1] = seq
+            else:
+                pred += seq
+        else:
+            # critical edge, copy in a new block right after the pred
+            # (which ends in a br, so nothing falls into the new block)
+            join_label = blocks_cfg[block_id]['label']
+            edge_label = f"{pred_label}.{join_label}"
+            while edge_label in labels:
+                edge_label += '.'
+            labels.add(edge_label)
+            pred[-1].labels = tuple(edge_label if label == join_label else label
+                                    for label in pred[-1].labels)
+            split.setdefault(pred_id, []).append(
+                [Label(edge_label)] + seq + [Instr('jmp', labels=(join_label,))])
 
+    if len(split) == 0:
+        if own_cfg:
+            cfg.flatten()
+        return cfg
+    # control flow changed, hand back a new cfg
+    instrs = []
+    for block_id, block in enumerate(blocks):
+        instrs += block
+        for edge_block in split.get(block_id, []):
+            instrs += edge_block
+    cfg = CFG(fn, instrs=instrs)
+    if own_cfg:
+        cfg.flatten()
+    return cfg
 
 
 if __name__ == "__main__":
     DEBUG = False
-    prog = json.load(sys.stdin)
+    # python -m tasks.task4.ssa_to [--phi strip|copies]
+    args = sys.argv[1:]
+    phi = 'strip'
+    if '--phi' in args:
+        if args.index('--phi') + 1 >= len(args):
+            exit(f"usage: python -m tasks.task4.ssa_to [--phi {'|'.join(PHI_MODES)}]")
+        phi = args[args.index('--phi') + 1]
 
     # Analyze the program p
-    for fn in prog["functions"]:
+    def optimize(fn):
         if DEBUG:
             print(f"-----Function {fn['name']}-----")
-        t_ssa_to(fn)
+        t_ssa_to(fn, phi=phi)
 
     # Output the program
     if not DEBUG:
-        json.dump(prog, sys.stdout, indent=2)
\ No newline at end of file
+        map_functions(sys.stdin, sys.stdout, optimize)
+    else:
+        for fn in read_functions(sys.stdin):
+            optimize(fn)
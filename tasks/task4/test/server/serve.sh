@@ -0,0 +1,23 @@
+#!/bin/sh
+# run pass_client.py with the passes given as args against a pass_server.py
+# on a fresh socket; the client would run the passes itself if nothing
+# listened, so wait until the server has bound its socket
+export PYTHONPATH="../../../..:$PYTHONPATH"
+export BRIL_PASS_SOCKET="$(mktemp -u)"
+python3 -m tasks.task4.pass_server "$BRIL_PASS_SOCKET" &
+server=$!
+tries=0
+while [ ! -S "$BRIL_PASS_SOCKET" ]; do
+  tries=$((tries + 1))
+  if [ $tries -gt 100 ] || ! kill -0 $server 2>/dev/null; then
+    echo "pass server did not start" >&2
+    exit 1
+  fi
+  sleep 0.1
+done
+python3 -m tasks.task4.pass_client "$@"
+status=$?
+kill $server
+wait $server 2>/dev/null
+rm -f "$BRIL_PASS_SOCKET"
+exit $status
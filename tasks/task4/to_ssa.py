@@ -1,29 +1,13 @@
-import json
 import sys
-import copy
-from block_gen import block_gen
+from tasks.task4.block_gen import CFG
+from tasks.task4.bril_ir import Instr, type_key
+from tasks.task4.bril_stream import map_functions, read_functions
+from tasks.lib.bv_dataflow import Universe, Worklist, solve, gen_kill
+from tasks.lib.dominators import DomTree
 
 COMMUTATIVE_OPS = ['add', 'mul', 'eq']
 BAD_CONST_OPS = ['call', 'ret', 'print', "store", "load", "alloc", "phi"]
 
-def str2bool(arg):
-    if arg.lower() == 'true':
-        return True
-    elif arg.lower() == 'false':
-        return False
-    else:
-        exit(f"Unknown boolean value {arg}")
-
-# print current table
-def print_table(dest2num, val2num, num2dest, num2val):
-    for num in num2val.keys():
-        print(f"{num}: {num2val[num]} | {num2dest[num]}")
-        # test dest2num
-        for dest in num2dest[num]:
-            assert dest2num[dest] == num
-        # test val2num
-        assert val2num[num2val[num]] == num
-
 # pos: if true, ignore empty set
 # loose: if true, include (union) unique keys
 def merge_dicts(dicts, pos=False, loose=False):
@@ -38,7 +22,7 @@ def merge_dicts(dicts, pos=False, loose=False):
             common_items = set(d.items())
             common_keys = set(d.keys())
             break
-    all_keys = copy.deepcopy(common_keys)
+    all_keys = set(common_keys)
     # print(common_items)
     for d in dicts:
         if pos and len(d) == 0:
@@ -56,73 +40,14 @@ def merge_dicts(dicts, pos=False, loose=False):
                 break
     return dict(common_items)
 
-def intersect_sets(sets, pos=False):
-    if len(sets) == 0:
-        return set()
-    # pick a non-empty set
-    intersect_items = set()
-    for s in sets:
-        if len(s) > 0:
-            intersect_items = copy.deepcopy(s)
-            break
-    for s in sets:
-        if pos and len(s) == 0:
-            continue
-        intersect_items.intersection_update(s)
-    return intersect_items
-
-def union_sets(sets):
-    if len(sets) == 0:
-        return set()
-    union_items = set()
-    for s in sets:
-        union_items.update(s)
-    return union_items
-
 # trivial dominator frontier for blocks
-def t_dom_frontier(blocks_cfg):
-    # initialize dom frontier
-    worklist = [0]
-    for block_id in range(len(blocks_cfg)):
-        block = blocks_cfg[block_id]
-        block['out'].append(set())
-        len_pred = len(block['pred'])
-        for _ in range(len_pred):
-            block['in'].append(set())
-    
-    while len(worklist) > 0:
-        block_id = worklist.pop(0)
-        if DEBUG:
-            print(f"-----Block {block_id} ({blocks_cfg[block_id].get('label')})-----")
-            print(f"init_in: {blocks_cfg[block_id]['in']}")
-            print(f"init_out: {blocks_cfg[block_id]['out']}")
-        # compute out
-        out_set = intersect_sets(blocks_cfg[block_id]['in'], pos=False)
-        # all blocks are dominated by itself
-        out_set.add(block_id)
-        if DEBUG:
-            print(f"result_out: {out_set}")
-        # if out changed, update succ
-        if out_set != blocks_cfg[block_id]['out'][0]:
-            blocks_cfg[block_id]['out'][0] = out_set
-            for succ_id in blocks_cfg[block_id]['succ']:
-                blocks_cfg[succ_id]['in'][blocks_cfg[succ_id]['pred'].index(block_id)] = out_set
-                if succ_id not in worklist:
-                    worklist.append(succ_id)
-        if DEBUG:
-            print(f"worklist: {worklist}")
-            print('-------------------------')
-
-    # generate dom frontier
-    dom_frontier = {}
-    for block_id in range(len(blocks_cfg)):
-        block = blocks_cfg[block_id]
-        for in_set in block['in']:
-            for in_elem in in_set:
-                if in_elem not in block['out'][0]:
-                    if in_elem not in dom_frontier:
-                        dom_frontier[in_elem] = []
-                    dom_frontier[in_elem].append(block_id)
+def t_dom_frontier(blocks_cfg, dom_tree=None):
+    if dom_tree is None:
+        dom_tree = DomTree(blocks_cfg)
+    if DEBUG:
+        for block_id in range(len(blocks_cfg)):
+            print(f"idom {block_id} ({blocks_cfg[block_id].get('label')}): {dom_tree.idom[block_id]}")
+    dom_frontier = dom_tree.frontier()
     if DEBUG:
         print(f"dom_frontier: {dom_frontier}")
     return dom_frontier
@@ -133,15 +58,15 @@ def t_var2block(blocks):
     for block_id in range(len(blocks)):
         block = blocks[block_id]
         for instr in block:
-            dest = instr.get('dest')
+            dest = instr.dest
             if dest is not None:
                 if dest not in var2block:
                     var2block[dest] = set()
                 # treat ptr type
-                if isinstance(instr['type'], dict):
-                    instr_type = 'ptr ' + instr['type']['ptr']
+                if isinstance(instr.type, dict):
+                    instr_type = 'ptr ' + instr.type['ptr']
                 else:
-                    instr_type = instr['type']
+                    instr_type = instr.type
                 var2block[dest].add((block_id, instr_type))
     if DEBUG:
         print(f"var2block: {var2block}")
@@ -150,62 +75,95 @@ def t_var2block(blocks):
 # check if a block contains phi func for one var
 def has_phi(block, var):
     for instr_id, instr in enumerate(block):
-        if 'op' in instr and instr['op'] == 'phi':
-            dest_raw = ''.join(instr['dest'].split('.')[:-1])
+        if instr.op == 'phi':
+            dest_raw = ''.join(instr.dest.split('.')[:-1])
             if dest_raw == var:
                 return instr_id
     return None
 
-# trivial conversion to ssa for one function
-def t_to_ssa(fn):
-    # iterate blocks
-    blocks, blocks_cfg = block_gen(fn, dummy=True)
-
-    # compute dominator frontier
-    dom_frontier = t_dom_frontier(copy.deepcopy(blocks_cfg))
-
-    # generate variable -> defined block map
-    var2block = t_var2block(blocks)
-
-    # insert phi functions
-    var2count = {}
-    for var in var2block:
-        var2count[var] = 0
-        # create a worklist
-        worklist = []
-        # initialize the worklist
-        for def_block, type in var2block[var]:
-            worklist.append((def_block, type))
-        while len(worklist) > 0:
-            def_block, type = worklist.pop(0)
-            # assign a new name to each def
-            for instr in blocks[def_block]:
-                if instr.get('dest') == var:
-                    var2count[var] += 1
-                    instr['dest'] = f"{var}.{var2count[var]}"
-            # insert phi functions
-            if dom_frontier.get(def_block) is None: continue
-            for join_block in dom_frontier[def_block]:
-                if DEBUG:
-                    print(f"-----Insert phi for {var} in block {join_block}-----")
-                # check second instr of join block (phi or not)
-                instr_idx = has_phi(blocks[join_block], var)
-                if instr_idx is None:
-                    var2count[var] += 1
-                    instr_type = {'ptr': type.split(' ')[1]} if 'ptr' in type else type
-                    blocks[join_block].insert(1, {'args': [],
-                                                'dest': f"{var}.{var2count[var]}",
-                                                'labels': [],
-                                                'op': 'phi',
-                                                'type': instr_type})
-                    worklist.append((join_block, type))
-    
-                if DEBUG:
-                    print(blocks[join_block])
-    
-    # iterate blocks to rename uses and complete phi functions
+# variables read before they are written in some block, only these can
+# be live across blocks (semi-pruned ssa)
+def t_globals(blocks):
+    global_vars = set()
+    for block in blocks:
+        defined = set()
+        for instr in block:
+            for arg in instr.args or ():
+                if arg not in defined:
+                    global_vars.add(arg)
+            if instr.dest is not None:
+                defined.add(instr.dest)
+    return global_vars
+
+# live-in variables of each block (pruned ssa)
+def t_live_in(blocks, blocks_cfg):
+    variables = Universe()
+    gen = []
+    kill = []
+    for block in blocks:
+        use_bits, def_bits = t_lva_gen_kill(block, variables)
+        gen.append(use_bits)
+        kill.append(def_bits)
+    live_in, _ = solve(blocks_cfg, gen_kill(gen, kill), forward=False)
+    return [variables.to_set(bits) for bits in live_in]
+
+# renaming: 'domtree' walks the dominator tree once with a stack of names
+# per variable, 'worklist' revisits blocks until the incoming names settle
+RENAME_MODES = ['domtree', 'worklist']
+
+# rename uses to the reaching ssa name and fill in phi args
+# defs are already renamed, ssa2var maps each new name to its variable
+def t_rename_domtree(blocks, blocks_cfg, dom_tree, ssa2var):
+    # variable -> stack of reaching names
+    stacks = {}
+    # (block, False) renames the block, (block, True) pops its names
+    walk = [(dom_tree.entry, False)] if len(blocks) > 0 else []
+    pushed = {}
+    while len(walk) > 0:
+        block_id, leave = walk.pop()
+        if leave:
+            for var in pushed.pop(block_id):
+                stacks[var].pop()
+            continue
+        if DEBUG:
+            print(f"-----Block {block_id} ({blocks_cfg[block_id].get('label')})-----")
+        pushed[block_id] = []
+        for instr in blocks[block_id]:
+            # phi args come from the preds
+            if instr.args and instr.op != 'phi':
+                new_args = []
+                for arg in instr.args:
+                    if stacks.get(arg):
+                        arg = stacks[arg][-1]
+                    elif DEBUG:
+                        print(f"Error: {arg} not defined")
+                    new_args.append(arg)
+                instr.args = tuple(new_args)
+            if instr.dest is not None:
+                var = ssa2var[instr.dest]
+                stacks.setdefault(var, []).append(instr.dest)
+                pushed[block_id].append(var)
+        # complete the phis of the succs with the names live out of here
+        label = blocks_cfg[block_id].get('label')
+        for succ_id in blocks_cfg[block_id]['succ']:
+            for instr in blocks[succ_id]:
+                if instr.op != 'phi':
+                    continue
+                var = ssa2var[instr.dest]
+                # not defined along this pred
+                if not stacks.get(var) or label in instr.labels:
+                    continue
+                instr.args += (stacks[var][-1],)
+                instr.labels += (label,)
+        walk.append((block_id, True))
+        for child_id in reversed(dom_tree.children[block_id]):
+            walk.append((child_id, False))
+
+# rename by revisiting blocks from a worklist, merging the incoming
+# name maps of the preds until they stop changing
+def t_rename_worklist(blocks, blocks_cfg):
     phi_remove_mode = False
-    worklist = [0]
+    worklist = Worklist([0])
     blocks_cfg[0]['in'].append({})
     while len(worklist) > 0 and not phi_remove_mode:
         # start phi remove after worklist is empty
@@ -214,10 +172,9 @@ def t_to_ssa(fn):
                 print("########Start phi remove########")
             phi_remove_mode = True
             # add all nodes
-            for block_idx in range(len(blocks_cfg)):
-                worklist.append(block_idx)
+            worklist.extend(range(len(blocks_cfg)))
 
-        block_id = worklist.pop(0)
+        block_id = worklist.pop()
         block = blocks[block_id]
         blocks_cfg[block_id]['touch'] += 1
         start_dic = merge_dicts(blocks_cfg[block_id]['in'], pos=True, loose=True)
@@ -229,13 +186,15 @@ def t_to_ssa(fn):
             print(f"start_dic: {start_dic}")
         for instr_idx, instr in enumerate(block):
             # check args first
-            if 'args' in instr:
-                if instr['op'] == 'phi':
+            if instr.args is not None:
+                if instr.op == 'phi':
                     # get dest var
-                    dest_raw = ''.join(instr['dest'].split('.')[:-1])
+                    dest_raw = ''.join(instr.dest.split('.')[:-1])
+                    phi_args = list(instr.args)
+                    phi_labels = list(instr.labels)
                     if phi_remove_mode:
                         # check if args change
-                        for label_idx, label in enumerate(instr['labels']):
+                        for label_idx, label in enumerate(phi_labels):
                             pred_idx = 0
                             for pred_block_id in blocks_cfg[block_id]['pred']:
                                 if label == blocks_cfg[pred_block_id]['label']:
@@ -243,26 +202,26 @@ def t_to_ssa(fn):
                                 pred_idx += 1
                             new_arg = blocks_cfg[block_id]['in'][pred_idx].get(dest_raw)
                             if new_arg is None:
-                                instr['args'].pop(label_idx)
-                                instr['labels'].pop(label_idx)
-                            elif new_arg != instr['args'][label_idx]:
-                                instr['args'][label_idx] = new_arg
+                                phi_args.pop(label_idx)
+                                phi_labels.pop(label_idx)
+                            elif new_arg != phi_args[label_idx]:
+                                phi_args[label_idx] = new_arg
                                     
                         # check pred to see if we could remove phi
-                        if len(instr['args']) == 2:
+                        if len(phi_args) == 2:
                             # check if one of args is the same as dest
-                            if instr['dest'] in instr['args']:
-                                pick_dest = (instr['args'].index(instr['dest']) + 1) % 2
+                            if instr.dest in phi_args:
+                                pick_dest = (phi_args.index(instr.dest) + 1) % 2
                                 if DEBUG:
-                                    print(f"Remove {instr['dest']} and keep {instr['args'][pick_dest]}")
+                                    print(f"Remove {instr.dest} and keep {phi_args[pick_dest]}")
                                 # replace dest with the other arg
-                                instr['dest'] = instr['args'][pick_dest]
+                                instr.dest = phi_args[pick_dest]
                                 del_list.append(instr_idx)
-                        elif len(instr['args']) == 1:
+                        elif len(phi_args) == 1:
                             if DEBUG:
-                                print(f"Remove {instr['dest']} and keep {instr['args'][0]}")
+                                print(f"Remove {instr.dest} and keep {phi_args[0]}")
                             # replace dest with the only arg
-                            instr['dest'] = instr['args'][0]
+                            instr.dest = phi_args[0]
                             del_list.append(instr_idx)
                     else:
                         # check pred
@@ -272,90 +231,148 @@ def t_to_ssa(fn):
                             if pred_label is None:
                                 print(f"Error: block {pred_block_id} has no label")
                                 exit(1)
-                            if pred_label in instr['labels']:
+                            if pred_label in phi_labels:
                                 continue
                             # get ssa var name
                             ssa_var = blocks_cfg[block_id]['in'][pred_idx].get(dest_raw)
                             # pred is not ready
                             if ssa_var is None:
                                 continue
-                            instr['args'].append(ssa_var)
-                            instr['labels'].append(pred_label)
+                            phi_args.append(ssa_var)
+                            phi_labels.append(pred_label)
+                    instr.args = tuple(phi_args)
+                    instr.labels = tuple(phi_labels)
                 else:
-                    for arg_idx, arg in enumerate(instr['args']):
+                    new_args = []
+                    for arg in instr.args:
                         if phi_remove_mode:
                             arg_raw = ''.join(arg.split('.')[:-1])
                             arg = arg_raw
                         if arg in start_dic:
-                            instr['args'][arg_idx] = start_dic[arg]
                             if DEBUG:
                                 print(f"Replace {arg} with {start_dic[arg]}")
+                            arg = start_dic[arg]
                         else:
                             if DEBUG:
                                 print(f"Error: {arg} not defined")
+                        new_args.append(arg)
+                    instr.args = tuple(new_args)
             # check dest
-            if 'dest' in instr:
-                dest_raw = ''.join(instr['dest'].split('.')[:-1])
-                start_dic[dest_raw] = instr['dest']
+            if instr.dest is not None:
+                dest_raw = ''.join(instr.dest.split('.')[:-1])
+                start_dic[dest_raw] = instr.dest
         
         if DEBUG:
             print(f"out start_dic: {start_dic}")
 
         # insert succ to worklist
-        for succ_id in blocks_cfg[block_id]['succ']:
+        for succ_id, in_idx in zip(blocks_cfg[block_id]['succ'], blocks_cfg[block_id]['succ_slot']):
             if len(blocks_cfg[succ_id]['in']) == 0:
                 # initialize in
                 for _ in range(len(blocks_cfg[succ_id]['pred'])):
                     blocks_cfg[succ_id]['in'].append({})
-            if blocks_cfg[succ_id]['in'][blocks_cfg[succ_id]['pred'].index(block_id)] != start_dic:
-                blocks_cfg[succ_id]['in'][blocks_cfg[succ_id]['pred'].index(block_id)] = start_dic
-                if succ_id not in worklist:
-                    worklist.append(succ_id)
+            if blocks_cfg[succ_id]['in'][in_idx] != start_dic:
+                blocks_cfg[succ_id]['in'][in_idx] = start_dic
+                worklist.push(succ_id)
         
         # remove phi instr
         if phi_remove_mode:
             blocks[block_id] = [instr for idx, instr in enumerate(block) if idx not in del_list]
 
+
+# phi placement: 'minimal' puts a phi at every iterated dominance frontier
+# of a def, 'semi' only for variables live across blocks, 'pruned' only
+# where the variable is live on entry to the join block
+# minimal is the default, the dead phis it places are left to t_lva
+PRUNE_MODES = ['minimal', 'semi', 'pruned']
+
+# trivial conversion to ssa for one function
+# returns the cfg of the ssa function (instrs are only flattened
+# when no cfg is passed in)
+def t_to_ssa(fn, cfg=None, prune='minimal', rename='domtree'):
+    if prune not in PRUNE_MODES:
+        exit(f"Unknown prune mode {prune}")
+    if rename not in RENAME_MODES:
+        exit(f"Unknown rename mode {rename}")
+    own_cfg = cfg is None
+    # the dummy entry block changes control flow, rebuild the cfg
+    cfg = CFG(fn, dummy=True, instrs=None if own_cfg else cfg.instrs())
+    blocks, blocks_cfg = cfg.blocks, cfg.blocks_cfg
+
+    # compute dominator frontier
+    dom_tree = DomTree(blocks_cfg)
+    dom_frontier = t_dom_frontier(blocks_cfg, dom_tree)
+
+    # generate variable -> defined block map
+    var2block = t_var2block(blocks)
+
+    # decide where phis may go (before defs are renamed)
+    if prune == 'semi':
+        global_vars = t_globals(blocks)
+    elif prune == 'pruned':
+        live_in = t_live_in(blocks, blocks_cfg)
+
+    # insert phi functions
+    var2count = {}
+    # ssa name -> original variable
+    ssa2var = {}
+    for var in var2block:
+        var2count[var] = 0
+        # create a worklist of the def blocks
+        worklist = Worklist(var2block[var])
+        while len(worklist) > 0:
+            def_block, type = worklist.pop()
+            # assign a new name to each def
+            for instr in blocks[def_block]:
+                if instr.dest == var:
+                    var2count[var] += 1
+                    instr.dest = f"{var}.{var2count[var]}"
+                    ssa2var[instr.dest] = var
+            # insert phi functions
+            if dom_frontier.get(def_block) is None: continue
+            if prune == 'semi' and var not in global_vars: continue
+            for join_block in dom_frontier[def_block]:
+                # the phi would be dead
+                if prune == 'pruned' and var not in live_in[join_block]:
+                    continue
+                if DEBUG:
+                    print(f"-----Insert phi for {var} in block {join_block}-----")
+                # check second instr of join block (phi or not)
+                instr_idx = has_phi(blocks[join_block], var)
+                if instr_idx is None:
+                    var2count[var] += 1
+                    ssa2var[f"{var}.{var2count[var]}"] = var
+                    instr_type = {'ptr': type.split(' ')[1]} if 'ptr' in type else type
+                    blocks[join_block].insert(1, Instr('phi', f"{var}.{var2count[var]}", instr_type,
+                                                       args=(), labels=()))
+                    worklist.push((join_block, type))
+    
+                if DEBUG:
+                    print(blocks[join_block])
+    
+    # rename uses and complete phi functions
+    if rename == 'domtree':
+        t_rename_domtree(blocks, blocks_cfg, dom_tree, ssa2var)
+    else:
+        t_rename_worklist(blocks, blocks_cfg)
+
     # strip out dummy blocks
     if 'dummy_entry' in blocks_cfg[0]['label']:
         new_map = {}
         for instr in blocks[0]:
-            if 'op' not in instr:
+            if instr.op is None:
                 continue
-            assert instr['op'] == 'id'
-            new_map[instr['args'][0]] = instr['dest']
+            assert instr.op == 'id'
+            new_map[instr.args[0]] = instr.dest
         for arg in fn['args']:
             arg['name'] = new_map[arg['name']]
         # preserve the label, remove dummy instr
-        blocks[0] = [instr for instr in blocks[0] if 'op' not in instr and 'label' in instr]
-    fn["instrs"] = [inst for block in blocks for inst in block]
+        blocks[0] = [instr for instr in blocks[0] if instr.op is None]
+    if own_cfg:
+        cfg.flatten()
+    return cfg
 
 
-# trivial live variable analysis for one block
-def t_lva_single(block, used_set):
-    if DEBUG:
-        print(f"initial used_set: {used_set}")
-    # iterate inst in one local block (reverse order)
-    for inst_idx in reversed(range(len(block))):
-        inst = block[inst_idx]
-        if DEBUG:
-            print(f"[+] inst dut: {inst}")
-        # check dest variable
-        # new definition -> clear used_set
-        dest = inst.get('dest')
-        if dest is not None:
-            used_set.discard(dest)
-            if DEBUG:
-                print(f"[++] discard {dest}")
-        # check args variables
-        # args -> used -> add to used_set
-        if 'args' in inst:
-            for arg in inst['args']:
-                used_set.add(arg)
-                if DEBUG:
-                    print(f"[++] add {arg}")
-    return used_set
-
 # trivial local dead code elimination for one block
 def l_dce_single(block, used_set):
     # delete inst list
@@ -364,9 +381,9 @@ def l_dce_single(block, used_set):
     for inst_idx in reversed(range(len(block))):
         inst = block[inst_idx]
         # ignore labels
-        if 'op' in inst:
+        if inst.op is not None:
             # process dest
-            dest = inst.get('dest')
+            dest = inst.dest
             if dest is not None:
                 if dest not in used_set:
                     del_list.append(inst_idx)
@@ -375,228 +392,274 @@ def l_dce_single(block, used_set):
             # process args
             if inst_idx in del_list:
                 continue
-            if 'args' in inst:
-                for arg in inst["args"]:
+            if inst.args is not None:
+                for arg in inst.args:
                     used_set.add(arg)
 
     block = [inst for idx, inst in enumerate(block) if idx not in del_list]
     return block, used_set
 
+# use (gen) and def (kill) bit-vectors of one block for liveness
+def t_lva_gen_kill(block, variables):
+    use_bits = 0
+    def_bits = 0
+    # iterate inst in one local block (reverse order)
+    for inst in reversed(block):
+        dest = inst.dest
+        if dest is not None:
+            dest_bit = variables.bit(dest)
+            def_bits |= dest_bit
+            use_bits &= ~dest_bit
+        if inst.args is not None:
+            use_bits |= variables.bits(inst.args)
+    return use_bits, def_bits
+
 # trivial live variable analysis
-def t_lva(fn):
+# liveness runs on bit-vectors, dce reruns it until nothing is removed
+def t_lva(fn, cfg=None):
+    own_cfg = cfg is None
+    if own_cfg:
+        cfg = CFG(fn)
     # interate blocks
-    blocks, blocks_cfg = block_gen(fn, dummy=False)
-    # initialize in and out table
-    for block in blocks_cfg:
-        for _ in range(len(block['succ'])):
-            block['out'].append(set())
-        block['in'].append(set())
-    # initialize worklist
-    worklist = []
-    for block_idx in range(len(blocks_cfg)):
-        block = blocks_cfg[block_idx]
-        if len(block['succ']) == 0:
-            worklist.append(block_idx)
-
-    # big while loop containing both lva and dce
-    dce_mode = False
-    while len(worklist) > 0 or not dce_mode:
-        # check worklist length
-        if len(worklist) == 0:
-            # liveness analysis done, start dce
-            dce_mode = True
-            # add all nodes
-            for block_idx in range(len(blocks_cfg)):
-                worklist.append(block_idx)
-
-        block_id = worklist.pop()
-
-        if DEBUG:
-            print(f"-----Block {block_id}-----")
-            print(f"out: {blocks_cfg[block_id]['out']}")
+    blocks, blocks_cfg = cfg.reset()
+    # number variables once
+    variables = Universe()
+    dce_flag = True
+    while dce_flag:
+        gen = []
+        kill = []
+        for block in blocks:
+            use_bits, def_bits = t_lva_gen_kill(block, variables)
+            gen.append(use_bits)
+            kill.append(def_bits)
+        _, live_out = solve(blocks_cfg, gen_kill(gen, kill), forward=False)
+
+        # dce with the live-out set of every block
+        dce_flag = False
+        for block_id in range(len(blocks)):
+            used_set = variables.to_set(live_out[block_id])
+            if DEBUG:
+                print(f"-----Block {block_id}-----")
+                print(f"out: {used_set}")
+            num_inst = len(blocks[block_id])
+            blocks[block_id], used_set = l_dce_single(blocks[block_id], used_set)
+            if len(blocks[block_id]) != num_inst:
+                dce_flag = True
+            if DEBUG:
+                print(f"used_set: {used_set}")
+                print('-------------------------')
 
-        # liveness or dce analysis
-        if not dce_mode:
-            used_set = t_lva_single(blocks[block_id], union_sets(blocks_cfg[block_id]['out']))
-        else:
-            blocks[block_id], used_set = l_dce_single(blocks[block_id], union_sets(blocks_cfg[block_id]['out']))
-        if DEBUG:
-            print(f"used_set: {used_set}")
-        blocks_cfg[block_id]['touch'] += 1
-        # if in changed, update pred
-        if used_set != blocks_cfg[block_id]['in'][0]:
-            for pred_id in blocks_cfg[block_id]['pred']:
-                if pred_id not in worklist:
-                    worklist.append(pred_id)
-                blocks_cfg[pred_id]['out'][blocks_cfg[pred_id]['succ'].index(block_id)] = used_set
-            blocks_cfg[block_id]['in'][0] = used_set
-        else:
-            # if pred has not been touched, add to worklist
-            for pred_id in blocks_cfg[block_id]['pred']:
-                if pred_id not in worklist and blocks_cfg[pred_id]['touch'] == 0:
-                    worklist.append(pred_id)
-        if DEBUG:
-            print(f"worklist: {worklist}")
-            print('-------------------------')
+    if own_cfg:
+        cfg.flatten()
+    return cfg
+
+# fold op over constant args, None if op is not folded
+def lvn_fold(op, args):
+    match op:
+        case 'add':
+            return args[0] + args[1]
+        case 'sub':
+            return args[0] - args[1]
+        case 'mul':
+            return args[0] * args[1]
+        case 'div':
+            # leave the division by zero to run time
+            return args[0] // args[1] if args[1] != 0 else None
+        case 'id':
+            return args[0]
+        case 'and':
+            return args[0] and args[1]
+        case 'or':
+            return args[0] or args[1]
+        case 'not':
+            return not args[0]
+        case 'eq':
+            return args[0] == args[1]
+        case 'le':
+            return args[0] <= args[1]
+        case 'lt':
+            return args[0] < args[1]
+        case 'ge':
+            return args[0] >= args[1]
+        case 'gt':
+            return args[0] > args[1]
+        case 'ne':
+            return args[0] != args[1]
+    return None
 
-    fn["instrs"] = [inst for block in blocks for inst in block]
+# numbers handed out before the table is cleared
+LVN_TABLE_LIMIT = 1024
+# opcode ids every table starts with
+LVN_CONST, LVN_ID = range(2)
+
+# value table of local value numbering, shared by the blocks of a function
+# a value is a tuple of an opcode id and the numbers of its args (constants:
+# the const opcode id, type and value), hash-consed in value2num
+# opcodes are numbered per table, so tables of functions run by different
+# threads (pass_server) share nothing
+# numbers only grow, reset() starts a block by moving base past every
+# number handed out so far, older entries of var2num/value2num are stale
+# and get overwritten instead of rebuilding the dicts per block
+class LVNTable:
+    def __init__(self):
+        # vars defined in the block
+        self.var2num = {}
+        # vars live into the block, only compared by name
+        self.in2num = {}
+        self.value2num = {}
+        # first var holding each number
+        self.num2dest = []
+        # constant of each number, None if it is not a constant
+        self.num2const = []
+        self.base = 0
+        self.opcodes = Universe(['const', 'id'])
+
+    def reset(self):
+        # drop the stale entries once in a while so the dicts stay small
+        if len(self.num2dest) > LVN_TABLE_LIMIT:
+            self.var2num.clear()
+            self.in2num.clear()
+            self.value2num.clear()
+            self.num2dest.clear()
+            self.num2const.clear()
+        self.base = len(self.num2dest)
+
+    # print the values of the current block
+    def dump(self):
+        for value, num in self.value2num.items():
+            if num >= self.base:
+                print(f"{num}: {self.opcodes.items[value[0]]} {value[1:]} | {self.num2dest[num]}")
 
 # trivial local value numbering for one block
-def t_lvn_single(block):
-    # declare table
-    dest2num = {}
-    val2num = {}
-    num2dest = {}
-    num2val = {}
-    global_num = 0
+def t_lvn_single(block, table=None):
+    if table is None:
+        table = LVNTable()
+    table.reset()
+    var2num, in2num, value2num = table.var2num, table.in2num, table.value2num
+    num2dest, num2const = table.num2dest, table.num2const
+    opcodes = table.opcodes
+    opcode_ids = opcodes.index
+    base = table.base
 
     # iterate inst in one local block
-    for inst_idx in range(len(block)):
-        inst = block[inst_idx]
-        dest = inst.get('dest')
-        # flags
-        all_const_flag = True
+    for inst in block:
+        op = inst.op
+        dest = inst.dest
         # ignore labels
-        if 'op' in inst:
-            if DEBUG:
-                print(inst)
-            # ignore float
-            if 'type' in inst and inst['type'] == 'float':
-                continue
-            if inst['op'] in BAD_CONST_OPS:
-                continue
-            if dest is None:
+        if op is None:
+            continue
+        if DEBUG:
+            print(inst)
+        # ignore float
+        if dest is None or inst.type == 'float' or op in BAD_CONST_OPS:
+            continue
+        const = inst.value
+        if const is not None:
+            value = (LVN_CONST, type_key(inst.type), const)
+        elif inst.args is None:
+            continue
+        else:
+            nums = []
+            # every arg is defined in the block / is a constant
+            all_local = True
+            all_const = True
+            for arg in inst.args:
+                num = var2num.get(arg, -1)
+                if num < base:
+                    all_local = all_const = False
+                    num = in2num.get(arg, -1)
+                    if num < base:
+                        num = len(num2dest)
+                        num2dest.append(arg)
+                        num2const.append(None)
+                        in2num[arg] = num
+                elif all_const and num2const[num] is None:
+                    all_const = False
+                nums.append(num)
+            # if all const, then compute it
+            if all_const:
+                const = lvn_fold(op, [num2const[num] for num in nums])
+            if const is not None:
+                inst.op = 'const'
+                inst.args = None
+                inst.value = const
+                value = (LVN_CONST, type_key(inst.type), const)
+            elif op == 'id' and all_local:
+                # copy of the first var holding the number
+                inst.args = (num2dest[nums[0]],)
+                var2num[dest] = nums[0]
                 continue
-            # check if has args
-            if 'args' in inst or 'value' in inst:
-                if 'value' in inst:
-                    args = [str(inst['value'])]
-                    all_const_flag = False
-                else:  # 'args' in inst
-                    args = [str(dest2num[arg]) if dest2num.get(arg) is not None \
-                        else arg for arg in inst['args']]
-                    args = []
-                    for arg in inst['args']:
-                        argnum = dest2num.get(arg)
-                        if argnum is not None:
-                            if 'const' in num2val[argnum]:
-                                args.append(num2val[argnum].split(' ')[1])
-                                continue
-                            else:
-                                args.append(str(argnum))
-                        else:
-                            args.append(arg)
-                        all_const_flag = False
-
-                # construct value
-                # if all const, then compute it
-                if all_const_flag:
-                    match inst['op']:
-                        case 'const':
-                            value = int(args[0]) if inst['type'] == 'int' else str2bool(args[0])
-                        case 'add':
-                            value = int(args[0]) + int(args[1])
-                        case 'sub':
-                            value = int(args[0]) - int(args[1])
-                        case 'mul':
-                            value = int(args[0]) * int(args[1])
-                        case 'div':
-                            value = int(args[0]) // int(args[1])
-                        case 'id':
-                            value = int(args[0]) if inst['type'] == 'int' else str2bool(args[0])
-                        case 'and':
-                            value = str2bool(args[0]) and str2bool(args[1])
-                        case 'or':
-                            value = str2bool(args[0]) or str2bool(args[1])
-                        case 'not':
-                            value = not str2bool(args[0])
-                        case 'eq':
-                            value = int(args[0]) == int(args[1])
-                        case 'le':
-                            value = int(args[0]) <= int(args[1])
-                        case 'lt':
-                            value = int(args[0]) < int(args[1])
-                        case 'ge':
-                            value = int(args[0]) >= int(args[1])
-                        case 'gt':
-                            value = int(args[0]) > int(args[1])
-                        case 'ne':
-                            value = int(args[0]) != int(args[1])
-                        case _:
-                            exit(f"Unknown operator {inst['op']}")
-                    inst['op'] = 'const'
-                    inst.pop('args', None)
-                    inst['value'] = value
-                    value = 'const ' + str(value)
-                else:
-                    if inst['op'] in COMMUTATIVE_OPS:
-                        args.sort()
-                    if inst['op'] == 'id':
-                        value = args[0]
-                    else:
-                        value = inst['op'] + ' ' + ' '.join(args)
-                if DEBUG:
-                    print(f"Compute the value {value}")
-
-                # search for common value
-                if inst['op'] == 'id' and value.isdecimal():
-                    num = int(value)
-                else:
-                    num = val2num.get(value)
-                if DEBUG:
-                    print(f"Matched num: {num}")
-                if num is None:
-                    # add new num
-                    val2num[value] = global_num
-                    dest2num[dest] = global_num
-                    num2dest[global_num] = [dest]
-                    num2val[global_num] = value
-                    global_num += 1
-                else:
-                    if DEBUG:
-                        print(f"Replace {dest} with {num}")
-                    inst['args'] = [num2dest[num][0]]
-                    inst['op'] = 'id'
-                    dest2num[dest] = num
-                    num2dest[num].append(dest)
+            else:
+                if op in COMMUTATIVE_OPS:
+                    nums.sort()
+                opcode = opcode_ids.get(op)
+                if opcode is None:
+                    opcode = opcodes.add(op)
+                value = (opcode, *nums)
+        if DEBUG:
+            print(f"Compute the value {value}")
+
+        # search for common value
+        num = value2num.get(value, -1)
+        if num < base:
+            num = len(num2dest)
+            num2dest.append(dest)
+            num2const.append(const)
+            value2num[value] = var2num[dest] = num
+        else:
             if DEBUG:
-                print_table(dest2num, val2num, num2dest, num2val)
-                print('-------------------------')
+                print(f"Replace {dest} with {num}")
+            inst.args = (num2dest[num],)
+            inst.op = 'id'
+            var2num[dest] = num
+        if DEBUG:
+            table.dump()
+            print('-------------------------')
     return block
 
 # trivial local value numbering
-def t_lvn(fn):
+def t_lvn(fn, cfg=None):
+    own_cfg = cfg is None
+    if own_cfg:
+        cfg = CFG(fn)
     # interate blocks
-    blocks, _ = block_gen(fn, dummy=False)
+    blocks = cfg.blocks
+    table = LVNTable()
     for block_id in range(len(blocks)):
         if DEBUG:
             print(f"-----Block {block_id}-----")
-        blocks[block_id] = t_lvn_single(blocks[block_id])
-    fn["instrs"] = [inst for block in blocks for inst in block]
+        blocks[block_id] = t_lvn_single(blocks[block_id], table)
+    if own_cfg:
+        cfg.flatten()
+    return cfg
 
 
 if __name__ == "__main__":
     DEBUG = False
-    prog = json.load(sys.stdin)
-
-    # Analyze th program p
-    for fn in prog["functions"]:
-        if DEBUG:
-            print(f"-----Function {fn['name']}-----")
-        t_to_ssa(fn)
-
-    # local load value numbering
-    for fn in prog["functions"]:
+    # python -m tasks.task4.to_ssa [--prune minimal|semi|pruned] [--rename domtree|worklist]
+    args = sys.argv[1:]
+    options = {'--prune': 'minimal', '--rename': 'domtree'}
+    for flag in options:
+        if flag in args:
+            if args.index(flag) + 1 >= len(args):
+                exit(f"usage: python -m tasks.task4.to_ssa [--prune {'|'.join(PRUNE_MODES)}] [--rename {'|'.join(RENAME_MODES)}]")
+            options[flag] = args[args.index(flag) + 1]
+
+    # Analyze th program p, one function at a time
+    def optimize(fn):
         if DEBUG:
             print(f"-----Function {fn['name']}-----")
-        t_lvn(fn)
-
-    # liveness and dce
-    for fn in prog["functions"]:
-        if DEBUG:
-            print(f"-----Function {fn['name']}-----")
-        t_lva(fn)
+        # the cfg built by t_to_ssa is reused by the later passes
+        cfg = t_to_ssa(fn, prune=options['--prune'], rename=options['--rename'])
+        # local load value numbering
+        t_lvn(fn, cfg)
+        # liveness and dce
+        t_lva(fn, cfg)
+        cfg.flatten()
 
     # Output the program
     if not DEBUG:
-        json.dump(prog, sys.stdout, indent=2)
\ No newline at end of file
+        map_functions(sys.stdin, sys.stdout, optimize)
+    else:
+        for fn in read_functions(sys.stdin):
+            optimize(fn)